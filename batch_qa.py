@@ -0,0 +1,304 @@
+"""
+Headless batch question answering over the lab04 document index.
+
+Reads questions from JSONL, retrieves context for a whole batch at a time
+(at most one embeddings call and one vector query per batch), builds each
+prompt exactly like lab04 does, and generates answers concurrently through
+the rate-limited gateway. Every result is appended to the output JSONL as soon
+as it is ready, with per-item timing and token usage, so an interrupted run
+picks up where it left off when started again with the same output file:
+
+    $ python batch_qa.py questions.jsonl --output answers.jsonl --concurrency 8
+
+Each input line is an object with an "id" (or "request_id") and a
+"question"; lines without a question use their "title" and "body" instead,
+so the repo's requests.jsonl works as is. Items that failed are retried on
+the next run, and their error lines are dropped from the output then.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from openai import OpenAI
+from tiktoken import encoding_for_model
+
+from conversation import ChatHistory
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, openai_embedder
+from gateway import LLMGateway
+from lab04 import (
+    CANDIDATES,
+    DATA_DIR,
+    EMBEDDING_MODEL,
+    build_answer_request,
+    index_dir,
+    load_lexical_index,
+    open_collection,
+    pack_passages,
+    retrieve_many,
+    sync_vector_db,
+)
+from pdf_text import PageCache
+
+BATCH_SIZE = 64  # questions embedded and retrieved together
+CONCURRENCY = 8  # answers generated at once
+
+
+def read_questions(path, field="question"):
+    """
+    Yields (id, question) for every input line that has a question.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            item_id = record.get("id") or record.get("request_id") or f"line-{line_number}"
+            question = record.get(field)
+            if not question:
+                question = "\n\n".join(
+                    part for part in (record.get("title"), record.get("body")) if part
+                )
+            if question:
+                yield str(item_id), question
+
+
+def load_done(path):
+    """
+    Returns the ids already answered in path.
+
+    The file is rewritten without the error lines of earlier runs, since
+    those items are about to be tried again, and without a half-written last
+    line left by an interrupted run, so every id ends up with one line.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as file:
+        lines = file.read().split("\n")
+    complete = lines.pop() == ""  # an interrupted run leaves a partial last line
+
+    done, kept = set(), []
+    for line in lines:
+        try:
+            result = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(result, dict) or "id" not in result:
+            continue  # not a result line
+        if "error" in result or result["id"] in done:
+            continue
+        done.add(result["id"])
+        kept.append(line)
+
+    if not complete or len(kept) < len(lines):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.writelines(line + "\n" for line in kept)
+        os.replace(tmp_path, path)
+    return done
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def answer(client, model_name, item_id, history, passages, retrieve_seconds, submitted):
+    """
+    Generates the answer to the question in history. Returns the output record.
+    """
+    started = time.perf_counter()
+    messages, prompt_tokens, _ = build_answer_request(history, passages)
+    response = client.chat.completions.create(model=model_name, messages=messages)
+    finished = time.perf_counter()
+
+    usage = getattr(response, "usage", None)
+    return {
+        "id": item_id,
+        "question": history[-1]["content"],
+        "answer": response.choices[0].message.content or "",
+        "sources": sorted({passage["source"] for passage in passages if passage["source"]}),
+        "model": model_name,
+        "timing": {
+            "retrieve_ms": round(retrieve_seconds * 1000, 2),
+            "queue_ms": round((started - submitted) * 1000, 2),
+            "generate_ms": round((finished - started) * 1000, 2),
+        },
+        "usage": {
+            "prompt_tokens_estimate": prompt_tokens,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "total_tokens": getattr(usage, "total_tokens", None),
+        },
+    }
+
+
+def run(
+    questions,
+    output_path,
+    client,
+    index,
+    encoding,
+    model_name="gpt-3.5-turbo",
+    batch_size=BATCH_SIZE,
+    concurrency=CONCURRENCY,
+    log=None,
+):
+    """
+    Answers every (id, question) not already in output_path and appends the
+    results to it. index is (collection, embedding_function, lexical).
+    Returns a summary dict; "skipped" counts input items answered by an
+    earlier run and "duplicates" repeated ids, which are answered once.
+    """
+    log = log or (lambda message: None)
+    collection, embedding_function, lexical = index
+    done = load_done(output_path)
+    summary = {
+        "skipped": 0, "duplicates": 0, "answered": 0, "failed": 0, "completion_tokens": 0
+    }
+    started = time.perf_counter()
+
+    def unanswered():
+        seen = set()
+        for item_id, question in questions:
+            if item_id in done:
+                summary["skipped"] += 1
+            elif item_id in seen:
+                summary["duplicates"] += 1
+            else:
+                seen.add(item_id)
+                yield item_id, question
+
+    def write(file, result):
+        file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        file.flush()
+        if "error" in result:
+            summary["failed"] += 1
+        else:
+            summary["answered"] += 1
+            summary["completion_tokens"] += result["usage"]["completion_tokens"] or 0
+
+    def drain(file, pending, limit):
+        while len(pending) > limit:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item_id, question = pending.pop(future)
+                try:
+                    write(file, future.result())
+                except Exception as e:
+                    write(file, {"id": item_id, "question": question, "error": repr(e)})
+
+    with open(output_path, "a", encoding="utf-8") as file, \
+            ThreadPoolExecutor(concurrency, thread_name_prefix="batch-qa") as executor:
+        pending = {}  # Future -> (id, question)
+        for batch in batches(unanswered(), batch_size):
+            prompts = [question for _, question in batch]
+            batch_started = time.perf_counter()
+            try:
+                chunk_lists = retrieve_many(
+                    collection,
+                    prompts,
+                    n_results=CANDIDATES,
+                    lexical=lexical,
+                    embed=embedding_function,
+                )
+            except Exception as e:
+                for item_id, question in batch:
+                    write(file, {"id": item_id, "question": question, "error": repr(e)})
+                continue
+            # Retrieval is shared by the batch, so each item gets its share
+            retrieve_seconds = (time.perf_counter() - batch_started) / len(batch)
+
+            for (item_id, question), chunks in zip(batch, chunk_lists):
+                history = ChatHistory([{"role": "user", "content": question}], encoding=encoding)
+                future = executor.submit(
+                    answer, client, model_name, item_id, history,
+                    pack_passages(history, chunks), retrieve_seconds, time.perf_counter(),
+                )
+                pending[future] = (item_id, question)
+                # Keep at most one batch waiting beyond what is running
+                drain(file, pending, concurrency + batch_size)
+            log(
+                f"{summary['answered']} answered, {summary['failed']} failed, "
+                f"{len(pending)} in progress"
+            )
+        drain(file, pending, 0)
+
+    summary["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def open_index(client, backend, dtype, sync=False):
+    """
+    Opens lab04's persistent index; with sync, indexes new or changed PDFs
+    in Data/ first.
+    """
+    embedding_function = CachedEmbeddingFunction(
+        openai_embedder(client, EMBEDDING_MODEL),
+        model_name=EMBEDDING_MODEL,
+        cache=EmbeddingCache(),
+    )
+    collection = open_collection(embedding_function, backend, dtype)
+    directory = index_dir(backend)
+    lexical = load_lexical_index(collection, directory)
+    if sync:
+        sync_vector_db(
+            collection,
+            DATA_DIR,
+            encoding=encoding_for_model("gpt-3.5-turbo"),
+            lexical=lexical,
+            page_cache=PageCache(),
+            directory=directory,
+        )
+    return collection, embedding_function, lexical
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch question answering over Data/")
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--field", default="question", help="Input field holding the question")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--backend", default="chroma", choices=("chroma", "mmap"))
+    parser.add_argument("--dtype", default="float16", choices=("float16", "int8"))
+    parser.add_argument("--sync", action="store_true", help="Index new or changed PDFs first")
+    parser.add_argument("--base-url", help="Use this OpenAI-compatible server")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key and not args.base_url:
+        parser.error("Set OPENAI_API_KEY")
+    encoding = encoding_for_model("gpt-3.5-turbo")
+    client = LLMGateway(
+        OpenAI(api_key=api_key or "batch", base_url=args.base_url),
+        max_concurrency=args.concurrency,
+        encoding=encoding,
+    )
+    index = open_index(client, args.backend, args.dtype, args.sync)
+
+    summary = run(
+        read_questions(args.input, args.field),
+        args.output,
+        client,
+        index,
+        encoding,
+        model_name=args.model,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
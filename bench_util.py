@@ -0,0 +1,43 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Kept free of the OpenAI client and the ingestion pipeline, so benchmarks
+that only need timing summaries or a scratch Chroma collection do not
+import them.
+"""
+import sys
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of values (0 < pct <= 100).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def latency_summary(seconds):
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2) if seconds else None,
+        "p95_ms": round(percentile(seconds, 95) * 1000, 2) if seconds else None,
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 2) if seconds else None,
+    }
+
+
+def open_collection(embedding_function, path):
+    # Same pysqlite3 swap as resources.get_chroma_client, where available
+    try:
+        import pysqlite3
+        sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+    except ImportError:
+        pass
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    return client.get_or_create_collection(
+        name="Benchmark", embedding_function=embedding_function
+    )
@@ -0,0 +1,211 @@
+"""
+Recall and latency benchmark of the vector backends lab04 can use.
+
+Generates clustered synthetic unit vectors (so results do not depend on an
+embedding API), loads them into MmapVectorStore (float16 and int8) and
+Chroma, and measures build time, cold open time, disk size, single-query and
+batched latency, source-filtered latency and recall@k against exact float32
+search. Vectors are generated block by block from fixed seeds, so even the
+1M-chunk run never holds the corpus in memory:
+
+    $ python bench_vector_store.py --sizes 10000 100000 1000000 --output vs.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench_util import latency_summary, open_collection
+from vector_store import MmapVectorStore, normalize
+
+BLOCK = 20000  # vectors generated, inserted and scanned at a time
+CHROMA_BATCH = 5000  # stays under Chroma's maximum batch size
+SOURCES = 50  # distinct "source" values, like PDFs in Data/
+
+
+def make_centers(dim, clusters, seed=0):
+    return normalize(np.random.default_rng(seed).normal(size=(clusters, dim)))
+
+
+def make_block(centers, start, size, seed=1):
+    """
+    Rows [start, start + size) of the synthetic corpus; the same every call.
+    """
+    rng = np.random.default_rng([seed, start])
+    labels = rng.integers(len(centers), size=size)
+    noise = rng.normal(scale=0.35, size=(size, centers.shape[1]))
+    return normalize(centers[labels] + noise / np.sqrt(centers.shape[1]) * 4)
+
+
+def iter_blocks(centers, total):
+    for start in range(0, total, BLOCK):
+        yield start, make_block(centers, start, min(BLOCK, total - start))
+
+
+def records(start, size):
+    ids = [f"doc{(start + i) % SOURCES}.pdf_{start + i}" for i in range(size)]
+    metadatas = [{"source": f"doc{(start + i) % SOURCES}.pdf"} for i in range(size)]
+    documents = [f"chunk {start + i}" for i in range(size)]
+    return ids, metadatas, documents
+
+
+def exact_top_k(centers, total, queries, k):
+    """
+    Ground truth ids by exact float32 cosine search over the whole corpus.
+    """
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for start, block in iter_blocks(centers, total):
+        scores = queries @ block.T
+        rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_rows = np.concatenate([best_rows, rows], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, keep, 1)
+        best_rows = np.take_along_axis(best_rows, keep, 1)
+    return [
+        {f"doc{row % SOURCES}.pdf_{row}" for row in rows}
+        for rows in best_rows
+    ]
+
+
+def make_queries(centers, total, count, seed=2):
+    """
+    Queries are perturbed corpus vectors, like questions close to a chunk.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.integers(total, size=count))
+    picked = []
+    for start, block in iter_blocks(centers, total):
+        picked.extend(block[row - start] for row in rows if start <= row < start + len(block))
+    noise = rng.normal(scale=0.02, size=(count, centers.shape[1]))
+    return normalize(np.stack(picked) + noise)
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def measure(collection, reopen, queries, truth, k, batch_size):
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append(time.perf_counter() - started)
+        recalls.append(len(expected & set(results["ids"][0])) / k)
+
+    started = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start: start + batch_size]
+        collection.query(query_embeddings=batch.tolist(), n_results=k)
+    batched = time.perf_counter() - started
+
+    filtered = []
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        collection.query(
+            query_embeddings=[query.tolist()],
+            n_results=k,
+            where={"source": f"doc{i % SOURCES}.pdf"},
+        )
+        filtered.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    reopened = reopen()
+    reopened.query(query_embeddings=[queries[0].tolist()], n_results=k)
+    open_seconds = time.perf_counter() - started
+
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "query": latency_summary(latencies),
+        "batched_queries_per_sec": round(len(queries) / batched, 1) if batched else None,
+        "filtered_query": latency_summary(filtered),
+        "cold_open_and_first_query_s": round(open_seconds, 3),
+    }
+
+
+def bench_mmap(centers, total, workdir, dtype, queries, truth, k, batch_size):
+    path = os.path.join(workdir, f"mmap-{dtype}-{total}")
+    store = MmapVectorStore(path, dtype=dtype)
+    started = time.perf_counter()
+    for start, block in iter_blocks(centers, total):
+        ids, metadatas, documents = records(start, len(block))
+        store.add(documents=documents, metadatas=metadatas, ids=ids, embeddings=block)
+    result = {"build_s": round(time.perf_counter() - started, 2)}
+    result.update(measure(store, lambda: MmapVectorStore(path), queries, truth, k, batch_size))
+    result["disk_bytes"] = directory_size(path)
+    return result
+
+
+def bench_chroma(centers, total, workdir, queries, truth, k, batch_size):
+    path = os.path.join(workdir, f"chroma-{total}")
+    collection = open_collection(None, path)
+    started = time.perf_counter()
+    for start, block in iter_blocks(centers, total):
+        for offset in range(0, len(block), CHROMA_BATCH):
+            part = block[offset: offset + CHROMA_BATCH]
+            ids, metadatas, documents = records(start + offset, len(part))
+            collection.add(
+                ids=ids, embeddings=part.tolist(), metadatas=metadatas, documents=documents
+            )
+    result = {"build_s": round(time.perf_counter() - started, 2)}
+    result.update(
+        measure(collection, lambda: open_collection(None, path), queries, truth, k, batch_size)
+    )
+    result["disk_bytes"] = directory_size(path)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vector backend benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=1536, help="text-embedding-ada-002 is 1536")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--chroma-max", type=int, default=1_000_000,
+        help="Skip Chroma above this many chunks (building 1M takes very long; "
+        "lower this for a quick run)",
+    )
+    parser.add_argument("--skip-chroma", action="store_true")
+    parser.add_argument("--workdir", help="Build the (temporary) stores under this directory")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    centers = make_centers(args.dim, args.clusters)
+    report = {"dim": args.dim, "k": args.k, "queries": args.queries, "sizes": {}}
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for total in args.sizes:
+            queries = make_queries(centers, total, args.queries)
+            truth = exact_top_k(centers, total, queries, args.k)
+
+            results = {}
+            for dtype in ("float16", "int8"):
+                results[f"mmap_{dtype}"] = bench_mmap(
+                    centers, total, workdir, dtype, queries, truth, args.k, args.batch_size
+                )
+            if not args.skip_chroma and total <= args.chroma_max:
+                results["chroma"] = bench_chroma(
+                    centers, total, workdir, queries, truth, args.k, args.batch_size
+                )
+            report["sizes"][str(total)] = results
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Offline benchmark of lab04 ingestion/retrieval and the lab03/lab04 chat loop.
+
+Starts mock_openai's local chat-completions and embeddings server (unless
+--base-url points at another one), then drives the same code paths the pages
+use, headlessly, and prints machine-readable JSON:
+
+    $ python benchmark.py --questions 20 --turns 10 --output bench.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from openai import OpenAI
+
+import ingestion
+from bench_util import latency_summary, open_collection
+from bm25 import BM25Index
+from conversation import ChatHistory, build_request
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, openai_embedder
+from gateway import LLMGateway
+from mock_openai import MockConfig, start_server
+
+QUESTIONS = [
+    "What are the grading policies for IST 736?",
+    "Who is the instructor for IST 652?",
+    "What textbooks are required for IST 691?",
+    "When are office hours for IST 644?",
+    "What is the late submission policy?",
+    "Which course covers deep learning?",
+    "What are the learning objectives of IST 688?",
+    "How is attendance graded in IST 614?",
+]
+
+
+def stream_chat(client, model_name, messages):
+    """
+    Streams one completion. Returns (ttft, total_seconds, chunks, text).
+    """
+    started = time.perf_counter()
+    ttft = None
+    parts = []
+    for chunk in client.chat.completions.create(
+        model=model_name, messages=messages, stream=True
+    ):
+        if not chunk.choices:
+            continue
+        content = chunk.choices[0].delta.content or ""
+        if content and ttft is None:
+            ttft = time.perf_counter() - started
+        parts.append(content)
+    return ttft, time.perf_counter() - started, len(parts), "".join(parts)
+
+
+def bench_ingestion(client, data_dir, workdir, embedding_model):
+    pdf_files = sorted(
+        os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith(".pdf")
+    )
+    embedding_function = CachedEmbeddingFunction(
+        openai_embedder(client, embedding_model),
+        model_name=embedding_model,
+        cache=EmbeddingCache(os.path.join(workdir, "embeddings.sqlite3")),
+    )
+    collection = open_collection(embedding_function, os.path.join(workdir, "chroma"))
+    lexical = BM25Index()
+    stats = ingestion.ingest(collection, pdf_files, lexical_index=lexical)
+    result = stats.as_dict()
+    result["embedding_cache"] = {
+        "hits": embedding_function.hits,
+        "misses": embedding_function.misses,
+    }
+    return collection, embedding_function, lexical, result
+
+
+def bench_retrieval(index, questions):
+    """
+    Times lab04's retrieval (index is a lab04.DocumentIndex) per question.
+    """
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        index.retrieve(question)
+        latencies.append(time.perf_counter() - started)
+    return latency_summary(latencies)
+
+
+def lab04_request(index):
+    """
+    Builds a turn's request the way the lab04 page does: retrieve, pack the
+    passages into the prompt budget, then budget the history around them.
+    """
+    import lab04
+
+    def build(history):
+        chunks, _ = index.retrieve(history[-1]["content"])
+        return lab04.build_answer_request(history, lab04.pack_passages(history, chunks))
+
+    return build
+
+
+def bench_chat(client, model_name, prompts, build):
+    """
+    Runs a multi-turn chat the way lab03/lab04 do and measures each turn.
+    build(history) returns build_request()'s (messages, total_tokens, truncated).
+    """
+    history = ChatHistory()
+    ttfts, totals, build_times = [], [], []
+    chunks = chars = 0
+    prompt_tokens = []
+    for prompt in prompts:
+        history.append({"role": "user", "content": prompt})
+        started = time.perf_counter()
+        messages, total_tokens, _ = build(history)
+        build_times.append(time.perf_counter() - started)
+        prompt_tokens.append(total_tokens)
+
+        ttft, total, n_chunks, text = stream_chat(client, model_name, messages)
+        if ttft is not None:
+            ttfts.append(ttft)
+        totals.append(total)
+        chunks += n_chunks
+        chars += len(text)
+        history.append({"role": "assistant", "content": text})
+
+    stream_seconds = sum(totals)
+    return {
+        "turns": len(prompts),
+        "prepare_request": latency_summary(build_times),  # retrieval + packing
+        "time_to_first_token": latency_summary(ttfts),
+        "turn_latency": latency_summary(totals),
+        "stream_chunks_per_sec": round(chunks / stream_seconds, 2) if stream_seconds else None,
+        "chars_per_sec": round(chars / stream_seconds, 2) if stream_seconds else None,
+        "prompt_tokens_max": max(prompt_tokens) if prompt_tokens else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline lab benchmark")
+    parser.add_argument("--data-dir", default="Data")
+    parser.add_argument("--base-url", help="Use this OpenAI-compatible server instead of the mock")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--embedding-model", default="text-embedding-ada-002")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS))
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--embed-request-ms", type=float, default=50.0)
+    parser.add_argument("--skip-ingestion", action="store_true")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(MockConfig(
+            first_token_ms=args.first_token_ms,
+            tokens_per_sec=args.tokens_per_sec,
+            reply_tokens=args.reply_tokens,
+            embed_request_ms=args.embed_request_ms,
+        ))
+    # Same gateway the labs use, so limits and retries are part of the numbers
+    client = LLMGateway(
+        OpenAI(api_key=os.environ.get("OPENAI_API_KEY", "mock"), base_url=base_url)
+    )
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+
+    report = {"base_url": base_url, "model": args.model, "mock": server is not None}
+    try:
+        import lab03
+
+        report["lab03_chat"] = bench_chat(
+            client, args.model, questions[: args.turns],
+            lambda history: build_request(history, lab03.SYSTEM_PROMPT, lab03.MAX_TOKENS),
+        )
+
+        if not args.skip_ingestion:
+            import lab04
+
+            with tempfile.TemporaryDirectory() as workdir:
+                collection, embedding_function, lexical, report["lab04_ingestion"] = (
+                    bench_ingestion(client, args.data_dir, workdir, args.embedding_model)
+                )
+                index = lab04.DocumentIndex(collection, embedding_function, lexical)
+                report["lab04_retrieval"] = bench_retrieval(
+                    lab04.DocumentIndex(collection, embedding_function, None), questions
+                )
+                report["lab04_retrieval_hybrid"] = bench_retrieval(index, questions)
+                report["lab04_chat"] = bench_chat(
+                    client, args.model, questions[: args.turns], lab04_request(index)
+                )
+    finally:
+        if server:
+            server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
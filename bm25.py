@@ -0,0 +1,187 @@
+"""
+In-process BM25 lexical index and reciprocal-rank fusion.
+
+Built during ingestion next to the Chroma collection, it matches exact terms
+such as course codes ("IST 652") and instructor names that embeddings handle
+poorly, and it answers confidently lexical queries without any embedding
+call. Only term statistics are kept; chunk texts stay in the collection.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+K1 = 1.5
+B = 0.75
+RRF_K = 60
+FAST_PATH_MIN_SHARE = 0.75  # share of the query's reference score needed to skip vector search
+FAST_PATH_MARGIN = 1.4  # ...and how far ahead of the runner-up the top hit must be
+SAVE_FORMAT = 2  # bumped when the saved layout changes; older files are rebuilt
+
+_TOKEN = re.compile(r"[a-z]+|\d+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "the this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Lowercased word and number tokens, minus stopwords. A word directly
+    followed by a number also yields the joined form, so "IST 652",
+    "IST652" and "ist-652" all share the token "ist652".
+    """
+    raw = _TOKEN.findall(text.lower())
+    tokens = [t for t in raw if t not in _STOPWORDS]
+    for word, number in zip(raw, raw[1:]):
+        if word.isalpha() and number.isdigit():
+            tokens.append(word + number)
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 over chunk texts. Thread-safe, so it can be queried while a
+    background ingestion run is still adding to it.
+    """
+
+    def __init__(self, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.docs = {}  # id -> {"source": ..., "length": ..., "terms": {term: tf}}
+        self.postings = {}  # term -> {id: term frequency}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def clear(self):
+        with self._lock:
+            self.docs.clear()
+            self.postings.clear()
+            self.total_length = 0
+
+    def add(self, doc_id, text, source=None):
+        self._add_terms(doc_id, Counter(tokenize(text)), source)
+
+    def _add_terms(self, doc_id, counts, source):
+        length = sum(counts.values())
+        with self._lock:
+            if doc_id in self.docs:
+                self.remove(doc_id)
+            self.docs[doc_id] = {"source": source, "length": length, "terms": dict(counts)}
+            self.total_length += length
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id):
+        with self._lock:
+            doc = self.docs.pop(doc_id, None)
+            if doc is None:
+                return
+            self.total_length -= doc["length"]
+            for term in doc["terms"]:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def remove_source(self, source):
+        with self._lock:
+            for doc_id in [i for i, doc in self.docs.items() if doc["source"] == source]:
+                self.remove(doc_id)
+
+    def get(self, doc_id):
+        """
+        Returns {"source", "length", "terms"} for doc_id, or None.
+        """
+        with self._lock:
+            return self.docs.get(doc_id)
+
+    def _idf(self, term):
+        matches = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - matches + 0.5) / (matches + 0.5))
+
+    def reference_score(self, query):
+        """
+        Score of an average-length chunk containing every query term once:
+        the sum of the terms' idf. Terms the corpus lacks count too, so a hit
+        that misses part of the query scores a smaller share of it.
+        """
+        with self._lock:
+            return sum(self._idf(term) for term in set(tokenize(query)))
+
+    def search(self, query, n_results=10):
+        """
+        Returns up to n_results (doc_id, score) pairs, best first.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self.docs:
+                return []
+            avg_length = self.total_length / len(self.docs) or 1.0
+            scores = Counter()
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = self._idf(term)
+                for doc_id, tf in posting.items():
+                    norm = 1 - self.b + self.b * self.docs[doc_id]["length"] / avg_length
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return scores.most_common(n_results)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with self._lock:
+            saved = {i: [d["source"], d["terms"]] for i, d in self.docs.items()}
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"format": SAVE_FORMAT, "docs": saved}, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved with save(); returns None if there is none, or
+        if it was saved in an older format.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not isinstance(saved, dict) or saved.get("format") != SAVE_FORMAT:
+            return None
+        index = cls()
+        for doc_id, (source, terms) in saved["docs"].items():
+            index._add_terms(doc_id, terms, source)
+        return index
+
+
+def is_confident(results, reference, min_share=FAST_PATH_MIN_SHARE, margin=FAST_PATH_MARGIN):
+    """
+    True if the lexical top hit is strong and clearly ahead of the rest.
+
+    Strong is relative to reference, the query's BM25Index.reference_score,
+    so the bar moves with the query's length and the corpus's statistics
+    rather than being a fixed BM25 score.
+    """
+    if not results or results[0][1] < min_share * reference:
+        return False
+    return len(results) == 1 or results[0][1] >= margin * results[1][1]
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """
+    Fuses ranked lists of ids; returns [(id, fused score)], best first.
+    """
+    fused = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (k + rank + 1)
+    return fused.most_common()
@@ -0,0 +1,42 @@
+"""
+Renders the visible tail of a chat history.
+
+Re-drawing every message on every rerun makes reruns slower as the
+conversation grows, and would pull spilled messages back from the history
+store. Only the last VISIBLE_MESSAGES are drawn; a button loads earlier ones
+a page at a time, and the view collapses back to the tail once the
+conversation moves on.
+"""
+import streamlit as st
+
+VISIBLE_MESSAGES = 20
+LOAD_MORE = 20  # earlier messages revealed per click
+
+
+def _show_more(key, length):
+    shown = st.session_state.get(key, (length, VISIBLE_MESSAGES))[1]
+    st.session_state[key] = (length, shown + LOAD_MORE)
+
+
+def render_history(history, key):
+    """
+    Draws the tail of history; key namespaces the widget and its state.
+    """
+    state_key = f"{key}_shown"
+    length, shown = st.session_state.get(state_key, (None, VISIBLE_MESSAGES))
+    if length != len(history):
+        shown = VISIBLE_MESSAGES  # new messages arrived: back to the tail
+
+    hidden = max(len(history) - shown, 0)
+    if hidden:
+        st.button(
+            f"Show earlier messages ({hidden} hidden)",
+            key=f"{key}_more",
+            on_click=_show_more,
+            args=(state_key, len(history)),
+        )
+    st.session_state[state_key] = (len(history), shown)
+
+    for message in history[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
@@ -0,0 +1,116 @@
+"""
+Token-aware chunking that snaps to sentence and paragraph boundaries.
+
+Text is split into sentence units, every unit of a page is encoded in one
+encode_batch call, and units are packed greedily into chunks of at most
+max_tokens tokens, with the last few units repeated at the start of the next
+chunk as overlap. Each chunk carries its token count so prompt budgets can be
+packed without re-encoding.
+"""
+import re
+from collections import namedtuple
+
+from tiktoken import encoding_for_model
+
+CHUNK_TOKENS = 400
+OVERLAP_TOKENS = 50
+ENCODING_MODEL = "gpt-3.5-turbo"  # gpt-4 shares the same cl100k_base encoding
+
+Chunk = namedtuple("Chunk", ["text", "tokens"])
+
+# Zero-width cut points: after sentence punctuation, or before a blank line
+_BOUNDARY = re.compile(r"(?<=[.!?])(?=\s)|(?=\n[ \t]*\n)")
+_PARAGRAPH_START = re.compile(r"\s*\n[ \t]*\n")
+
+
+def split_units(text):
+    """
+    Splits text into sentence units such that "".join(units) == text.
+
+    Whitespace between sentences stays at the start of the following unit,
+    which is also how the tokenizer attaches it to the next word.
+    """
+    return [unit for unit in _BOUNDARY.split(text) if unit]
+
+
+class Chunker:
+    """
+    Incrementally packs text into token-capped, boundary-respecting chunks.
+
+    Call feed() with successive pieces of one document (e.g. its pages) and
+    flush() at the end; both yield finished Chunks.
+    """
+
+    def __init__(self, encoding=None, max_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+        if not 0 <= overlap_tokens < max_tokens // 2:
+            raise ValueError("overlap_tokens must be less than half of max_tokens")
+        self.encoding = encoding or encoding_for_model(ENCODING_MODEL)
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._units = []  # (text, tokens) of the chunk being built
+        self._tokens = 0
+        self._fresh = 0  # units added since the last emitted chunk
+
+    def feed(self, text):
+        units = split_units(text)
+        if not units:
+            return
+        encoded = self.encoding.encode_batch(units, disallowed_special=())
+        for unit, tokens in zip(units, encoded):
+            if len(tokens) > self.max_tokens:
+                # No boundary to snap to; fall back to hard token windows
+                for start in range(0, len(tokens), self.max_tokens):
+                    window = tokens[start: start + self.max_tokens]
+                    yield from self._add(self.encoding.decode(window), len(window))
+            else:
+                yield from self._add(unit, len(tokens))
+
+    def flush(self):
+        if self._fresh:
+            yield self._emit()
+        self._units, self._tokens, self._fresh = [], 0, 0
+
+    def _add(self, unit, tokens):
+        if self._fresh and (
+            self._tokens + tokens > self.max_tokens
+            or (
+                self._tokens >= 0.75 * self.max_tokens
+                and _PARAGRAPH_START.match(unit)
+            )
+        ):
+            yield self._emit()
+            self._keep_overlap()
+            while self._units and self._tokens + tokens > self.max_tokens:
+                self._tokens -= self._units.pop(0)[1]
+        self._units.append((unit, tokens))
+        self._tokens += tokens
+        self._fresh += 1
+
+    def _emit(self):
+        return Chunk("".join(text for text, _ in self._units), self._tokens)
+
+    def _keep_overlap(self):
+        kept, kept_tokens = [], 0
+        for text, tokens in reversed(self._units):
+            if kept_tokens + tokens > self.overlap_tokens:
+                break
+            kept.insert(0, (text, tokens))
+            kept_tokens += tokens
+        self._units, self._tokens, self._fresh = kept, kept_tokens, 0
+
+
+def chunk_pages(pages, **kwargs):
+    """
+    Yields Chunks for one document given as an iterable of page texts.
+    """
+    chunker = Chunker(**kwargs)
+    for page in pages:
+        yield from chunker.feed(page + "\n")
+    yield from chunker.flush()
+
+
+def chunk_text(text, **kwargs):
+    """
+    Returns the list of Chunks for a single string.
+    """
+    return list(chunk_pages([text], **kwargs))
@@ -0,0 +1,110 @@
+"""
+Rolling summarization of older chat turns.
+
+Once the messages outside the last KEEP_MESSAGES add up to
+COMPACT_AFTER_TOKENS, they are folded into the running summary by a
+background request that is started right after a reply has streamed, so the
+user never waits for it. The summary is stored on the ChatHistory in session
+state, so reruns reuse it, and each request sends the summary plus the recent
+turns instead of as much raw history as fits.
+"""
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+KEEP_MESSAGES = 4  # most recent messages always sent verbatim
+COMPACT_AFTER_TOKENS = 800  # unsummarized older tokens that trigger a refresh
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an "
+    "AI assistant. Merge the new turns into the current summary. Keep facts, "
+    "names, numbers, decisions and open questions; drop pleasantries. Reply "
+    "with the updated summary only, in under 200 words."
+)
+
+
+def transcript(messages):
+    return "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+class Compactor:
+    """
+    Folds older turns of ChatHistory objects into their summaries on a small
+    background thread pool, at most one refresh per history at a time.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_name=SUMMARY_MODEL,
+        keep_messages=KEEP_MESSAGES,
+        compact_after_tokens=COMPACT_AFTER_TOKENS,
+        max_workers=2,
+    ):
+        self.client = client
+        self.model_name = model_name
+        self.keep_messages = keep_messages
+        self.compact_after_tokens = compact_after_tokens
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="compaction")
+        self._lock = threading.Lock()
+        self._pending = weakref.WeakKeyDictionary()  # history -> Future
+        self.last_error = None  # repr of the most recent failed refresh
+
+    def _span(self, history):
+        """
+        (start, end) of the messages the next refresh would fold in.
+        """
+        start = history.summary[1] if history.summary is not None else 0
+        return start, len(history) - self.keep_messages
+
+    def needs_refresh(self, history):
+        start, end = self._span(history)
+        return end > start and history.tokens_between(start, end) >= self.compact_after_tokens
+
+    def refresh(self, history):
+        """
+        Starts a background refresh if history has enough unsummarized older
+        turns and none is running yet. Returns the Future, or None.
+        """
+        with self._lock:
+            pending = self._pending.get(history)
+            if pending is not None and not pending.done():
+                return None
+            if not self.needs_refresh(history):
+                return None
+            start, end = self._span(history)
+            previous = history.summary[0] if history.summary is not None else ""
+            future = self._executor.submit(
+                self._fold, history, previous, list(history[start:end]), end
+            )
+            self._pending[history] = future
+            return future
+
+    def _fold(self, history, previous, messages, end):
+        try:
+            with tracing.span("llm.summarize"):
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {
+                            "role": "user",
+                            "content": f"Current summary:\n{previous or '(none)'}\n\n"
+                            f"New turns:\n{transcript(messages)}",
+                        },
+                    ],
+                    max_tokens=SUMMARY_MAX_TOKENS,
+                )
+            text = (response.choices[0].message.content or "").strip()
+            if text:
+                history.set_summary(text, end)
+                tracing.count("history.compacted")
+            return text
+        except Exception as e:
+            # The next reply simply tries again; requests fall back to raw history
+            tracing.count("history.compaction_failed")
+            self.last_error = repr(e)
+            return None
@@ -0,0 +1,149 @@
+"""
+Token-budgeted packing of retrieved chunks into a prompt context.
+
+Retrieval hands over a generous candidate list; the packer drops chunks that
+mostly repeat a better-ranked one, then fills the token budget in rank order,
+so the number of chunks adapts to their size instead of being a fixed top-k.
+Chunks that are neighbours in the same document are merged into one passage
+with the overlap the chunker repeated between them removed.
+"""
+import re
+
+DUPLICATE_SIMILARITY = 0.8  # shingle Jaccard at which a chunk counts as a repeat
+SHINGLE_WORDS = 3
+MIN_CONTEXT_SHARE = 0.5  # of the free prompt budget always offered to context
+SEPARATOR = "\n\n"
+MIN_OVERLAP_CHARS = 20  # shorter shared text between neighbours is coincidence
+
+_WORD = re.compile(r"\w+")
+
+
+def chunk_position(chunk_id):
+    """
+    Splits an ingestion id "<source>_<index>" into (source, index).
+    """
+    source, _, index = chunk_id.rpartition("_")
+    return (source, int(index)) if index.isdigit() else (chunk_id, None)
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i: i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe(chunks, threshold=DUPLICATE_SIMILARITY):
+    """
+    Drops chunks whose shingles mostly repeat a better-ranked kept chunk.
+    """
+    kept, kept_shingles = [], []
+    for chunk in chunks:
+        current = shingles(chunk["text"])
+        if any(
+            len(current & other) >= threshold * len(current | other)
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(current)
+    return kept
+
+
+def overlap(left, right, limit=2000):
+    """
+    Length of the longest suffix of left that is also a prefix of right, or
+    0 if it is shorter than MIN_OVERLAP_CHARS.
+    """
+    for size in range(min(len(left), len(right), limit), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def context_budget(available, history_tokens, min_share=MIN_CONTEXT_SHARE):
+    """
+    Splits a free prompt budget: context gets whatever the conversation does
+    not need, but never less than min_share of it.
+    """
+    return max(available - history_tokens, int(available * min_share))
+
+
+class ContextPacker:
+    """
+    Packs ranked chunk dicts ({"id", "text", "source"} and optionally
+    "tokens") into passages that fit a token budget.
+    """
+
+    def __init__(self, encoding, threshold=DUPLICATE_SIMILARITY):
+        self.encoding = encoding
+        self.threshold = threshold
+
+    def count(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def pack(self, chunks, budget):
+        """
+        Returns (passages, tokens). Passages are {"ids", "text", "source"}
+        dicts in the rank order of their best chunk; tokens is the size of
+        the joined context.
+        """
+        separator_tokens = self.count(SEPARATOR)
+        selected = {}  # (source, index) or id -> chunk
+        order = []
+        used = 0
+        for chunk in dedupe(chunks, self.threshold):
+            tokens = chunk.get("tokens") or self.count(chunk["text"])
+            cost = tokens + separator_tokens
+            source, index = chunk_position(chunk["id"])
+            if index is not None:
+                # A neighbour already in the context shares its overlap text
+                for neighbour, left, right in (
+                    ((source, index - 1), None, chunk["text"]),
+                    ((source, index + 1), chunk["text"], None),
+                ):
+                    other = selected.get(neighbour)
+                    if other is not None:
+                        left = left or other["text"]
+                        right = right or other["text"]
+                        shared = overlap(left, right)
+                        cost -= self.count(right[:shared]) + separator_tokens
+            if used + cost > budget:
+                continue  # a smaller, lower-ranked chunk may still fit
+            key = (source, index) if index is not None else chunk["id"]
+            selected[key] = chunk
+            order.append(key)
+            used += cost
+
+        passages = self._merge(selected, order)
+        context = SEPARATOR.join(passage["text"] for passage in passages)
+        return passages, self.count(context) if passages else 0
+
+    def _merge(self, selected, order):
+        rank = {key: i for i, key in enumerate(order)}
+        passages = []
+        merged = set()
+        for key in order:
+            if key in merged:
+                continue
+            if not isinstance(key, tuple):
+                chunk = selected[key]
+                passages.append((rank[key], [chunk["id"]], chunk["text"], chunk["source"]))
+                continue
+            source, index = key
+            while (source, index - 1) in selected:
+                index -= 1
+            ids, text, best = [], "", len(order)
+            while (source, index) in selected:
+                chunk = selected[(source, index)]
+                ids.append(chunk["id"])
+                text += chunk["text"][overlap(text, chunk["text"]):]
+                best = min(best, rank[(source, index)])
+                merged.add((source, index))
+                index += 1
+            passages.append((best, ids, text, chunk["source"]))
+        passages.sort(key=lambda passage: passage[0])
+        return [
+            {"ids": ids, "text": text, "source": source}
+            for _, ids, text, source in passages
+        ]
@@ -0,0 +1,219 @@
+"""
+Chat history with per-message token counts cached at append time.
+
+Each message is encoded exactly once, when it is appended, and a running
+prefix sum of token counts lets window() pick the longest recent history that
+fits a token budget with a binary search instead of re-encoding every message
+on every turn. Older messages can be folded into a running summary (see
+compaction.py), which requests then send in their place.
+
+With a HistoryStore (history_store.py) only a recent tail of messages stays
+in session memory, capped at max_resident_bytes; older messages are spilled
+to SQLite with their token counts and loaded back on demand. The prefix sums
+stay in memory, so budgeting a request never touches the store.
+"""
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from tiktoken import encoding_for_model
+
+ENCODING_MODEL = "gpt-3.5-turbo"  # gpt-4 shares the same cl100k_base encoding
+MESSAGE_OVERHEAD = 3  # framing tokens the chat format adds to every message
+REPLY_PRIMING = 3  # tokens that prime the assistant's reply
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+MAX_RESIDENT_BYTES = 256 * 1024  # per session, when a store is attached
+MIN_RESIDENT_MESSAGES = 8  # never spilled, so a new request rarely reads the store
+READ_PAGE = 200  # spilled messages loaded per query while iterating
+
+
+def message_bytes(message):
+    """
+    Approximate memory held by a message dict and its content.
+    """
+    return sys.getsizeof(message) + sys.getsizeof(message["content"])
+
+
+class ChatHistory:
+    """
+    List-like store of chat messages that knows each message's token cost.
+
+    Messages are dicts with "role", "content" and a cached "tokens" count
+    (content plus MESSAGE_OVERHEAD). Iterating and indexing behave like the
+    plain list this replaces, whether or not older messages were spilled to
+    store.
+    """
+
+    _summary = None  # (text, first unfolded message, tokens)
+
+    def __init__(self, messages=(), encoding=None, store=None, max_resident_bytes=MAX_RESIDENT_BYTES):
+        self.encoding = encoding or encoding_for_model(ENCODING_MODEL)
+        self.store = store
+        self.max_resident_bytes = max_resident_bytes
+        self.session_id = uuid.uuid4().hex
+        self.last_used = time.monotonic()
+        self.resident_bytes = 0
+        self._lock = threading.RLock()
+        self._messages = []  # resident tail; _messages[0] is message _offset
+        self._offset = 0
+        self._prefix = [0]  # _prefix[i] = tokens of the first i messages
+        if store is not None:
+            store.register(self)
+        for message in messages:
+            self.append(message)
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text, disallowed_special=())) + MESSAGE_OVERHEAD
+
+    def append(self, message):
+        if "tokens" not in message:
+            message = dict(message, tokens=self.count_tokens(message["content"]))
+        with self._lock:
+            self._messages.append(message)
+            self._prefix.append(self._prefix[-1] + message["tokens"])
+            self.resident_bytes += message_bytes(message)
+            self.last_used = time.monotonic()
+            if self.store is not None and self.resident_bytes > self.max_resident_bytes:
+                self.trim(self.max_resident_bytes // 2)
+        if self.store is not None:
+            self.store.enforce_budget()
+
+    def trim(self, max_bytes=0):
+        """
+        Spills the oldest resident messages to the store until at most
+        max_bytes remain resident, keeping MIN_RESIDENT_MESSAGES. Returns the
+        number of bytes freed.
+        """
+        with self._lock:
+            if self.store is None:
+                return 0
+            count, freed = 0, 0
+            spillable = len(self._messages) - MIN_RESIDENT_MESSAGES
+            while count < spillable and self.resident_bytes - freed > max_bytes:
+                freed += message_bytes(self._messages[count])
+                count += 1
+            if count:
+                self.store.put_many(self.session_id, self._offset, self._messages[:count])
+                del self._messages[:count]
+                self._offset += count
+                self.resident_bytes -= freed
+            return freed
+
+    def _range(self, start, end):
+        with self._lock:
+            if start >= self._offset:
+                return self._messages[start - self._offset: end - self._offset]
+            spilled = self.store.get_range(self.session_id, start, min(end, self._offset))
+            return spilled + self._messages[: max(end - self._offset, 0)]
+
+    def __iter__(self):
+        # Page through spilled messages, so a full pass never loads them all
+        for start in range(0, len(self), READ_PAGE):
+            yield from self._range(start, start + READ_PAGE)
+
+    def __len__(self):
+        return len(self._prefix) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._range(start, max(stop, start))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ChatHistory index out of range")
+        return self._range(index, index + 1)[0]
+
+    @property
+    def total_tokens(self):
+        return self._prefix[-1]
+
+    def tokens_between(self, start, end):
+        return self._prefix[end] - self._prefix[start]
+
+    @property
+    def summary(self):
+        """
+        (text, upto, tokens) once messages before upto were summarized, else None.
+        """
+        return self._summary
+
+    def set_summary(self, text, upto):
+        """
+        Records text as the summary of every message before upto. A summary
+        never moves backwards, so a slow refresh cannot undo a newer one.
+        """
+        current = self._summary
+        if current is not None and current[1] >= upto:
+            return
+        # One assignment, so readers on other threads never see a mix
+        self._summary = (text, upto, self.count_tokens(SUMMARY_PREFIX + text))
+
+    @property
+    def active_tokens(self):
+        """
+        Tokens a request needs to carry the whole conversation: the summary
+        plus every message it does not cover.
+        """
+        if self._summary is None:
+            return self.total_tokens
+        _, upto, tokens = self._summary
+        return tokens + self.tokens_between(upto, len(self))
+
+    def window(self, budget, first=0):
+        """
+        Returns (messages, tokens) for the most recent messages fitting
+        budget, never reaching back before index first.
+
+        The latest message is always included, even if it alone exceeds the
+        budget, so the question being asked is never dropped.
+        """
+        if not len(self):
+            return [], 0
+        end = self._prefix[-1]
+        start = max(bisect_left(self._prefix, end - budget), first)
+        start = min(start, len(self) - 1)
+        return self._range(start, len(self)), end - self._prefix[start]
+
+
+def ensure_history(messages, encoding=None, store=None):
+    """
+    Returns messages as a ChatHistory, converting a plain list if needed.
+    """
+    if isinstance(messages, ChatHistory):
+        return messages
+    return ChatHistory(messages, encoding=encoding, store=store)
+
+
+def request_messages(messages):
+    """
+    Strips cached bookkeeping so messages can be sent to the chat API.
+    """
+    return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+def build_request(history, system_prompt, max_tokens):
+    """
+    Packs system_prompt plus as much recent history as fits max_tokens.
+
+    The system prompt (including any retrieved context) is budgeted first,
+    then the conversation summary if there is one; messages it covers are
+    not sent again. Returns (messages_for_request, total_tokens, truncated).
+    """
+    system_tokens = history.count_tokens(system_prompt)
+    head = [{"role": "system", "content": system_prompt}]
+    first = 0
+    if history.summary is not None:
+        text, first, summary_tokens = history.summary
+        head.append({"role": "system", "content": SUMMARY_PREFIX + text})
+        system_tokens += summary_tokens
+    conversation_buffer, history_tokens = history.window(
+        max_tokens - system_tokens - REPLY_PRIMING, first
+    )
+    messages_for_request = head + request_messages(conversation_buffer)
+    total_tokens = system_tokens + history_tokens + REPLY_PRIMING
+    return messages_for_request, total_tokens, len(conversation_buffer) < len(history) - first
@@ -0,0 +1,205 @@
+"""
+Content-addressed embedding cache backed by SQLite.
+
+Embeddings are keyed by (model name, SHA-256 of the chunk text), so
+re-indexing a mostly unchanged corpus only embeds the chunks that are new.
+Cache misses are sent to the underlying embedder in large batches, and the
+store evicts least recently used vectors once it grows past max_bytes.
+"""
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+import tracing
+
+EMBEDDING_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite3")
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+EMBED_BATCH_SIZE = 512
+
+
+def text_key(model_name, text):
+    """
+    Returns the cache key of text embedded with model_name.
+    """
+    return model_name + ":" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite store of float32 vectors with size-based LRU eviction.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """
+        Returns {key: vector} for the keys that are cached.
+        """
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # stay under SQLite's variable limit
+                batch = keys[start: start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items):
+        """
+        Stores {key: vector} and evicts old entries if the store is too big.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._conn.commit()
+            self._evict()
+
+    def size_bytes(self):
+        with self._lock:
+            return self._size_bytes()
+
+    def _size_bytes(self):
+        (size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector) + LENGTH(key)), 0) FROM embeddings"
+        ).fetchone()
+        return size
+
+    def _evict(self):
+        size = self._size_bytes()
+        if size <= self.max_bytes:
+            return
+        # Trim to 90% so eviction does not run on every insert near the limit
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(vector) + LENGTH(key) FROM embeddings ORDER BY last_used"
+        )
+        doomed = []
+        for key, entry_size in rows:
+            if size <= target:
+                break
+            doomed.append((key,))
+            size -= entry_size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._conn.commit()
+
+
+class CachedEmbeddingFunction:
+    """
+    Chroma-compatible embedding function that consults an EmbeddingCache.
+
+    embed is any callable mapping a list of texts to a list of vectors, such
+    as openai_embedder(...) or the offline hash_embedding.
+    """
+
+    def __init__(self, embed, model_name, cache=None, batch_size=EMBED_BATCH_SIZE):
+        self.embed = embed
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+    # Chroma 1.x asks embedding functions for a name and whether their config
+    # can be persisted. It cannot (embed is an arbitrary callable), so the
+    # caller passes the function again every time it opens the collection.
+    @staticmethod
+    def name():
+        return "cached_embedding"
+
+    def is_legacy(self):
+        return True
+
+    def embed_query(self, input):
+        return self(input)
+
+    def __call__(self, input):
+        keys = [text_key(self.model_name, text) for text in input]
+        vectors = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, input):
+            if key in vectors:
+                self.hits += 1
+            else:
+                missing.setdefault(key, text)
+        self.misses += len(missing)
+        tracing.count("embedding_cache.hit", len(keys) - len(missing))
+        tracing.count("embedding_cache.miss", len(missing))
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start: start + self.batch_size]
+            with tracing.span("embed"):
+                embedded = self.embed([text for _, text in batch])
+            fresh = {key: list(vector) for (key, _), vector in zip(batch, embedded)}
+            self.cache.put_many(fresh)
+            vectors.update(fresh)
+
+        return [vectors[key] for key in keys]
+
+
+def openai_embedder(client, model_name):
+    """
+    Returns an embed callable that batches texts through an OpenAI client.
+    """
+    def embed(texts):
+        response = client.embeddings.create(model=model_name, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    return embed
+
+
+_WORD = re.compile(r"\w+")
+
+
+def hash_embedding(input, dim=256):
+    """
+    Deterministic offline embedder: L2-normalised hashed bag of words.
+
+    Good enough for tests and benchmarks where no embedding API is available.
+    """
+    vectors = []
+    for text in input:
+        vector = [0.0] * dim
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        vectors.append([value / norm for value in vector])
+    return vectors
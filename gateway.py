@@ -0,0 +1,398 @@
+"""
+Shared, rate-limit-aware gateway in front of the OpenAI client.
+
+Every lab sends its chat and embedding calls through one LLMGateway per API
+key. Calls wait for room in a requests/min and a tokens/min token bucket and
+for one of a bounded number of concurrency slots, are retried with
+exponential backoff on 429s, timeouts and server errors, and identical
+requests that are already in flight (from any session) share one upstream
+call instead of paying for a duplicate. Streams are shared too: every caller
+gets its own iterator over the same buffered chunks.
+
+The gateway mirrors the client's surface (gateway.chat.completions.create,
+gateway.embeddings.create), so code written against an OpenAI client works
+unchanged. Queue depth, in-flight calls, waits and latencies are exported
+through tracing.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+import tracing
+
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 200_000
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5  # first retry delay; doubles on every further attempt
+MAX_BACKOFF_SECONDS = 20.0
+REQUEST_TIMEOUT = 60.0
+COMPLETION_ESTIMATE = 500  # tokens budgeted for a reply when max_tokens is unset
+
+RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """
+        Blocks until amount tokens are available and takes them. Requests
+        larger than the bucket wait for a full bucket. Returns the seconds waited.
+        """
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return time.monotonic() - started
+                self._cond.wait((amount - self._tokens) / self.rate)
+
+    def adjust(self, amount):
+        """
+        Returns (positive) or charges (negative) tokens once the real cost of
+        a call is known. The balance may go negative, which delays later calls.
+        """
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+            self._cond.notify_all()
+
+
+class SharedStream:
+    """
+    One upstream stream read by any number of callers.
+
+    Chunks are buffered as they arrive. One caller at a time pulls the next
+    chunk, outside the lock, while the others wait on a condition, so readers
+    that are ahead never block behind a slow network read for chunks they
+    already have. Callers that join late replay from the start.
+
+    The upstream stream is closed once it is exhausted or every caller has
+    closed its view; on_finish is then called exactly once. lock guards the
+    finished flag: forget (if given) runs while it is held, and view()
+    returns None once the stream is finished, so a caller that looked the
+    stream up under the same lock never gets a silently truncated copy.
+    """
+
+    def __init__(self, stream, on_finish, lock=None, forget=None):
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._on_finish = on_finish
+        self._forget = forget
+        self._state_lock = lock or threading.Lock()
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._fetching = False
+        self._done = False
+        self._error = None
+        self._views = 0
+        self._finished = False
+
+    def view(self):
+        """
+        A new iterator from the first chunk, or None if already finished.
+        """
+        with self._state_lock:
+            if self._finished:
+                return None
+            self._views += 1
+        return _StreamView(self)
+
+    def _get(self, index):
+        while True:
+            with self._cond:
+                while self._fetching and index >= len(self._chunks):
+                    self._cond.wait()
+                if index < len(self._chunks):
+                    return self._chunks[index]
+                if self._done:
+                    break
+                self._fetching = True
+            self._fetch()
+        if self._error is not None:
+            raise self._error
+        raise StopIteration
+
+    def _fetch(self):
+        chunk, done, error = None, False, None
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            done = True
+        except Exception as e:
+            done, error = True, e
+        finally:
+            with self._cond:
+                if done:
+                    self._done, self._error = True, error
+                elif chunk is not None:
+                    self._chunks.append(chunk)
+                self._fetching = False
+                self._cond.notify_all()
+        if done:
+            # Frees the concurrency slot even if some view is never closed
+            self._finish()
+
+    def _release(self):
+        with self._state_lock:
+            self._views -= 1
+            abandoned = self._views == 0
+        if abandoned:
+            self._finish()
+
+    def _finish(self):
+        with self._state_lock:
+            if self._finished:
+                return
+            self._finished = True
+            if self._forget is not None:
+                self._forget()
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+        self._on_finish()
+
+
+class _StreamView:
+    def __init__(self, shared):
+        self._shared = shared
+        self._index = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        chunk = self._shared._get(self._index)
+        self._index += 1
+        return chunk
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._shared._release()
+
+
+class _Endpoint:
+    def __init__(self, gateway, kind):
+        self._gateway = gateway
+        self._kind = kind
+
+    def create(self, **kwargs):
+        return self._gateway.call(self._kind, kwargs)
+
+
+def request_key(kind, kwargs):
+    """
+    Stable fingerprint of a request, used to coalesce identical calls.
+    """
+    payload = json.dumps([kind, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """
+    Rate-limited, retrying, coalescing front for an OpenAI client.
+
+    encoding (a tiktoken encoding) is used to estimate the tokens a call
+    will use; without it a characters/4 estimate is used.
+    """
+
+    def __init__(
+        self,
+        client,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        max_concurrency=MAX_CONCURRENCY,
+        max_retries=MAX_RETRIES,
+        backoff_seconds=BACKOFF_SECONDS,
+        timeout=REQUEST_TIMEOUT,
+        encoding=None,
+        coalesce=True,
+    ):
+        # Retries and timeouts are handled here, not by the client as well
+        self.client = client.with_options(max_retries=0, timeout=timeout)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.encoding = encoding
+        self.coalesce = coalesce
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._inflight = {}  # request key -> Future of the response or SharedStream
+        self._waiting = 0
+        self._running = 0
+
+        self.chat = SimpleNamespace(completions=_Endpoint(self, "chat"))
+        self.embeddings = _Endpoint(self, "embeddings")
+
+    @property
+    def queue_depth(self):
+        return self._waiting
+
+    def _count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def estimate_tokens(self, kind, kwargs):
+        if kind == "embeddings":
+            texts = kwargs.get("input")
+            texts = [texts] if isinstance(texts, str) else texts or []
+            return sum(self._count(text) for text in texts)
+        prompt = sum(
+            self._count(message.get("content") or "") + 3
+            for message in kwargs.get("messages", [])
+        )
+        return prompt + (kwargs.get("max_tokens") or COMPLETION_ESTIMATE)
+
+    def _gauges(self):
+        tracing.gauge("llm.queue_depth", self._waiting)
+        tracing.gauge("llm.in_flight", self._running)
+
+    def call(self, kind, kwargs):
+        """
+        Runs one chat or embeddings request. Streaming chat requests return
+        an iterator of chunks with close(); others return the response.
+        """
+        key = request_key(kind, kwargs) if self.coalesce else None
+        with self._lock:
+            shared = self._inflight.get(key) if key else None
+            if shared is None:
+                leader = Future()
+                if key:
+                    self._inflight[key] = leader
+        if shared is not None:
+            result = shared.result()
+            if isinstance(result, SharedStream):
+                result = result.view()
+                if result is None:
+                    # Finished between the lookup and now; make a fresh call
+                    return self.call(kind, kwargs)
+            tracing.count("llm.coalesced")
+            return result
+
+        streaming = bool(kwargs.get("stream"))
+        try:
+            result = self._run(kind, kwargs, streaming, key)
+        except BaseException as e:
+            self._forget(key)
+            leader.set_exception(e)
+            raise
+        if streaming:
+            # Take the leader's view before followers can see the stream: one
+            # that drains or closes its own view first would otherwise finish
+            # it, and view() would return None here
+            view = result.view()
+            leader.set_result(result)
+            return view
+        leader.set_result(result)
+        self._forget(key)
+        return result
+
+    def _forget(self, key):
+        if key:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _run(self, kind, kwargs, streaming, key):
+        estimate = self.estimate_tokens(kind, kwargs)
+        with self._lock:
+            self._waiting += 1
+        self._gauges()
+        waited = self.requests.acquire(1) + self.tokens.acquire(estimate)
+        started = time.monotonic()
+        self._slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+        self._gauges()
+        tracing.record("llm.queue_wait", waited + time.monotonic() - started)
+
+        def release():
+            with self._lock:
+                self._running -= 1
+            self._slots.release()
+            self._gauges()
+
+        try:
+            response = self._with_retries(kind, kwargs)
+        except BaseException:
+            release()
+            raise
+
+        if streaming:
+            started = time.monotonic()
+
+            def on_finish():
+                tracing.record(f"llm.{kind}.stream_total", time.monotonic() - started)
+                release()
+
+            # The in-flight entry goes away under the same lock that marks
+            # the stream finished (see SharedStream)
+            return SharedStream(
+                response, on_finish, lock=self._lock,
+                forget=lambda: self._inflight.pop(key, None) if key else None,
+            )
+
+        release()
+        usage = getattr(response, "usage", None)
+        used = getattr(usage, "total_tokens", None)
+        if used is not None:
+            self.tokens.adjust(estimate - used)
+        return response
+
+    def _with_retries(self, kind, kwargs):
+        create = (
+            self.client.chat.completions.create
+            if kind == "chat"
+            else self.client.embeddings.create
+        )
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                response = create(**kwargs)
+                tracing.record(f"llm.{kind}", time.monotonic() - started)
+                return response
+            except RETRYABLE as e:
+                if attempt == self.max_retries:
+                    raise
+                if isinstance(e, RateLimitError):
+                    tracing.count("llm.rate_limited")
+                tracing.count("llm.retry")
+                time.sleep(self._backoff(attempt, e))
+
+    def _backoff(self, attempt, error):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+        except (TypeError, ValueError):
+            delay = min(self.backoff_seconds * 2 ** attempt, MAX_BACKOFF_SECONDS)
+            return delay * random.uniform(0.5, 1.0)  # jitter spreads retrying sessions
@@ -0,0 +1,131 @@
+"""
+SQLite spill store for chat histories.
+
+A ChatHistory created with a store keeps only its most recent messages in
+session memory; older ones are moved here together with their cached token
+counts and read back only when a request window, a summary refresh or the
+"show earlier messages" button reaches for them. The store also enforces a
+process-wide cap on resident history: once all registered sessions together
+hold more than max_process_bytes, the least recently used ones are spilled
+down to their last few messages.
+
+Spilled rows only live as long as the session: they are deleted when the
+history is garbage collected or the process exits. Every row records the pid
+of the process that spilled it, so a store only ever clears its own rows;
+those left by an earlier process with the same pid (one that crashed) are
+cleared when the store is opened, since Streamlit sessions never survive a
+restart. Other processes sharing the file keep theirs.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import weakref
+
+import tracing
+
+HISTORY_PATH = os.path.join(".cache", "history.sqlite3")
+MAX_PROCESS_BYTES = 64 * 1024 * 1024  # resident history across all sessions
+
+
+class HistoryStore:
+    """
+    Messages of spilled sessions, keyed by (session id, message index).
+    """
+
+    def __init__(self, path=HISTORY_PATH, max_process_bytes=MAX_PROCESS_BYTES):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_process_bytes = max_process_bytes
+        self._lock = threading.Lock()
+        self._budget_lock = threading.Lock()
+        self._histories = weakref.WeakSet()
+        self.owner = os.getpid()
+        # Other processes may be writing to the same file
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(messages)")]
+        if columns and "owner" not in columns:
+            # Written by a version that cleared the whole table on open
+            self._conn.execute("DROP TABLE messages")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session TEXT NOT NULL,"
+            " idx INTEGER NOT NULL,"
+            " owner INTEGER NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " PRIMARY KEY (session, idx))"
+        )
+        self.clear()
+        atexit.register(self.clear)
+
+    def clear(self):
+        """
+        Deletes every row spilled by this process.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE owner = ?", (self.owner,))
+            self._conn.commit()
+
+    def register(self, history):
+        """
+        Tracks history for the process-wide cap and drops its rows once it
+        is garbage collected.
+        """
+        self._histories.add(history)
+        weakref.finalize(history, self.drop, history.session_id)
+
+    def put_many(self, session, start, messages):
+        """
+        Stores messages as indexes start, start + 1, ... of session.
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (session, idx, owner, role, content, tokens)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (session, start + i, self.owner, m["role"], m["content"], m["tokens"])
+                    for i, m in enumerate(messages)
+                ],
+            )
+            self._conn.commit()
+        tracing.count("history.spilled", len(messages))
+
+    def get_range(self, session, start, end):
+        """
+        Returns the stored messages of session with start <= index < end.
+        """
+        if end <= start:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, tokens FROM messages"
+                " WHERE session = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                (session, start, end),
+            ).fetchall()
+        tracing.count("history.loaded", len(rows))
+        return [{"role": role, "content": content, "tokens": tokens} for role, content, tokens in rows]
+
+    def drop(self, session):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session = ?", (session,))
+            self._conn.commit()
+
+    def enforce_budget(self):
+        """
+        Spills the least recently used histories until the resident total is
+        back under 90% of max_process_bytes.
+        """
+        with self._budget_lock:
+            histories = list(self._histories)
+            total = sum(history.resident_bytes for history in histories)
+            if total > self.max_process_bytes:
+                # Trim to 90% so this does not run on every append near the cap
+                target = int(self.max_process_bytes * 0.9)
+                for history in sorted(histories, key=lambda h: h.last_used):
+                    if total <= target:
+                        break
+                    total -= history.trim()
+            tracing.gauge("history.resident_bytes", total)
+            tracing.gauge("history.sessions", len(histories))
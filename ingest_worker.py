@@ -0,0 +1,123 @@
+"""
+Background ingestion worker shared by the whole process.
+
+Index syncs run on one daemon thread fed by a job queue, so page renders
+never block on extraction or embedding, concurrent sessions cannot start
+duplicate runs, and queries are answered from whatever is indexed so far.
+The worker also polls the data folder and queues a sync when PDFs are added,
+changed or removed, so new files are picked up without a restart.
+"""
+import os
+import queue
+import threading
+import time
+import traceback
+
+RESCAN_INTERVAL = 30  # seconds between Data/ folder checks
+
+
+def folder_fingerprint(folder_path, suffix=".pdf"):
+    """
+    Cheap change detector: (name, size, mtime) of every matching file.
+    """
+    try:
+        entries = sorted(os.scandir(folder_path), key=lambda e: e.name)
+    except FileNotFoundError:
+        return None
+    return tuple(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in entries
+        if entry.name.endswith(suffix)
+    )
+
+
+class IngestWorker:
+    """
+    Runs sync(progress) jobs one at a time on a background thread.
+
+    sync is called with a progress callback taking keyword updates (for
+    example files_total=..., current_file=...) and returns a result object
+    that is kept as last_result.
+    """
+
+    def __init__(self, sync, folder_path, rescan_interval=RESCAN_INTERVAL):
+        self.sync = sync
+        self.folder_path = folder_path
+        self.rescan_interval = rescan_interval
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = False
+        self._thread = None
+        self._fingerprint = None
+        self._status = {
+            "state": "idle",
+            "reason": None,
+            "started": None,
+            "finished": None,
+            "error": None,
+        }
+        self.last_result = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ingest-worker", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def request_sync(self, reason="manual"):
+        """
+        Queues a sync unless one is already waiting. Returns True if queued.
+        """
+        with self._lock:
+            if self._queued:
+                return False
+            self._queued = True
+        self._jobs.put(reason)
+        return True
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._queued or self._status["state"] == "indexing"
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def _progress(self, **updates):
+        with self._lock:
+            self._status.update(updates)
+
+    def _run(self):
+        while True:
+            try:
+                reason = self._jobs.get(timeout=self.rescan_interval)
+            except queue.Empty:
+                if folder_fingerprint(self.folder_path) != self._fingerprint:
+                    self.request_sync("folder changed")
+                continue
+
+            with self._lock:
+                self._queued = False
+                # Fresh status per run, so progress from the last run is not shown
+                self._status = {
+                    "state": "indexing",
+                    "reason": reason,
+                    "started": time.time(),
+                    "finished": None,
+                    "error": None,
+                }
+            # Recorded whether or not the sync succeeds: a failure that does
+            # not depend on the files (a bad API key, a corrupt PDF) would
+            # otherwise be retried on every folder check. The next attempt
+            # waits for a real change or a manual rescan.
+            self._fingerprint = folder_fingerprint(self.folder_path)
+            try:
+                self.last_result = self.sync(self._progress)
+                self._progress(state="idle", finished=time.time())
+            except Exception as e:
+                traceback.print_exc()
+                self._progress(state="error", finished=time.time(), error=str(e))
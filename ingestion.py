@@ -0,0 +1,307 @@
+"""
+Streaming PDF ingestion pipeline for the Data/ corpus.
+
+Pages are extracted in a process pool, chunked as they arrive and handed to
+the collection in fixed-size batches on a writer thread, so extraction,
+embedding and insertion overlap and memory stays bounded by the number of
+in-flight pages and batches rather than by the size of any single PDF.
+"""
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import PyPDF2
+
+import tracing
+from chunker import CHUNK_TOKENS, OVERLAP_TOKENS, Chunker
+from pdf_text import file_hash
+
+PAGES_PER_TASK = 8  # pages extracted by one worker task
+EMBED_BATCH_SIZE = 64  # chunks per collection.add call
+
+
+def count_pages(pdf_file):
+    """
+    Returns the number of pages in a PDF without extracting any text.
+    """
+    with open(pdf_file, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_page_range(pdf_file, start, end):
+    """
+    Extracts the text of pages [start, end) of a PDF. Runs in a worker process.
+    """
+    with open(pdf_file, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pages(
+    pdf_files,
+    max_workers=None,
+    pages_per_task=PAGES_PER_TASK,
+    page_cache=None,
+    digests=None,
+    on_error=None,
+):
+    """
+    Yields (pdf_file, page_num, text) for every page of every PDF, in order.
+
+    Page counts and page ranges are read in parallel across files, but at
+    most 2 * max_workers ranges are in flight at any time. With a
+    pdf_text.PageCache, files whose pages are all cached are not extracted at
+    all, and freshly extracted pages are added to the cache; digests maps
+    files to their pdf_text.file_hash when the caller already has it.
+
+    A file that cannot be read is skipped, with on_error(pdf_file, exception)
+    called for it; pages it yielded before failing are not taken back.
+    """
+    max_workers = max_workers or min(4, os.cpu_count() or 1)
+    digests = digests or {}
+    on_error = on_error or (lambda pdf_file, error: None)
+
+    # Worker processes are only started once something is actually submitted.
+    # They are spawned rather than forked, so they never inherit the locks and
+    # threads (gateway, ingest worker, Streamlit) of the parent.
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+        upcoming = iter(pdf_files)
+        files = deque()  # (pdf_file, digest, Future of the page count, None if cached)
+        pending = deque()
+        failed = set()
+
+        def look_ahead():
+            while len(files) < max_workers:
+                pdf_file = next(upcoming, None)
+                if pdf_file is None:
+                    return
+                try:
+                    digest = None
+                    if page_cache is not None:
+                        digest = digests.get(pdf_file) or file_hash(pdf_file)
+                except OSError as e:
+                    _fail(pdf_file, e, failed, on_error)
+                    continue
+                if digest is not None and page_cache.is_complete(digest):
+                    files.append((pdf_file, digest, None))
+                else:
+                    files.append((pdf_file, digest, executor.submit(count_pages, pdf_file)))
+
+        look_ahead()
+        while files:
+            pdf_file, digest, page_count = files.popleft()
+            look_ahead()
+            if page_count is None:
+                # Keep document order: finish the files still in flight first
+                while pending:
+                    yield from _drain_one(pending, page_cache, failed, on_error)
+                tracing.count("page_cache.hit")
+                cached = page_cache.get_pages(digest)
+                for page_num in range(len(cached)):
+                    yield pdf_file, page_num, cached[page_num]
+                continue
+
+            try:
+                num_pages = page_count.result()
+            except Exception as e:
+                _fail(pdf_file, e, failed, on_error)
+                continue
+            if digest is not None:
+                tracing.count("page_cache.miss")
+                page_cache.set_page_count(digest, num_pages)
+            for start in range(0, num_pages, pages_per_task):
+                task = (pdf_file, start, min(start + pages_per_task, num_pages))
+                pending.append((task, digest, executor.submit(extract_page_range, *task)))
+                if len(pending) >= 2 * max_workers:
+                    yield from _drain_one(pending, page_cache, failed, on_error)
+        while pending:
+            yield from _drain_one(pending, page_cache, failed, on_error)
+
+
+def _fail(pdf_file, error, failed, on_error):
+    tracing.count("ingest.file_failed")
+    failed.add(pdf_file)
+    on_error(pdf_file, error)
+
+
+def _drain_one(pending, page_cache, failed, on_error):
+    (pdf_file, start, _), digest, future = pending.popleft()
+    if pdf_file in failed:
+        future.cancel()
+        return
+    try:
+        with tracing.span("pdf.extract"):
+            texts = future.result()
+    except Exception as e:
+        _fail(pdf_file, e, failed, on_error)
+        return
+    if digest is not None:
+        page_cache.put_pages(digest, enumerate(texts, start))
+    for offset, text in enumerate(texts):
+        yield pdf_file, start + offset, text
+
+
+def iter_chunks(pages, encoding=None, max_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    Turns a page stream into (pdf_file, chunk_index, Chunk) tuples.
+
+    Each document is packed into token-capped chunks by its own Chunker, so
+    only the chunk under construction is ever held in memory.
+    """
+    current_file = None
+    chunker = None
+    index = 0
+    for pdf_file, _, text in pages:
+        if pdf_file != current_file:
+            if chunker:
+                for chunk in chunker.flush():
+                    yield current_file, index, chunk
+                    index += 1
+            current_file, index = pdf_file, 0
+            chunker = Chunker(encoding, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+        with tracing.span("chunk"):
+            chunks = list(chunker.feed(text + "\n"))
+        for chunk in chunks:
+            yield current_file, index, chunk
+            index += 1
+    if chunker:
+        for chunk in chunker.flush():
+            yield current_file, index, chunk
+            index += 1
+
+
+def batched(iterable, size):
+    """
+    Yields lists of up to size items from iterable.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestStats:
+    """
+    Throughput counters for one ingestion run.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.current_file = None
+        self.failed = {}  # pdf_file -> error message of files that were skipped
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def pages_per_sec(self):
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_sec(self):
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "files": self.files,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "seconds": round(self.elapsed, 3),
+            "pages_per_sec": round(self.pages_per_sec, 2),
+            "chunks_per_sec": round(self.chunks_per_sec, 2),
+            "failed": dict(self.failed),
+        }
+
+
+def ingest(
+    collection,
+    pdf_files,
+    batch_size=EMBED_BATCH_SIZE,
+    max_workers=None,
+    encoding=None,
+    lexical_index=None,
+    on_progress=None,
+    page_cache=None,
+    digests=None,
+):
+    """
+    Extracts, chunks and adds pdf_files to collection. Returns IngestStats.
+
+    Batches are added to the collection (which embeds them) on a writer
+    thread while the next pages are still being extracted. If lexical_index
+    (a bm25.BM25Index) is given, every chunk is added to it as well.
+    on_progress(stats) is called from the writer thread after every batch.
+    page_cache (a pdf_text.PageCache) skips extraction of already seen PDFs,
+    and digests ({pdf_file: file_hash}) saves hashing them again. Files that
+    cannot be read are skipped and listed in stats.failed; chunks they added
+    before failing are left for the caller to remove.
+    """
+    stats = IngestStats()
+    stats.files = len(pdf_files)
+    batches = queue.Queue(maxsize=2)
+    errors = []
+
+    def writer():
+        while (batch := batches.get()) is not None:
+            if errors:
+                continue  # keep draining so the producer never blocks
+            try:
+                with tracing.span("chroma.add"):
+                    collection.add(
+                        documents=[chunk.text for _, _, chunk in batch],
+                        metadatas=[
+                            {"source": pdf_file, "tokens": chunk.tokens}
+                            for pdf_file, _, chunk in batch
+                        ],
+                        ids=[f"{pdf_file}_{i}" for pdf_file, i, _ in batch],
+                    )
+                if lexical_index is not None:
+                    for pdf_file, i, chunk in batch:
+                        lexical_index.add(f"{pdf_file}_{i}", chunk.text, pdf_file)
+                stats.chunks += len(batch)
+                stats.current_file = batch[-1][0]
+                if on_progress:
+                    on_progress(stats)
+            except Exception as e:
+                errors.append(e)
+
+    def counted(pages):
+        for page in pages:
+            stats.pages += 1
+            yield page
+
+    # Run the writer in a copy of this context so its spans join the trace
+    thread = threading.Thread(
+        target=contextvars.copy_context().run, args=(writer,), daemon=True
+    )
+    thread.start()
+    try:
+        pages = counted(iter_pages(
+            pdf_files,
+            max_workers=max_workers,
+            page_cache=page_cache,
+            digests=digests,
+            on_error=lambda pdf_file, e: stats.failed.setdefault(pdf_file, str(e)),
+        ))
+        for batch in batched(iter_chunks(pages, encoding), batch_size):
+            if errors:
+                break
+            batches.put(batch)
+    finally:
+        batches.put(None)
+        thread.join()
+        stats.elapsed = time.perf_counter() - stats.started
+
+    if errors:
+        raise errors[0]
+    return stats
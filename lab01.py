@@ -1,6 +1,85 @@
 import streamlit as st
-from openai import OpenAI
-from openai import AuthenticationError
+from openai import AuthenticationError, OpenAI
+
+import tracing
+from context_packer import SEPARATOR, ContextPacker
+from embedding_cache import CachedEmbeddingFunction, openai_embedder
+from gateway import LLMGateway
+from pdf_text import bytes_hash, read_document
+from resources import get_embedding_cache, get_encoding, get_response_cache
+from response_cache import key_scope, make_key
+from upload_index import UploadIndex
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+CONTEXT_TOKENS = 2000  # documents up to this size are sent whole; larger ones are indexed
+
+
+def session_client(api_key):
+    """
+    This session's gateway for the API key the user typed in. It lives in
+    session state rather than the process-wide resource cache, so typed keys
+    go away with the session.
+    """
+    scope = key_scope(api_key)
+    cached = st.session_state.get("Lab1_client")
+    if cached is None or cached[0] != scope:
+        client = LLMGateway(OpenAI(api_key=api_key), encoding=get_encoding("gpt-3.5-turbo"))
+        cached = (scope, client)
+        st.session_state.Lab1_client = cached
+    return cached[1]
+
+
+def document_head(name, data, digest, encoding):
+    """
+    Returns the first CONTEXT_TOKENS + 1 tokens of the upload as text, and
+    how many tokens that is. Both are kept with this session's upload, so
+    follow-up questions about the same content do not tokenize it again.
+    """
+    cached = st.session_state.get("Lab1_head")
+    if cached is None or cached[0] != digest:
+        head = read_document(name, data, max_tokens=CONTEXT_TOKENS + 1, encoding=encoding)
+        cached = (digest, head, len(encoding.encode(head, disallowed_special=())))
+        st.session_state.Lab1_head = cached
+    return cached[1], cached[2]
+
+
+def session_index(name, data, digest, embed, encoding):
+    """
+    Returns this session's index of the uploaded document, building it the
+    first time a question is asked about this content.
+    """
+    index = st.session_state.get("Lab1_index")
+    if index is None or index.digest != digest:
+        with st.spinner("Indexing document..."), tracing.span("index.build"):
+            index = UploadIndex.build(digest, read_document(name, data), embed, encoding)
+        # Only the current upload is kept, so memory is bounded per session
+        st.session_state.Lab1_index = index
+    return index
+
+
+def question_prompt(name, data, digest, question, client, encoding):
+    """
+    Returns the user message for question: the whole document when it fits
+    CONTEXT_TOKENS, which needs no embedding calls, otherwise the parts of
+    it most relevant to the question.
+    """
+    head, head_tokens = document_head(name, data, digest, encoding)
+    if head_tokens <= CONTEXT_TOKENS:
+        tracing.count("upload.whole_document")
+        return f"Here's a document: {head} \n\n---\n\n {question}"
+
+    embed = CachedEmbeddingFunction(
+        openai_embedder(client, EMBEDDING_MODEL),
+        model_name=EMBEDDING_MODEL,
+        cache=get_embedding_cache(),
+    )
+    index = session_index(name, data, digest, embed, encoding)
+    with tracing.span("retrieve"):
+        chunks = index.search(embed([question])[0])
+        passages, _ = ContextPacker(encoding).pack(chunks, CONTEXT_TOKENS)
+    context = SEPARATOR.join(passage["text"] for passage in passages)
+    return f"Here are the relevant parts of a document: {context} \n\n---\n\n {question}"
+
 
 def lab1():            
             st.markdown(
@@ -25,7 +104,7 @@ def lab1():
             else:
                 # created an OpenAI client to check if the key is valid
                 try:
-                    client = OpenAI(api_key=openai_api_key)
+                    client = session_client(openai_api_key)
             
                     # Columns for better layout
                     col1, col2 = st.columns([3, 1])
@@ -46,23 +125,43 @@ def lab1():
                         )
                         if st.button("Get Answer", disabled=not (uploaded_file and question)):
                             # Process the file and question
-                            document = uploaded_file.read().decode()
-                            messages = [
-                                {
-                                    "role": "user",
-                                    "content": f"Here's a document: {document} \n\n---\n\n {question}",
-                                }
-                            ]
-            
-                            # Generating the answers 
-                            with st.spinner("Generating answer..."):
-                                response = client.chat.completions.create(
-                                    model="gpt-4o-mini",  # or any other suitable model
-                                    messages=messages
+                            data = uploaded_file.getvalue()
+                            digest = bytes_hash(data)
+                            model_name = "gpt-4o-mini"  # or any other suitable model
+                            cache = get_response_cache()
+                            # Answers are only shared between users of the same key
+                            cache_key = make_key(
+                                digest, question, model_name, key_scope(openai_api_key)
+                            )
+                            answer = cache.get(cache_key)
+                            tracing.count("response_cache.hit" if answer is not None else "response_cache.miss")
+
+                            if answer is not None:
+                                st.caption("⚡ Answer served from cache (no tokens used)")
+                            else:
+                                # Small documents go whole; large ones only send the
+                                # parts relevant to the question
+                                content = question_prompt(
+                                    uploaded_file.name,
+                                    data,
+                                    digest,
+                                    question,
+                                    client,
+                                    get_encoding("gpt-3.5-turbo"),
                                 )
+                                messages = [{"role": "user", "content": content}]
+
+                                # Generating the answers 
+                                with st.spinner("Generating answer..."), tracing.span("llm.completion"):
+                                    response = client.chat.completions.create(
+                                        model=model_name,
+                                        messages=messages
+                                    )
+                                answer = response.choices[0].message.content
+                                cache.put(cache_key, answer)
             
-                                # Displaying the answer
-                                st.write(response.choices[0].message.content) 
+                            # Displaying the answer
+                            st.write(answer) 
             
                 except AuthenticationError:
                     st.error("Invalid OpenAI API key. Please check your key and try again.")
\ No newline at end of file
@@ -1,7 +1,14 @@
 import streamlit as st
-from openai import OpenAI
 from openai import AuthenticationError
-import PyPDF2
+
+import tracing
+from pdf_text import read_document
+from resources import get_encoding, get_llm_gateway, get_page_cache, get_response_cache
+from response_cache import make_key
+from summarizer import summarize
+
+MAX_DOCUMENT_TOKENS = 200_000  # Extraction stops here; bounds the map-reduce cost
+
 
 def lab2():
         
@@ -25,7 +32,7 @@ def lab2():
             st.stop()
 
         try:
-            client = OpenAI(api_key=openai_api_key)
+            client = get_llm_gateway(openai_api_key)
 
             # Sidebar with summary options and model choice
             with st.sidebar:
@@ -43,55 +50,56 @@ def lab2():
             )
 
             if uploaded_file and st.button("Generate Summary"):
-                # Process the file
+                # Process the file; PDF pages come from the shared page cache
+                encoding = get_encoding("gpt-3.5-turbo")
                 try:
-                    if uploaded_file.type == "application/pdf":
-                        # Define read_pdf function within lab2
-                        def read_pdf(uploaded_file):
-                            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                            num_pages = len(pdf_reader.pages)
-                            text = ""
-                            for page_num in range(num_pages):
-                                page = pdf_reader.pages[page_num]
-                                text += page.extract_text()
-                            return text
-
-
-                        document = read_pdf(uploaded_file)
-                    else: 
-                        document = uploaded_file.read().decode("utf-8") 
-                except UnicodeDecodeError:
-                    try:
-                        document = uploaded_file.read().decode("latin-1")
-                    except UnicodeDecodeError:
-                        st.error("Error decoding file. Please ensure the file is in UTF-8 or Latin-1 encoding.")
-                        return 
+                    with tracing.span("document.read"):
+                        document = read_document(
+                            uploaded_file.name,
+                            uploaded_file.getvalue(),
+                            cache=get_page_cache(),
+                            max_tokens=MAX_DOCUMENT_TOKENS,
+                            encoding=encoding,
+                        )
                 except Exception as e:
                     st.exception(e)
                     return
 
-                # Construct prompt based on selected summary option
-                if summary_option == "100 words":
-                    prompt = f"Summarize the following document in 100 words:\n\n{document}"
-                elif summary_option == "2 paragraphs":
-                    prompt = f"Summarize the following document in 2 connecting paragraphs:\n\n{document}"
-                else:  # 5 bullet points
-                    prompt = f"Summarize the following document in 5 bullet points:\n\n{document}"
-
-                # Generate summary
+                # Generate summary, unless this exact request was answered before
+                cache = get_response_cache()
+                cache_key = make_key(document, summary_option, model_name)
+                summary = cache.get(cache_key)
+                tracing.count("response_cache.hit" if summary is not None else "response_cache.miss")
                 try:
-                    with st.spinner("Generating summary..."):
-                        response = client.chat.completions.create(
-                            model=model_name,
-                            messages=[
-                                {"role": "user", "content": prompt}
-                            ]
-                        )
+                    if summary is None:
+                        progress_bar = st.progress(0.0, text="Generating summary...")
+                        partials = st.expander("Partial summaries")
+
+                        def on_progress(stage, done, total, partial):
+                            progress_bar.progress(
+                                done / total, text=f"Summarizing ({stage}) {done}/{total}..."
+                            )
+                            partials.markdown(f"**{stage} {done}/{total}**\n\n{partial}")
+
+                        with st.spinner("Generating summary..."):
+                            summary = summarize(
+                                client,
+                                model_name,
+                                document,
+                                summary_option,
+                                encoding=encoding,
+                                on_progress=on_progress,
+                            )
+                        progress_bar.empty()
+                        if summary:
+                            cache.put(cache_key, summary)
+                    else:
+                        st.caption("⚡ Summary served from cache (no tokens used)")
 
                     # Display the summary only if it's generated
-                    if response.choices[0].message.content:
+                    if summary:
                         st.subheader("Summary")
-                        st.write(response.choices[0].message.content)
+                        st.write(summary)
                 except Exception as e:
                     st.exception(e) 
 
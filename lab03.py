@@ -1,14 +1,187 @@
 import streamlit as st
-from openai import OpenAI
 from openai import AuthenticationError
-from tiktoken import encoding_for_model
-import uuid
+
+import tracing
+from chat_view import render_history
+from conversation import ChatHistory, build_request, ensure_history, request_messages
+from resources import (
+    get_background_executor,
+    get_compactor,
+    get_encoding,
+    get_history_store,
+    get_llm_gateway,
+)
+from streaming import StreamRenderer, stream_to
+
+MAX_TOKENS = 3000  # Prompt budget per request; adjust this as needed
+SYSTEM_PROMPT = "You are a helpful AI assistant."
+MORE_INFO_PROMPT = "Can you give more information on that?"
+ELABORATION_CONTEXT = 3  # recent messages sent along with MORE_INFO_PROMPT
+
+# The follow-up flow is a small state machine kept in st.session_state.Lab3_followup:
+#   "idle"      -> nothing offered (no reply yet, user said No, or a new question)
+#   "offered"   -> a reply was shown; Yes/No buttons are displayed
+#   "elaborate" -> Yes was clicked; this run produces the elaboration, then "offered"
+
+
+def elaboration_messages(history):
+    return (
+        [{"role": "system", "content": SYSTEM_PROMPT}]
+        + request_messages(history[-ELABORATION_CONTEXT:])
+        + [{"role": "user", "content": MORE_INFO_PROMPT}]
+    )
+
+
+def _prefetch(client, model_name, messages):
+    response = client.chat.completions.create(model=model_name, messages=messages)
+    usage = getattr(response, "usage", None)
+    return response.choices[0].message.content or "", getattr(usage, "completion_tokens", 0) or 0
+
+
+def start_prefetch(client, model_name, history):
+    """
+    Starts generating the elaboration of the latest reply in the background,
+    unless that is already under way.
+    """
+    prefetch = st.session_state.get("Lab3_prefetch")
+    if prefetch is not None and prefetch["turn"] == len(history):
+        return
+    discard_prefetch()
+    future = get_background_executor().submit(
+        _prefetch, client, model_name, elaboration_messages(history)
+    )
+    st.session_state.Lab3_prefetch = {"turn": len(history), "future": future}
+    tracing.count("elaboration.prefetch_started")
+    prefetch_stats()["started"] += 1
+
+
+def take_prefetch(turn):
+    """
+    Returns the prefetch Future for the reply at history length turn, or None.
+    """
+    prefetch = st.session_state.pop("Lab3_prefetch", None)
+    if prefetch is None:
+        return None
+    if prefetch["turn"] != turn:
+        _discard(prefetch["future"])
+        return None
+    return prefetch["future"]
+
+
+def discard_prefetch():
+    prefetch = st.session_state.pop("Lab3_prefetch", None)
+    if prefetch is not None:
+        _discard(prefetch["future"])
+
+
+def _discard(future):
+    tracing.count("elaboration.prefetch_discarded")
+    if future.cancel():
+        return
+
+    # Already running: count its tokens as wasted once it finishes. The
+    # callback runs on the executor thread, so it updates the session's stats
+    # dict directly rather than going through st.session_state.
+    stats = prefetch_stats()
+
+    def wasted(done):
+        if not done.cancelled() and done.exception() is None:
+            tracing.count("elaboration.prefetch_tokens_wasted", done.result()[1])
+            stats["tokens_wasted"] += done.result()[1]
+
+    future.add_done_callback(wasted)
+
+
+def prefetch_stats():
+    """
+    This session's prefetch counters; the tracing counters cover the process.
+    """
+    if "Lab3_prefetch_stats" not in st.session_state:
+        st.session_state.Lab3_prefetch_stats = {
+            "started": 0, "used": 0, "tokens_used": 0, "tokens_wasted": 0
+        }
+    return st.session_state.Lab3_prefetch_stats
+
+
+def show_prefetch_stats():
+    stats = prefetch_stats()
+    if not stats["started"]:
+        return
+    spent = stats["tokens_used"] + stats["tokens_wasted"]
+    st.caption(
+        f"Prefetched elaborations used: {stats['used']} of {stats['started']}"
+        + (f" ({stats['tokens_used'] / spent:.0%} of prefetched tokens)" if spent else "")
+    )
+
+
+def on_yes_click():
+    st.session_state.messages.append({"role": "user", "content": MORE_INFO_PROMPT})
+    st.session_state.Lab3_followup = "elaborate"
+
+
+def on_no_click():
+    discard_prefetch()
+    st.session_state.messages.append({"role": "assistant", "content": "What question can I help you with?"})
+    st.session_state.Lab3_followup = "idle"
+
+
+def elaborate(client, model_name, history):
+    """
+    Shows the elaboration of the latest reply: the prefetched one if there
+    is one, otherwise a fresh stream that a Stop click cancels.
+    """
+    # Whatever happens below, a rerun must not start the elaboration again
+    st.session_state.Lab3_followup = "idle"
+    prefetch = take_prefetch(len(history) - 1)  # before MORE_INFO_PROMPT was added
+
+    with st.chat_message("assistant"):
+        text = None
+        if prefetch is not None:
+            try:
+                with st.spinner("Elaborating..."):
+                    text, tokens = prefetch.result()
+                tracing.count("elaboration.prefetch_used")
+                tracing.count("elaboration.prefetch_tokens_used", tokens)
+                prefetch_stats()["used"] += 1
+                prefetch_stats()["tokens_used"] += tokens
+                st.markdown(text)
+            except Exception:
+                text = None  # fall back to streaming it now
+
+        if text is None:
+            # Clicking Stop reruns the script, which interrupts the stream below;
+            # the renderer closes the HTTP stream and the partial text is kept
+            stop_slot = st.empty()
+            stop_slot.button("Stop", key="Lab3_stop")
+            renderer = StreamRenderer(st.empty(), name="llm.elaborate")
+            try:
+                text = renderer.render(client.chat.completions.create(
+                    model=model_name,
+                    messages=elaboration_messages(history[:-1]),
+                    stream=True
+                ))
+            except BaseException:
+                if renderer.text:
+                    history.append({"role": "assistant", "content": renderer.text + " *(stopped)*"})
+                # A stopped elaboration can be asked for again
+                st.session_state.Lab3_followup = "offered"
+                raise
+            stop_slot.empty()
+
+    history.append({"role": "assistant", "content": text})
+    st.session_state.Lab3_followup = "offered"
+
 
 def lab3():
 
     # Initialize chat history if not present in session state
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = ChatHistory(
+            encoding=get_encoding("gpt-3.5-turbo"), store=get_history_store()
+        )
+    st.session_state.messages = ensure_history(
+        st.session_state.messages, get_encoding("gpt-3.5-turbo"), get_history_store()
+    )
 
     # Title and description
     st.title("🤖 Chat with GPT")
@@ -24,124 +197,74 @@ def lab3():
         st.stop()
 
     try:
-        client = OpenAI(api_key=openai_api_key)
+        client = get_llm_gateway(openai_api_key)
 
         # Sidebar with model choice
         with st.sidebar:
             st.subheader("Model Options")
             use_advanced_model = st.checkbox("Use Advanced Model (gpt-4)")
             model_name = "gpt-4" if use_advanced_model else "gpt-3.5-turbo"
+            prefetch_enabled = st.checkbox(
+                "Prefetch elaborations",
+                help="Prepare the \"more information\" answer in the background, "
+                "so it shows instantly if you ask for it. Unused prefetches cost tokens.",
+            )
+            show_prefetch_stats()
 
-            # Initialize encoding after model_name is assigned
-            encoding = encoding_for_model(model_name)
-
-        # Display chat messages from history
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        # Display the most recent chat messages from history
+        render_history(st.session_state.messages, "Lab3_history")
 
         # User input for questions
         if prompt := st.chat_input("You:"):
+            # A new question makes any offered elaboration moot
+            discard_prefetch()
+            st.session_state.Lab3_followup = "idle"
             st.session_state.messages.append({"role": "user", "content": prompt})
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            # Calculate token count for the new prompt
-            new_prompt_tokens = len(encoding.encode(prompt))
-
-            # Maintain a conversation buffer, limiting it to 'max_tokens'
-            max_tokens = 3000  # Adjust this as needed
-            conversation_buffer = []
-            total_tokens = 0
-            for message in reversed(st.session_state.messages):
-                message_tokens = len(encoding.encode(message["content"]))
-                if total_tokens + message_tokens > max_tokens:
-                    break
-                conversation_buffer.insert(0, message)
-                total_tokens += message_tokens
-
-            # Add system message tokens
-            total_tokens += len(encoding.encode("You are a helpful AI assistant."))
+            # Budget the system prompt and summary first, then fill the rest
+            # with history
+            with tracing.span("token_count"):
+                messages_for_request, total_tokens, truncated = build_request(
+                    st.session_state.messages, SYSTEM_PROMPT, MAX_TOKENS
+                )
 
             # Display token count information
             st.write(f"Total tokens used for this request: {total_tokens}")
-            if total_tokens > max_tokens:
-                st.warning(f"Conversation buffer truncated to fit within {max_tokens} tokens.")
-
-            # Construct the full message history for context
-            messages_for_request = [
-                {"role": "system", "content": "You are a helpful AI assistant."}
-            ] + conversation_buffer
+            if truncated:
+                st.warning(f"Conversation buffer truncated to fit within {MAX_TOKENS} tokens.")
 
             # Stream the response
-            response_container = st.empty()
-            full_response = ""
-            for chunk in client.chat.completions.create(
+            full_response = stream_to(st.empty(), client.chat.completions.create(
                 model=model_name,
                 messages=messages_for_request,
                 stream=True
-            ):
-                content = chunk.choices[0].delta.content or ""
-                full_response += content
-                response_container.markdown(full_response + "▌")
-            response_container.markdown(full_response)
+            ))
 
             st.session_state.messages.append({"role": "assistant", "content": full_response})
+            st.session_state.Lab3_followup = "offered"
 
-        # Flag to control whether to ask for more information
-        ask_for_more_information = True
-
-        # Callback function to handle "Yes" button click 
-        def on_yes_click():
-            nonlocal ask_for_more_information 
-            st.session_state.messages.append({"role": "user", "content": "Can you give more information on that?"})
-            ask_for_more_information = True 
-
-        # Callback function to handle "No" button click 
-        def on_no_click():
-            nonlocal ask_for_more_information
-            st.session_state.messages.append({"role": "assistant", "content": "What question can I help you with?"})
-            ask_for_more_information = False  # Exit the loop
-
-        while ask_for_more_information:
-
-            # Trigger another API call to get the elaboration
-            conversation_buffer = st.session_state.messages[-4:]
-            messages_for_request = [
-                {"role": "system", "content": "You are a helpful AI assistant."}
-            ] + conversation_buffer
-
-            # Stream the elaboration
-            response_container = st.empty()
-            full_response = ""
-            for chunk in client.chat.completions.create(
-                model=model_name,
-                messages=messages_for_request,
-                stream=True
-            ):
-                content = chunk.choices[0].delta.content or ""
-                full_response += content
-                response_container.markdown(full_response + "▌")
-            response_container.markdown(full_response)
+            # Fold older turns into the running summary off the request path
+            get_compactor(openai_api_key).refresh(st.session_state.messages)
 
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
+        # Follow-up: elaborate only when asked to
+        if st.session_state.get("Lab3_followup") == "elaborate":
+            elaborate(client, model_name, st.session_state.messages)
+
+        if st.session_state.get("Lab3_followup") == "offered":
+            if prefetch_enabled:
+                start_prefetch(client, model_name, st.session_state.messages)
 
             # Ask if the user wants more information
             st.markdown("**Do you want more information?**")
             col1, col2 = st.columns(2)
 
-            # Generate unique keys for the buttons
-            yes_button_key = str(uuid.uuid4())
-            no_button_key = str(uuid.uuid4())
-
             with col1:
-                st.button("Yes", on_click=on_yes_click, key=yes_button_key) 
+                st.button("Yes", on_click=on_yes_click, key="Lab3_more_yes")
 
             with col2:
-                if st.button("No", on_click=on_no_click, key=no_button_key):
-                    pass  # No need for additional logic here
-
-            ask_for_more_information = False  # Reset the flag at the end of the loop
+                st.button("No", on_click=on_no_click, key="Lab3_more_no")
 
     except AuthenticationError:
         st.error(
@@ -1,83 +1,468 @@
+import json
+import os
+
 import streamlit as st
-from openai import OpenAI
 from openai import AuthenticationError
-from tiktoken import encoding_for_model
-import uuid
-import os
 
-# Force the use of pysqlite3
-import pysqlite3  
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+import ingestion
+import tracing
+from bm25 import BM25Index, is_confident, reciprocal_rank_fusion
+from chat_view import render_history
+from context_packer import SEPARATOR, ContextPacker, context_budget
+from conversation import REPLY_PRIMING, ChatHistory, build_request, ensure_history
+from embedding_cache import CachedEmbeddingFunction, openai_embedder
+from ingest_worker import IngestWorker
+from pdf_text import file_hash
+from resources import (
+    CHROMA_PATH,
+    VECTOR_STORE_PATH,
+    get_chroma_client,
+    get_compactor,
+    get_embedding_cache,
+    get_encoding,
+    get_history_store,
+    get_llm_gateway,
+    get_page_cache,
+    get_semantic_cache,
+)
+from semantic_cache import HISTORY_KEY_MESSAGES, history_key
+from streaming import stream_to
+
+DATA_DIR = "Data/"
+MANIFEST_NAME = "manifest.json"
+LEXICAL_NAME = "bm25.json"
+COLLECTION_NAME = "Lab4Collection"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+CANDIDATES = 10  # results taken from each retriever before fusion
+MAX_TOKENS = 3000  # Prompt budget per request; adjust this as needed
+SYSTEM_PROMPT = "You are a helpful AI assistant. Use the following context to answer the question: \n"
+
+
+def index_dir(backend):
+    """
+    Directory holding a backend's index, and with it the manifest and BM25
+    index that describe it, so switching backends never mixes them up.
+    """
+    if backend == "chroma":
+        return CHROMA_PATH
+    return os.path.join(VECTOR_STORE_PATH, COLLECTION_NAME)
+
 
-import chromadb
-from chromadb.utils import embedding_functions
-import PyPDF2
+def open_collection(embedding_function, backend="chroma", dtype="float16"):
+    """
+    Opens the document collection in the chosen vector_store.BACKENDS backend.
+    """
+    if backend == "chroma":
+        return get_chroma_client().get_or_create_collection(
+            name=COLLECTION_NAME,
+            embedding_function=embedding_function
+        )
+    if backend == "mmap":
+        from vector_store import MmapVectorStore
 
-# Initialize ChromaDB client
-client = chromadb.Client()
+        return MmapVectorStore(index_dir(backend), embedding_function, dtype=dtype)
+    raise ValueError(f"Unknown vector backend {backend!r}")
 
 
-def create_vector_db():
+def load_manifest(directory=CHROMA_PATH):
     """
-    Creates the ChromaDB collection if it doesn't exist in session state.
+    Loads the {pdf path: content hash} manifest of what is already indexed.
     """
-    if "Lab4_vectorDB" not in st.session_state:
-        folder_path = "Data/"  # Replace with your actual path
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
-        try:
-            if not os.path.exists(folder_path):
-                raise FileNotFoundError(
-                    f"Error: Folder '{folder_path}' not found. Please check the path and try again."
-                )
 
-            pdf_files = [
-                os.path.join(folder_path, f)
-                for f in os.listdir(folder_path)
-                if f.endswith(".pdf")
+def save_manifest(manifest, directory=CHROMA_PATH):
+    """
+    Writes the manifest atomically so a crash never leaves it half-written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_lexical_index(collection, directory=CHROMA_PATH):
+    """
+    Loads the saved BM25 index, rebuilding it from the collection if missing.
+    """
+    lexical_path = os.path.join(directory, LEXICAL_NAME)
+    lexical = BM25Index.load(lexical_path)
+    if lexical is None:
+        lexical = BM25Index()
+        stored = collection.get(include=["documents", "metadatas"])
+        for doc_id, text, metadata in zip(
+            stored["ids"], stored["documents"], stored["metadatas"]
+        ):
+            lexical.add(doc_id, text, (metadata or {}).get("source"))
+        lexical.save(lexical_path)
+    return lexical
+
+
+def sync_vector_db(
+    collection,
+    folder_path=DATA_DIR,
+    encoding=None,
+    lexical=None,
+    progress=None,
+    page_cache=None,
+    directory=CHROMA_PATH,
+):
+    """
+    Brings the collection (and the BM25 index, if given) in line with the
+    PDFs in folder_path.
+
+    Only new or changed files are re-chunked and re-embedded, and chunks of
+    deleted files are removed. Pages of PDFs seen before (here or as an
+    upload) come from page_cache instead of being extracted again. Files
+    that cannot be read are listed in stats.failed and are not tried again
+    until they change. progress, if given, receives keyword status updates
+    as the run goes. Returns the (added, updated, removed) file lists and the
+    IngestStats of the run (None if nothing was re-indexed).
+    """
+    progress = progress or (lambda **updates: None)
+    if not os.path.exists(folder_path):
+        raise FileNotFoundError(
+            f"Error: Folder '{folder_path}' not found. Please check the path and try again."
+        )
+
+    pdf_files = sorted(
+        os.path.join(folder_path, f)
+        for f in os.listdir(folder_path)
+        if f.endswith(".pdf")
+    )
+
+    manifest = load_manifest(directory)
+    if manifest and collection.count() == 0:
+        # The index was wiped behind the manifest's back; start over
+        manifest = {}
+        if lexical is not None:
+            lexical.clear()
+
+    added, updated, removed, changed = [], [], [], {}
+    for pdf_file in pdf_files:
+        digest = file_hash(pdf_file)
+        previous = manifest.get(pdf_file)
+        if previous == digest:
+            continue
+        (updated if previous is not None else added).append(pdf_file)
+        changed[pdf_file] = digest
+
+    for pdf_file in set(manifest) - set(pdf_files):
+        removed.append(pdf_file)
+
+    # Drop stale chunks first; this also clears leftovers of an interrupted run
+    for pdf_file in list(changed) + removed:
+        collection.delete(where={"source": pdf_file})
+        if lexical is not None:
+            lexical.remove_source(pdf_file)
+        manifest.pop(pdf_file, None)
+
+    progress(files_total=len(changed), pages=0, chunks=0, current_file=None)
+    stats = None
+    if changed:
+        stats = ingestion.ingest(
+            collection,
+            list(changed),
+            encoding=encoding,
+            lexical_index=lexical,
+            page_cache=page_cache,
+            digests=changed,
+            on_progress=lambda s: progress(
+                pages=s.pages, chunks=s.chunks, current_file=s.current_file
+            ),
+        )
+        # Whatever an unreadable file added before failing goes now. Its hash
+        # still goes into the manifest, so it is tried again only once it
+        # changes; a file that was indexed before now counts as removed.
+        for pdf_file in stats.failed:
+            collection.delete(where={"source": pdf_file})
+            if lexical is not None:
+                lexical.remove_source(pdf_file)
+            if pdf_file in added:
+                added.remove(pdf_file)
+            else:
+                updated.remove(pdf_file)
+                removed.append(pdf_file)
+        manifest.update(changed)
+
+    if stats is not None or removed:
+        if lexical is not None:
+            lexical.save(os.path.join(directory, LEXICAL_NAME))
+        save_manifest(manifest, directory)
+
+    return added, updated, removed, stats
+
+
+class DocumentIndex:
+    """
+    What a query needs: the Chroma collection, its (cached) embedding
+    function and the BM25 index built alongside it.
+    """
+
+    def __init__(self, collection, embedding_function, lexical):
+        self.collection = collection
+        self.embedding_function = embedding_function
+        self.lexical = lexical
+
+    def retrieve(self, prompt, n_results=CANDIDATES):
+        """
+        retrieve() against this index. Returns (chunks, query embedding), where
+        the embedding is None if the lexical fast path answered without one.
+        """
+        embedded = []
+
+        def embed(texts):
+            with tracing.span("embed.query"):
+                vectors = self.embedding_function(texts)
+            embedded.extend(vectors)
+            return vectors
+
+        chunks = retrieve_many(self.collection, [prompt], n_results, self.lexical, embed=embed)[0]
+        return chunks, embedded[0] if embedded else None
+
+
+def _stored_chunks(collection, doc_ids):
+    """
+    Fetches {id: chunk} for lexical hits. The BM25 index only keeps term
+    statistics, so their texts come from the collection; ids removed by a
+    re-index since the search are missing.
+    """
+    if not doc_ids:
+        return {}
+    with tracing.span("retrieve.fetch"):
+        stored = collection.get(ids=sorted(doc_ids), include=["documents", "metadatas"])
+    return {
+        doc_id: {
+            "id": doc_id,
+            "text": text,
+            "source": (metadata or {}).get("source"),
+            "tokens": (metadata or {}).get("tokens"),
+        }
+        for doc_id, text, metadata in zip(
+            stored["ids"], stored["documents"], stored["metadatas"]
+        )
+    }
+
+
+def _vector_chunks(results, row):
+    return [
+        {
+            "id": doc_id,
+            "text": text,
+            "source": (metadata or {}).get("source"),
+            "tokens": (metadata or {}).get("tokens"),
+        }
+        for doc_id, text, metadata in zip(
+            results["ids"][row], results["documents"][row], results["metadatas"][row]
+        )
+    ]
+
+
+def retrieve(collection, prompt, n_results=3, lexical=None, query_embedding=None):
+    """
+    Returns the n_results chunks most relevant to prompt, best first, as
+    {"id", "text", "source"} dicts (plus "tokens" when the index knows it).
+
+    With a BM25 index, a query the lexical index answers confidently skips
+    vector search entirely; otherwise lexical and vector rankings are merged
+    with reciprocal-rank fusion. Pass query_embedding to reuse an embedding
+    the caller already has.
+    """
+    query_embeddings = None if query_embedding is None else [query_embedding]
+    return retrieve_many(collection, [prompt], n_results, lexical, query_embeddings)[0]
+
+
+def retrieve_many(collection, prompts, n_results=3, lexical=None, query_embeddings=None, embed=None):
+    """
+    retrieve() for a batch of prompts: every prompt that needs vector search
+    goes into a single collection query. Returns one chunk list per prompt.
+
+    embed, if given, is called with just the prompts that need vector
+    search, so prompts the lexical fast path answers are never embedded.
+    """
+    results = [None] * len(prompts)
+    lexical_hits = [None] * len(prompts)
+    if lexical is not None and len(lexical):
+        with tracing.span("retrieve.lexical"):
+            lexical_hits = [lexical.search(prompt, n_results=CANDIDATES) for prompt in prompts]
+            confident = [
+                i for i, hits in enumerate(lexical_hits)
+                if is_confident(hits, lexical.reference_score(prompts[i]))
+            ]
+        stored = _stored_chunks(
+            collection, {doc_id for i in confident for doc_id, _ in lexical_hits[i][:n_results]}
+        )
+        for i in confident:
+            tracing.count("retrieve.lexical_fast_path")
+            results[i] = [
+                stored[doc_id] for doc_id, _ in lexical_hits[i][:n_results] if doc_id in stored
             ]
 
-            # Use an appropriate OpenAI embedding model
-            embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-                api_key=st.secrets["api_key"],
-                model_name="text-embedding-ada-002"
-            )
+    pending = [i for i, chunks in enumerate(results) if chunks is None]
+    if pending and not collection.count():
+        vector_hits = {i: [] for i in pending}  # nothing indexed yet
+    elif pending:
+        if query_embeddings is not None:
+            query = {"query_embeddings": [query_embeddings[i] for i in pending]}
+        elif embed is not None:
+            query = {"query_embeddings": embed([prompts[i] for i in pending])}
+        else:
+            query = {"query_texts": [prompts[i] for i in pending]}
+        n = n_results if lexical_hits[pending[0]] is None else CANDIDATES
+        with tracing.span("retrieve"):
+            found = collection.query(n_results=n, **query)
+        vector_hits = {i: _vector_chunks(found, row) for row, i in enumerate(pending)}
+
+    fused = {}
+    for i in pending:
+        if lexical_hits[i] is None:
+            results[i] = vector_hits[i]
+            continue
+        by_id = {chunk["id"]: chunk for chunk in vector_hits[i]}
+        ranking = reciprocal_rank_fusion(list(by_id), [doc_id for doc_id, _ in lexical_hits[i]])
+        fused[i] = by_id, [doc_id for doc_id, _ in ranking[:n_results]]
+    stored = _stored_chunks(collection, {
+        doc_id for by_id, ranking in fused.values() for doc_id in ranking if doc_id not in by_id
+    })
+    for i, (by_id, ranking) in fused.items():
+        chunks = [by_id.get(doc_id) or stored.get(doc_id) for doc_id in ranking]
+        results[i] = [chunk for chunk in chunks if chunk]
+    return results
+
+
+def pack_passages(history, chunks):
+    """
+    Packs retrieved chunks into whatever the prompt budget leaves after the
+    system prompt and the conversation in history.
+    """
+    available = MAX_TOKENS - history.count_tokens(SYSTEM_PROMPT) - REPLY_PRIMING
+    with tracing.span("context.pack"):
+        passages, _ = ContextPacker(history.encoding).pack(
+            chunks, context_budget(available, history.active_tokens)
+        )
+    return passages
 
-            collection = client.create_collection(
-                name="Lab4Collection",
-                embedding_function=embedding_function
-            )
 
-            for pdf_file in pdf_files:
-                with open(pdf_file, "rb") as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    num_pages = len(pdf_reader.pages)
-                    text = ""
-                    for page_num in range(num_pages):
-                        page = pdf_reader.pages[page_num]
-                        text += page.extract_text()
-
-                chunk_size = 500
-                text_chunks = [
-                    text[i: i + chunk_size] for i in range(0, len(text), chunk_size)
-                ]
-                collection.add(
-                    documents=text_chunks,
-                    metadatas=[{"source": pdf_file}] * len(text_chunks),
-                    ids=[f"{pdf_file}_{i}" for i in range(len(text_chunks))],
-                )
+def build_answer_request(history, passages):
+    """
+    Returns build_request()'s (messages, total_tokens, truncated) for the
+    system prompt with the packed passages as context.
+    """
+    context = SEPARATOR.join(passage["text"] for passage in passages)
 
-            st.session_state.Lab4_vectorDB = collection
+    # Budget the system prompt and context first, then fill the rest with
+    # history
+    with tracing.span("token_count"):
+        return build_request(history, SYSTEM_PROMPT + context, MAX_TOKENS)
 
-        except (FileNotFoundError, IOError, PyPDF2.utils.PdfReadError) as e:
-            st.error(f"Error loading or processing PDFs: {e}")
-        except Exception as e:
-            st.error(f"An unexpected error occurred: {e}")
+
+@st.cache_resource(show_spinner="Opening document index...")
+def load_vector_db(api_key, backend="chroma", dtype="float16"):
+    """
+    Opens the persistent collection in the given vector backend and starts
+    the background worker that keeps it in sync with Data/.
+
+    Cached per process, so every session shares the same collection, BM25
+    index and worker. Returns (DocumentIndex, IngestWorker).
+    """
+    # Use an appropriate OpenAI embedding model, only for cache misses, and
+    # through the shared gateway so ingestion respects the rate limits too
+    embedding_function = CachedEmbeddingFunction(
+        openai_embedder(get_llm_gateway(api_key), EMBEDDING_MODEL),
+        model_name=EMBEDDING_MODEL,
+        cache=get_embedding_cache()
+    )
+
+    collection = open_collection(embedding_function, backend, dtype)
+    directory = index_dir(backend)
+    lexical = load_lexical_index(collection, directory)
+    encoding = get_encoding("gpt-3.5-turbo")
+    page_cache = get_page_cache()
+
+    def sync(progress):
+        added, updated, removed, stats = sync_vector_db(
+            collection,
+            encoding=encoding,
+            lexical=lexical,
+            progress=progress,
+            page_cache=page_cache,
+            directory=directory,
+        )
+        # Cached answers built on re-indexed documents are stale now
+        get_semantic_cache().invalidate_sources(added + updated + removed)
+        return added, updated, removed, stats
+
+    worker = IngestWorker(sync, DATA_DIR).start()
+    worker.request_sync("startup")
+    return DocumentIndex(collection, embedding_function, lexical), worker
+
+
+def create_vector_db():
+    """
+    Puts the shared document index into session state and shows the
+    background indexing status.
+    """
+    try:
+        index, worker = load_vector_db(
+            st.secrets["api_key"],
+            st.secrets.get("vector_backend", "chroma"),
+            st.secrets.get("vector_dtype", "float16"),
+        )
+    except Exception as e:
+        st.error(f"An unexpected error occurred: {e}")
+        return
+
+    st.session_state.Lab4_vectorDB = index
+
+    with st.sidebar:
+        if st.button("Rescan Data/ folder"):
+            worker.request_sync("manual rescan")
+
+    status = worker.status()
+    if worker.busy:
+        files_total = status.get("files_total")
+        st.info(
+            "Indexing documents in the background"
+            + (f" ({files_total} file(s) to process)" if files_total else "")
+            + f": {status.get('pages', 0)} pages, {status.get('chunks', 0)} chunks so far. "
+            "Answers use whatever is indexed already."
+        )
+    elif status["state"] == "error":
+        st.error(f"Error loading or processing PDFs: {status['error']}")
+    elif worker.last_result and not st.session_state.get("Lab4_sync_shown"):
+        added, updated, removed, stats = worker.last_result
+        if added or updated or removed:
+            st.info(
+                f"Index updated: {len(added)} added, {len(updated)} changed, "
+                f"{len(removed)} removed."
+            )
+        if stats:
+            st.caption(
+                f"Ingested {stats.pages} pages ({stats.pages_per_sec:.1f} pages/sec), "
+                f"{stats.chunks} chunks ({stats.chunks_per_sec:.1f} chunks/sec)."
+            )
+            if stats.failed:
+                st.warning(
+                    f"Skipped {len(stats.failed)} file(s) that could not be read: "
+                    + ", ".join(os.path.basename(f) for f in sorted(stats.failed))
+                )
+        st.session_state.Lab4_sync_shown = True
 
 
 def lab4():
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = ChatHistory(
+            encoding=get_encoding("gpt-3.5-turbo"), store=get_history_store()
+        )
+    st.session_state.messages = ensure_history(
+        st.session_state.messages, get_encoding("gpt-3.5-turbo"), get_history_store()
+    )
 
     st.title("🤖 Chat with GPT about your PDFs")
     st.markdown(
@@ -93,20 +478,24 @@ def lab4():
         st.stop()
 
     try:
-        client = OpenAI(api_key=openai_api_key)
+        client = get_llm_gateway(openai_api_key)
 
         with st.sidebar:
             st.subheader("Model Options")
             use_advanced_model = st.checkbox("Use Advanced Model (gpt-4)")
             model_name = "gpt-4" if use_advanced_model else "gpt-3.5-turbo"
-            encoding = encoding_for_model(model_name)
+            use_answer_cache = st.checkbox("Reuse answers to similar questions", value=True)
+            semantic_cache = get_semantic_cache()
+            if semantic_cache.hits + semantic_cache.misses:
+                st.caption(
+                    f"Answer cache: {len(semantic_cache)} entries, "
+                    f"{semantic_cache.hit_rate:.0%} hit rate"
+                )
 
         create_vector_db()
 
-        # Display chat messages from history
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        # Display the most recent chat messages from history
+        render_history(st.session_state.messages, "Lab4_history")
 
         # User input for questions
         if prompt := st.chat_input("You:"):
@@ -114,68 +503,75 @@ def lab4():
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            # Get relevant context from ChromaDB
-            collection = st.session_state.Lab4_vectorDB
-            results = collection.query(
-                query_texts=[prompt],
-                n_results=3  # Get top 3 most relevant chunks
-            )
-
-            # Construct the context from retrieved chunks
-            context = "\n".join(results['documents'][0])
-
-            # Calculate token count for the new prompt
-            new_prompt_tokens = len(encoding.encode(prompt))
-
-            # Maintain a conversation buffer, limiting it to 'max_tokens'
-            max_tokens = 3000  # Adjust this as needed
-            conversation_buffer = []
-            total_tokens = 0
-            for message in reversed(st.session_state.messages):
-                message_tokens = len(encoding.encode(message["content"]))
-                if total_tokens + message_tokens > max_tokens:
-                    break
-                conversation_buffer.insert(0, message)
-                total_tokens += message_tokens
-
-            # Add system message and context tokens
-            total_tokens += len(
-                encoding.encode(
-                    "You are a helpful AI assistant. Use the following context to answer the question: \n"
-                    + context
+            # Get candidate chunks, then pack as many as the budget allows,
+            # leaving room for the conversation
+            index = st.session_state.Lab4_vectorDB
+            chunks, query_embedding = index.retrieve(prompt)
+            passages = pack_passages(st.session_state.messages, chunks)
+            chunk_ids = [chunk_id for passage in passages for chunk_id in passage["ids"]]
+
+            # A similar question over the same chunks, asked after the same
+            # recent turns, was answered already. Only looked up when vector
+            # search embedded the question anyway. Questions the lexical fast
+            # path answers are neither looked up nor stored: keying them would
+            # take the embedding call the fast path exists to skip, on every
+            # such question, to save a chat call only on the rare repeat. So
+            # a repeated fast-path question is always answered afresh.
+            cached_answer = None
+            use_answer_cache = use_answer_cache and query_embedding is not None
+            if use_answer_cache:
+                context_key = history_key(
+                    st.session_state.messages[-HISTORY_KEY_MESSAGES - 1:-1]
+                )
+                cached_answer = semantic_cache.lookup(
+                    query_embedding, chunk_ids, model_name, context_key
+                )
+                tracing.count(
+                    "semantic_cache.hit" if cached_answer is not None else "semantic_cache.miss"
                 )
+            if cached_answer is not None:
+                with st.chat_message("assistant"):
+                    st.markdown(cached_answer)
+                    st.caption("⚡ Answer reused from a similar earlier question")
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": cached_answer}
+                )
+                return
+
+            # Construct the request from the packed passages
+            messages_for_request, total_tokens, truncated = build_answer_request(
+                st.session_state.messages, passages
             )
 
             # Display token count information
             st.write(f"Total tokens used for this request: {total_tokens}")
-            if total_tokens > max_tokens:
+            if truncated:
                 st.warning(
-                    f"Conversation buffer truncated to fit within {max_tokens} tokens."
+                    f"Conversation buffer truncated to fit within {MAX_TOKENS} tokens."
                 )
 
-            # Construct the full message history for context
-            messages_for_request = [
-                {
-                    "role": "system",
-                    "content": "You are a helpful AI assistant. Use the following context to answer the question: \n" + context
-                }
-            ] + conversation_buffer
-
             # Stream the response
-            response_container = st.empty()
-            full_response = ""
-            for chunk in client.chat.completions.create(
+            full_response = stream_to(st.empty(), client.chat.completions.create(
                 model=model_name, messages=messages_for_request, stream=True
-            ):
-                content = chunk.choices[0].delta.content or ""
-                full_response += content
-                response_container.markdown(full_response + "▌")
-            response_container.markdown(full_response)
+            ))
+
+            if use_answer_cache and full_response:
+                semantic_cache.store(
+                    query_embedding,
+                    chunk_ids,
+                    [passage["source"] for passage in passages],
+                    model_name,
+                    full_response,
+                    context_key,
+                )
 
             st.session_state.messages.append(
                 {"role": "assistant", "content": full_response}
             )
 
+            # Fold older turns into the running summary off the request path
+            get_compactor(openai_api_key).refresh(st.session_state.messages)
+
             # ... (rest of your "More Information" logic)
 
     except AuthenticationError:
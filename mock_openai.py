@@ -0,0 +1,188 @@
+"""
+Local stand-in for the OpenAI chat-completions and embeddings endpoints.
+
+Used by benchmark.py (and usable by hand) to exercise the labs offline with
+controllable latency. Point an OpenAI client at it with
+base_url=f"http://127.0.0.1:{port}/v1" and any api_key.
+
+    $ python mock_openai.py --port 8800 --first-token-ms 300 --tokens-per-sec 60
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from embedding_cache import hash_embedding
+
+
+class MockConfig:
+    def __init__(
+        self,
+        first_token_ms=200.0,
+        tokens_per_sec=80.0,
+        reply_tokens=120,
+        embed_request_ms=50.0,
+        embed_item_ms=0.5,
+        embedding_dim=256,
+    ):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.embed_request_ms = embed_request_ms
+        self.embed_item_ms = embed_item_ms
+        self.embedding_dim = embedding_dim
+
+
+def _reply_words(messages, count):
+    last = next(
+        (m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"),
+        "",
+    )
+    seed = last.split() or ["answer"]
+    return [seed[i % len(seed)] for i in range(count)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config = MockConfig()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat(body)
+        elif path.endswith("/embeddings"):
+            self._embeddings(body)
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _embeddings(self, body):
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        config = self.config
+        time.sleep((config.embed_request_ms + config.embed_item_ms * len(texts)) / 1000)
+        vectors = hash_embedding(texts, dim=config.embedding_dim)
+        self._json(200, {
+            "object": "list",
+            "model": body.get("model", "mock-embedding"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(vectors)
+            ],
+            "usage": {
+                "prompt_tokens": sum(len(t.split()) for t in texts),
+                "total_tokens": sum(len(t.split()) for t in texts),
+            },
+        })
+
+    def _chat(self, body):
+        config = self.config
+        words = _reply_words(body.get("messages") or [], config.reply_tokens)
+        prompt_tokens = sum(len((m.get("content") or "").split()) for m in body.get("messages") or [])
+        completion_id = "chatcmpl-" + uuid.uuid4().hex
+        created = int(time.time())
+        model = body.get("model", "mock-chat")
+        time.sleep(config.first_token_ms / 1000)
+
+        if not body.get("stream"):
+            time.sleep(len(words) / config.tokens_per_sec)
+            self._json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(words),
+                    "total_tokens": prompt_tokens + len(words),
+                },
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(1 / config.tokens_per_sec)
+            event({"content": word if i == 0 else " " + word})
+        event({}, finish_reason="stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """
+    Starts the mock server on a daemon thread. Returns (server, base_url).
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--embed-request-ms", type=float, default=50.0)
+    parser.add_argument("--embed-item-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        first_token_ms=args.first_token_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        embed_request_ms=args.embed_request_ms,
+        embed_item_ms=args.embed_item_ms,
+    )
+    server, base_url = start_server(config, args.host, args.port)
+    print(f"Mock OpenAI server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Shared text extraction for uploads and the Data/ corpus.
+
+Extracted PDF pages are cached on disk by the file's content hash, so a PDF
+that was uploaded before, or that is also in Data/, is never extracted twice.
+Pages are produced lazily, and callers that only need the first N tokens stop
+extraction early.
+"""
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+
+import PyPDF2
+
+import tracing
+
+PAGE_CACHE_PATH = os.path.join(".cache", "pages.sqlite3")
+
+
+def bytes_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def decode_text(data):
+    """
+    Decodes an uploaded text file as UTF-8, falling back to Latin-1.
+    """
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+class PageCache:
+    """
+    SQLite store of extracted page text keyed by (content hash, page number).
+    """
+
+    def __init__(self, path=PAGE_CACHE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " digest TEXT PRIMARY KEY,"
+            " num_pages INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " digest TEXT NOT NULL,"
+            " page_num INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " PRIMARY KEY (digest, page_num))"
+        )
+        self._conn.commit()
+
+    def page_count(self, digest):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT num_pages FROM documents WHERE digest = ?", (digest,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, digest, num_pages):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (digest, num_pages) VALUES (?, ?)",
+                (digest, num_pages),
+            )
+            self._conn.commit()
+
+    def get_pages(self, digest, start=0, end=None):
+        """
+        Returns {page_num: text} of the cached pages in [start, end).
+        """
+        end = end if end is not None else 1 << 31
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_num, text FROM pages"
+                " WHERE digest = ? AND page_num >= ? AND page_num < ?",
+                (digest, start, end),
+            ).fetchall()
+        return dict(rows)
+
+    def put_pages(self, digest, pages):
+        """
+        Stores an iterable of (page_num, text).
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (digest, page_num, text) VALUES (?, ?, ?)",
+                [(digest, page_num, text) for page_num, text in pages],
+            )
+            self._conn.commit()
+
+    def is_complete(self, digest):
+        num_pages = self.page_count(digest)
+        if num_pages is None:
+            return False
+        with self._lock:
+            (cached,) = self._conn.execute(
+                "SELECT COUNT(*) FROM pages WHERE digest = ?", (digest,)
+            ).fetchone()
+        return cached >= num_pages
+
+
+def iter_pdf_pages(data, cache=None, digest=None):
+    """
+    Yields the text of each page of a PDF given as bytes, lazily.
+
+    With a PageCache, cached pages are served from it and missing pages are
+    extracted (and cached) only when the caller actually asks for them.
+    """
+    if cache is None:
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+        for page in pdf_reader.pages:
+            with tracing.span("pdf.extract"):
+                text = page.extract_text() or ""
+            yield text
+        return
+
+    digest = digest or bytes_hash(data)
+    num_pages = cache.page_count(digest)
+    cached = cache.get_pages(digest) if num_pages is not None else {}
+    if num_pages is not None and len(cached) >= num_pages:
+        tracing.count("page_cache.hit")
+        for page_num in range(num_pages):
+            yield cached[page_num]
+        return
+
+    tracing.count("page_cache.miss")
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    num_pages = len(pdf_reader.pages)
+    cache.set_page_count(digest, num_pages)
+    for page_num in range(num_pages):
+        text = cached.get(page_num)
+        if text is None:
+            with tracing.span("pdf.extract"):
+                text = pdf_reader.pages[page_num].extract_text() or ""
+            cache.put_pages(digest, [(page_num, text)])
+        yield text
+
+
+def take_tokens(pages, max_tokens, encoding):
+    """
+    Yields pages until max_tokens tokens have been produced, cutting the
+    last page short, then stops without pulling any further pages.
+    """
+    remaining = max_tokens
+    for text in pages:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) >= remaining:
+            yield encoding.decode(tokens[:remaining])
+            return
+        remaining -= len(tokens)
+        yield text
+
+
+def read_document(name, data, cache=None, max_tokens=None, encoding=None):
+    """
+    Returns the text of an uploaded .pdf, .txt or .md file given its bytes.
+
+    With max_tokens (and the tiktoken encoding to count them), extraction
+    stops as soon as that many tokens have been read.
+    """
+    if name.lower().endswith(".pdf"):
+        pages = iter_pdf_pages(data, cache=cache)
+    else:
+        pages = iter([decode_text(data)])
+    if max_tokens is not None:
+        pages = take_tokens(pages, max_tokens, encoding)
+    return "".join(pages)
@@ -0,0 +1,108 @@
+"""
+Process-wide singletons shared by every session and rerun.
+
+Streamlit re-executes the page script on every interaction; anything built
+here is created once per process with st.cache_resource instead.
+"""
+import sys
+
+import streamlit as st
+from openai import OpenAI
+from tiktoken import encoding_for_model
+
+CHROMA_PATH = ".chroma"
+VECTOR_STORE_PATH = ".vectors"
+
+
+@st.cache_resource
+def get_openai_client(api_key):
+    return OpenAI(api_key=api_key)
+
+
+@st.cache_resource
+def get_encoding(model_name):
+    return encoding_for_model(model_name)
+
+
+@st.cache_resource
+def get_llm_gateway(api_key):
+    """
+    The rate-limited gateway every lab sends its OpenAI calls through.
+    """
+    from gateway import LLMGateway
+
+    return LLMGateway(get_openai_client(api_key), encoding=get_encoding("gpt-3.5-turbo"))
+
+
+@st.cache_resource
+def get_chroma_client(path=CHROMA_PATH):
+    # Force the use of pysqlite3, only once something actually needs chromadb
+    import pysqlite3
+    sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+
+    import chromadb
+
+    return chromadb.PersistentClient(path=path)
+
+
+@st.cache_resource
+def get_embedding_cache():
+    from embedding_cache import EmbeddingCache
+
+    return EmbeddingCache()
+
+
+@st.cache_resource
+def get_response_cache():
+    from response_cache import RESPONSE_CACHE_PATH, ResponseCache
+
+    return ResponseCache(path=RESPONSE_CACHE_PATH)
+
+
+@st.cache_resource
+def get_weather_client(api_key, base_url=None):
+    from weather import WEATHER_BASE_URL, WeatherClient
+
+    return WeatherClient(api_key, base_url=base_url or WEATHER_BASE_URL)
+
+
+@st.cache_resource
+def get_metrics_server(port):
+    import tracing
+
+    return tracing.serve_metrics(port)
+
+
+@st.cache_resource
+def get_semantic_cache():
+    from semantic_cache import SemanticCache
+
+    return SemanticCache()
+
+
+@st.cache_resource
+def get_page_cache():
+    from pdf_text import PageCache
+
+    return PageCache()
+
+
+@st.cache_resource
+def get_history_store():
+    from history_store import HistoryStore
+
+    return HistoryStore()
+
+
+@st.cache_resource
+def get_background_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="background")
+
+
+@st.cache_resource
+def get_compactor(api_key):
+    from compaction import Compactor
+
+    return Compactor(get_llm_gateway(api_key))
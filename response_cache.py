@@ -0,0 +1,140 @@
+"""
+Cache of model responses keyed by document content, prompt and model.
+
+An in-memory LRU tier with per-entry TTL is shared by every session in the
+process; an optional SQLite tier keeps answers across restarts and between
+processes, capped at max_rows least recently used rows. Answers bought with
+a user's own API key are scoped to a hash of that key (see key_scope), so
+they are never served to someone else.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_PATH = os.path.join(".cache", "responses.sqlite3")
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+MAX_ENTRIES = 256
+MAX_ROWS = 10_000  # SQLite tier
+
+
+def normalize_prompt(prompt):
+    """
+    Collapses whitespace and case so trivially different prompts share a key.
+    """
+    return " ".join(prompt.split()).lower()
+
+
+def key_scope(api_key):
+    """
+    Short, non-reversible tag of an API key, for scoping cache keys.
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(document, prompt, model_name, scope=""):
+    """
+    Returns the cache key for asking model_name prompt about document, within
+    scope (for example key_scope(api_key)).
+    """
+    document_hash = hashlib.sha256(document.encode("utf-8")).hexdigest()
+    digest = hashlib.sha256()
+    for part in (document_hash, normalize_prompt(prompt), model_name, scope):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier (memory, optional SQLite) TTL + LRU cache of response strings.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_used REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+            if "last_used" not in columns:  # created before the row cap
+                self._conn.execute(
+                    "ALTER TABLE responses ADD COLUMN last_used REAL NOT NULL DEFAULT 0"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        """
+        Returns the cached response for key, or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            if self._conn:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._conn.execute(
+                        "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+                    )
+                    self._conn.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+                if row:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, last_used)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                # Keep only the max_rows most recently used rows
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+                self._conn.commit()
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
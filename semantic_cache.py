@@ -0,0 +1,99 @@
+"""
+Semantic answer cache for questions over the PDF corpus.
+
+An answer is reused when a new question's embedding is within a cosine
+similarity threshold of a cached question *and* retrieval returned the same
+chunks, so paraphrases of a question share one generation while questions
+that need different context never do. The recent conversation is part of the
+key too, so a follow-up such as "tell me more" is never answered with what
+it meant after a different earlier question. Entries are dropped when any
+source document they were answered from is re-indexed.
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+SIMILARITY_THRESHOLD = 0.95
+MAX_ENTRIES = 256
+HISTORY_KEY_MESSAGES = 4  # earlier messages that make a question a different one
+
+
+def history_key(messages):
+    """
+    Digest of messages, the recent conversation a question follows.
+    """
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class SemanticCache:
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (unit vector, chunk ids, sources, answer)
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, embedding, chunk_ids, model_name, context_key=""):
+        """
+        Returns a cached answer for a similar question with the same context
+        and, via context_key (see history_key), the same preceding turns, or
+        None.
+        """
+        query = _normalize(embedding)
+        wanted = (model_name, frozenset(chunk_ids), context_key)
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for key, (vector, context, _, _) in self._entries.items():
+                if context != wanted:
+                    continue
+                score = sum(a * b for a, b in zip(query, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][3]
+
+    def store(self, embedding, chunk_ids, sources, model_name, answer, context_key=""):
+        with self._lock:
+            self._entries[self._next_key] = (
+                _normalize(embedding),
+                (model_name, frozenset(chunk_ids), context_key),
+                frozenset(sources),
+                answer,
+            )
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_sources(self, sources):
+        """
+        Drops every entry answered from any of the given source documents.
+        """
+        sources = set(sources)
+        if not sources:
+            return
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[2] & sources]:
+                del self._entries[key]
@@ -0,0 +1,97 @@
+"""
+Throttled renderer for streamed chat completions.
+
+Token chunks are collected in a list and the Streamlit placeholder is only
+redrawn at a capped frame rate, or once enough new characters have arrived,
+instead of rebuilding and re-sending the whole markdown for every token. The
+final text is always flushed, the stream can be cancelled, and
+time-to-first-token is recorded.
+"""
+import time
+
+import tracing
+
+MAX_FPS = 8  # redraws per second while streaming
+MIN_CHARS = 80  # redraw early once this many new characters arrived
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """
+    Renders a streaming completion into a placeholder such as st.empty().
+
+    cancel is an optional threading.Event (or anything with is_set()); once
+    set, rendering stops and the underlying HTTP stream is closed.
+    """
+
+    def __init__(self, container, max_fps=MAX_FPS, min_chars=MIN_CHARS, cancel=None, name="llm"):
+        self.container = container
+        self.min_interval = 1.0 / max_fps
+        self.min_chars = min_chars
+        self.cancel = cancel
+        self.name = name
+        self.parts = []
+        self.ttft = None
+        self.cancelled = False
+        self.redraws = 0
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def render(self, stream):
+        """
+        Consumes stream, drawing as it goes. Returns the full response text.
+        """
+        started = time.perf_counter()
+        last_draw = started
+        pending_chars = 0
+        try:
+            for chunk in stream:
+                if self.cancel is not None and self.cancel.is_set():
+                    self.cancelled = True
+                    break
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if not content:
+                    continue
+
+                now = time.perf_counter()
+                if self.ttft is None:
+                    self.ttft = now - started
+                    tracing.record(f"{self.name}.ttft", self.ttft)
+                self.parts.append(content)
+                pending_chars += len(content)
+
+                # Always draw the first token, then throttle
+                if (
+                    self.redraws == 0
+                    or pending_chars >= self.min_chars
+                    or now - last_draw >= self.min_interval
+                ):
+                    self._draw(self.text + CURSOR)
+                    last_draw, pending_chars = now, 0
+        finally:
+            # Also runs when Streamlit interrupts the script mid-stream, so
+            # the HTTP response is never left open
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            if self.ttft is not None:
+                tracing.record(f"{self.name}.stream", time.perf_counter() - started - self.ttft)
+
+        text = self.text
+        self._draw(text + (" *(stopped)*" if self.cancelled else ""))
+        return text
+
+    def _draw(self, markdown):
+        self.container.markdown(markdown)
+        self.redraws += 1
+
+
+def stream_to(container, stream, **kwargs):
+    """
+    Convenience wrapper: renders stream into container and returns the text.
+    """
+    return StreamRenderer(container, **kwargs).render(stream)
@@ -1,24 +1,35 @@
+import importlib
+import os
+
 import streamlit as st
-from lab01 import lab1 
-from lab02 import lab2 
-from lab03 import lab3
-from lab04 import lab4
-from lab05 import lab5
 
+import tracing
+from resources import get_metrics_server
+
+# Page label -> (module, entry point). Modules are imported only when their
+# page is selected, so opening Lab 1 never pays for chromadb.
+PAGES = {
+    "Lab 1": ("lab01", "lab1"),
+    "Lab 2": ("lab02", "lab2"),
+    "Lab 3": ("lab03", "lab3"),
+    "Lab 4": ("lab04", "lab4"),
+    "Lab 5": ("lab05", "lab5"),
+}
+
+# Optional Prometheus-style endpoint: METRICS_PORT=9100 streamlit run ...
+if os.environ.get("METRICS_PORT"):
+    get_metrics_server(int(os.environ["METRICS_PORT"]))
 
 
 with st.sidebar:
-    selected_page = st.radio("Select a page", ["Lab 1", "Lab 2", "Lab 3","Lab 4","Lab 5"])
+    selected_page = st.radio("Select a page", list(PAGES))
 
-# Display the selected page
-if selected_page == "Lab 1":
-    lab1()
-elif selected_page == "Lab 2":
-    lab2()
-elif selected_page == "Lab 3":
-    lab3()
-elif selected_page == "Lab 4":
-    lab4()
-elif selected_page == "Lab 5":
-    lab5()
-    
\ No newline at end of file
+# Display the selected page, timing its stages for the sidebar breakdown.
+# Pages end early with st.stop(), which raises, so the breakdown is shown
+# from a finally block.
+module_name, entry_point = PAGES[selected_page]
+try:
+    with tracing.trace(selected_page) as page_trace:
+        getattr(importlib.import_module(module_name), entry_point)()
+finally:
+    tracing.show_trace(page_trace)
@@ -0,0 +1,175 @@
+"""
+Map-reduce summarization for documents larger than the model context.
+
+The document is split into token-sized chunks that are summarized
+concurrently in a bounded thread pool; the partial summaries are then folded
+together level by level until one final call can produce the requested
+format. Progress callbacks run on the caller's thread, so they may safely
+update the Streamlit UI.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tracing
+
+from chunker import chunk_text
+
+MAP_CHUNK_TOKENS = 3000  # document tokens per map call
+MAP_OVERLAP_TOKENS = 100
+REDUCE_INPUT_TOKENS = 6000  # partial-summary tokens per reduce call
+MAX_REDUCE_LEVELS = 4  # reduce rounds before the partials are cut to fit
+MAX_WORKERS = 4
+
+FORMATS = {
+    "100 words": "in 100 words",
+    "2 paragraphs": "in 2 connecting paragraphs",
+    "5 bullet points": "in 5 bullet points",
+}
+
+
+def _complete(client, model_name, prompt):
+    with tracing.span("llm.completion"):
+        response = client.chat.completions.create(
+            model=model_name,
+            messages=[{"role": "user", "content": prompt}],
+        )
+    return response.choices[0].message.content or ""
+
+
+def _summarize_all(client, model_name, prompts, max_workers, on_done):
+    """
+    Runs prompts concurrently and returns their answers in input order.
+    """
+    results = [None] * len(prompts)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            # Each task runs in its own copy of the caller's context so its
+            # spans join the caller's trace
+            executor.submit(
+                contextvars.copy_context().run, _complete, client, model_name, prompt
+            ): i
+            for i, prompt in enumerate(prompts)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_done:
+                on_done(i, results[i])
+    return results
+
+
+def _group(chunks, budget):
+    """
+    Groups consecutive (text, tokens) chunks so each group fits budget.
+    """
+    groups, current, tokens = [], [], 0
+    for chunk in chunks:
+        if current and tokens + chunk.tokens > budget:
+            groups.append(current)
+            current, tokens = [], 0
+        current.append(chunk)
+        tokens += chunk.tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _truncate(partials, budget, encoding):
+    """
+    Cuts every partial to an equal share of budget, so the result fits one
+    call while still covering the whole document.
+    """
+    share = max(budget // len(partials), 2)
+    return [
+        chunk_text(partial, encoding=encoding, max_tokens=share, overlap_tokens=0)[0]
+        for partial in partials
+        if partial.strip()
+    ]
+
+
+def summarize(
+    client,
+    model_name,
+    document,
+    summary_option,
+    encoding=None,
+    max_workers=MAX_WORKERS,
+    on_progress=None,
+):
+    """
+    Summarizes document in the format named by summary_option.
+
+    on_progress(stage, done, total, partial) is called after each map or
+    reduce call finishes, with stage "map" or "reduce".
+    """
+    instruction = FORMATS[summary_option]
+    chunks = chunk_text(
+        document,
+        encoding=encoding,
+        max_tokens=MAP_CHUNK_TOKENS,
+        overlap_tokens=MAP_OVERLAP_TOKENS,
+    )
+    if len(chunks) <= 1:
+        return _complete(
+            client, model_name, f"Summarize the following document {instruction}:\n\n{document}"
+        )
+
+    def progress(stage, total):
+        done = 0
+
+        def on_done(_, partial):
+            nonlocal done
+            done += 1
+            if on_progress:
+                on_progress(stage, done, total, partial)
+
+        return on_done
+
+    # Map: summarize every chunk on its own
+    prompts = [
+        "Summarize this part of a longer document, keeping every key fact, "
+        f"name, date and number:\n\n{chunk.text}"
+        for chunk in chunks
+    ]
+    partials = _summarize_all(
+        client, model_name, prompts, max_workers, progress("map", len(prompts))
+    )
+
+    # Reduce: merge neighbouring summaries until they fit one final call.
+    # Each round must shrink the number of groups; if the model does not
+    # shorten its output, or after MAX_REDUCE_LEVELS rounds, every partial
+    # is cut to an equal share of the budget instead of looping on.
+    previous_groups = None
+    for level in range(MAX_REDUCE_LEVELS + 1):
+        partial_chunks = [
+            chunk
+            for partial in partials
+            for chunk in chunk_text(
+                partial, encoding=encoding, max_tokens=MAP_CHUNK_TOKENS, overlap_tokens=0
+            )
+        ]
+        groups = _group(partial_chunks, REDUCE_INPUT_TOKENS)
+        if len(groups) == 1:
+            break
+        if level == MAX_REDUCE_LEVELS or (previous_groups is not None and len(groups) >= previous_groups):
+            tracing.count("summarize.truncated")
+            groups = [_truncate(partials, REDUCE_INPUT_TOKENS, encoding)]
+            break
+        previous_groups = len(groups)
+        prompts = [
+            "Combine these consecutive partial summaries of one document into a "
+            "single summary, keeping every key fact:\n\n"
+            + "\n\n".join(chunk.text for chunk in group)
+            for group in groups
+        ]
+        partials = _summarize_all(
+            client, model_name, prompts, max_workers, progress("reduce", len(prompts))
+        )
+
+    joined = "\n\n".join(chunk.text for chunk in groups[0])
+    return _complete(
+        client,
+        model_name,
+        "The following are summaries of consecutive parts of one document. "
+        f"Summarize the whole document {instruction}:\n\n{joined}",
+    )
@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+from mock_openai import MockConfig, start_server
+
+
+class WordEncoding:
+    """
+    Offline stand-in for a tiktoken encoding: one token per word, with the
+    whitespace before it, so decode(encode(text)) == text.
+    """
+
+    _TOKEN = re.compile(r"\s*\S+|\s+$")
+
+    def encode(self, text, disallowed_special=()):
+        return self._TOKEN.findall(text)
+
+    def encode_batch(self, texts, disallowed_special=()):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture
+def encoding():
+    return WordEncoding()
+
+
+@pytest.fixture(scope="session")
+def mock_openai_url():
+    """
+    Base URL of a fast local mock_openai server, shared by the session.
+    """
+    server, base_url = start_server(
+        MockConfig(first_token_ms=5, tokens_per_sec=2000, reply_tokens=12, embed_request_ms=1)
+    )
+    yield base_url
+    server.shutdown()
+
+
+@pytest.fixture
+def openai_client(mock_openai_url):
+    openai = pytest.importorskip("openai")
+    return openai.OpenAI(api_key="test", base_url=mock_openai_url)
@@ -0,0 +1,100 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("openai")
+
+import batch_qa  # noqa: E402
+from vector_store import MmapVectorStore  # noqa: E402
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [self.vector(text) for text in texts]
+
+    @staticmethod
+    def vector(text):
+        vector = np.random.default_rng(abs(hash(text)) % 2**32).normal(size=8)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FailingClient:
+    """
+    Passes chat calls through to client, failing those whose question
+    mentions "fail".
+    """
+
+    def __init__(self, client):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._client = client
+
+    def _create(self, **kwargs):
+        if "fail" in kwargs["messages"][-1]["content"]:
+            raise RuntimeError("upstream error")
+        return self._client.chat.completions.create(**kwargs)
+
+
+@pytest.fixture
+def index(tmp_path):
+    embed = CountingEmbedder()
+    collection = MmapVectorStore(str(tmp_path / "store"), embed)
+    collection.add(
+        documents=["Paris is in France.", "Rome is in Italy."],
+        metadatas=[{"source": "a.pdf"}, {"source": "b.pdf"}],
+        ids=["a.pdf_0", "b.pdf_0"],
+    )
+    embed.calls.clear()
+    return collection, embed, None
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_load_done_drops_errors_and_a_partial_last_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(
+        json.dumps({"id": "a", "answer": "x"}) + "\n"
+        + json.dumps({"id": "b", "error": "boom"}) + "\n"
+        + '{"id": "c", "ans'
+    )
+    assert batch_qa.load_done(str(path)) == {"a"}
+    assert read_lines(path) == [{"id": "a", "answer": "x"}]
+
+
+def test_load_done_skips_lines_without_an_id(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text(
+        json.dumps({"answer": "orphan"}) + "\n"
+        + json.dumps(["not", "a", "result"]) + "\n"
+        + json.dumps({"id": "a", "answer": "x"}) + "\n"
+    )
+    assert batch_qa.load_done(str(path)) == {"a"}
+    assert read_lines(path) == [{"id": "a", "answer": "x"}]
+
+
+def test_run_answers_each_id_once_and_resumes(tmp_path, openai_client, index, encoding):
+    output = str(tmp_path / "out.jsonl")
+    questions = [("q1", "Where is Paris?"), ("q2", "Please fail"), ("q1", "Where is Paris?")]
+    summary = batch_qa.run(questions, output, FailingClient(openai_client), index, encoding)
+    assert (summary["answered"], summary["failed"], summary["duplicates"]) == (1, 1, 1)
+    # One embeddings call for the batch, with each distinct question once
+    assert index[1].calls == [["Where is Paris?", "Please fail"]]
+
+    index[1].calls.clear()
+    questions = [("q1", "Where is Paris?"), ("q2", "Where is Rome?"), ("q3", "And Italy?")]
+    summary = batch_qa.run(questions, output, openai_client, index, encoding)
+    assert (summary["skipped"], summary["answered"], summary["failed"]) == (1, 2, 0)
+    assert index[1].calls == [["Where is Rome?", "And Italy?"]]
+
+    results = read_lines(output)
+    assert sorted(result["id"] for result in results) == ["q1", "q2", "q3"]
+    assert not any("error" in result for result in results)
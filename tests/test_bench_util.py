@@ -0,0 +1,16 @@
+from bench_util import latency_summary, percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = [0.4, 0.1, 0.3, 0.2]
+    assert percentile(values, 50) == 0.2
+    assert percentile(values, 95) == 0.4
+    assert percentile([], 50) is None
+
+
+def test_latency_summary_in_milliseconds():
+    assert latency_summary([0.01, 0.03]) == {
+        "count": 2, "p50_ms": 10.0, "p95_ms": 30.0, "mean_ms": 20.0
+    }
+    assert latency_summary([])["p50_ms"] is None
+
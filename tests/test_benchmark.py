@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("openai")
+
+import lab04  # noqa: E402
+from benchmark import bench_retrieval, lab04_request  # noqa: E402
+from bm25 import BM25Index  # noqa: E402
+from conversation import ChatHistory  # noqa: E402
+from tests.test_retrieval import DOCS, embed  # noqa: E402
+from vector_store import MmapVectorStore  # noqa: E402
+
+
+@pytest.fixture
+def index(tmp_path):
+    embed.calls = []
+    collection = MmapVectorStore(str(tmp_path / "store"), embed)
+    lexical = BM25Index()
+    collection.add(
+        documents=list(DOCS.values()),
+        metadatas=[{"source": doc_id.split("_")[0]} for doc_id in DOCS],
+        ids=list(DOCS),
+    )
+    for doc_id, text in DOCS.items():
+        lexical.add(doc_id, text, doc_id.split("_")[0])
+    return lab04.DocumentIndex(collection, embed, lexical)
+
+
+def test_lab04_request_uses_the_pages_prompt(index, encoding):
+    history = ChatHistory([{"role": "user", "content": "IST 652 Tuesdays"}], encoding=encoding)
+    messages, total_tokens, truncated = lab04_request(index)(history)
+    system = messages[0]["content"]
+    assert system.startswith(lab04.SYSTEM_PROMPT)
+    assert DOCS["a.pdf_0"] in system
+    assert messages[-1]["content"] == "IST 652 Tuesdays"
+    assert total_tokens and not truncated
+
+
+def test_bench_retrieval_times_every_question(index):
+    summary = bench_retrieval(index, ["IST 652 Tuesdays", "homework"])
+    assert summary["count"] == 2
@@ -0,0 +1,96 @@
+import json
+
+from bm25 import BM25Index, is_confident, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    "syllabus_0": "IST 652 Scripting for Data Analysis meets on Tuesdays.",
+    "syllabus_1": "Office hours are held by the instructor after class.",
+    "syllabus_2": "Grading: homework 40 percent, final project 60 percent.",
+    "notes_0": "Data analysis with Python covers pandas and plotting.",
+    "notes_1": "Homework is submitted through the course website.",
+}
+
+
+def build_index():
+    index = BM25Index()
+    for doc_id, text in DOCS.items():
+        index.add(doc_id, text, doc_id.split("_")[0] + ".pdf")
+    return index
+
+
+def test_tokenize_joins_course_codes_and_drops_stopwords():
+    assert tokenize("What is IST 652?") == ["ist", "652", "ist652"]
+    assert "ist652" in tokenize("ist-652")
+
+
+def test_search_ranks_exact_matches_first():
+    index = build_index()
+    hits = index.search("IST652 meeting day")
+    assert hits[0][0] == "syllabus_0"
+    assert index.search("nothing matches zebra") == []
+
+
+def test_distinctive_query_is_confident():
+    index = build_index()
+    query = "IST 652 Tuesdays"
+    assert is_confident(index.search(query), index.reference_score(query))
+
+
+def test_common_terms_are_not_confident():
+    index = build_index()
+    query = "homework"
+    hits = index.search(query)
+    assert len(hits) == 2
+    assert not is_confident(hits, index.reference_score(query))
+
+
+def test_partial_match_is_not_confident():
+    index = build_index()
+    query = "IST 652 midterm exam date rubric"
+    hits = index.search(query)
+    assert hits[0][0] == "syllabus_0"
+    assert not is_confident(hits, index.reference_score(query))
+
+
+def test_confidence_is_relative_to_the_reference():
+    assert is_confident([("a", 1.0)], reference=1.0)
+    assert not is_confident([("a", 1.0)], reference=2.0)
+    assert not is_confident([("a", 3.0), ("b", 2.5)], reference=1.0)
+    assert not is_confident([], reference=1.0)
+
+
+def test_remove_source_forgets_its_terms():
+    index = build_index()
+    index.remove_source("syllabus.pdf")
+    assert len(index) == 2
+    assert index.search("IST 652") == []
+    assert "ist652" not in index.postings
+
+
+def test_saved_index_keeps_term_stats_but_no_text(tmp_path):
+    index = build_index()
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+    with open(path, encoding="utf-8") as file:
+        saved = file.read()
+    assert "Tuesdays" not in saved
+
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.total_length == index.total_length
+    assert loaded.search("IST 652") == index.search("IST 652")
+    assert loaded.get("notes_0")["source"] == "notes.pdf"
+
+
+def test_old_save_format_is_rebuilt(tmp_path):
+    path = tmp_path / "bm25.json"
+    path.write_text(json.dumps({"syllabus_0": [DOCS["syllabus_0"], "syllabus.pdf"]}))
+    assert BM25Index.load(str(path)) is None
+    assert BM25Index.load(str(tmp_path / "missing.json")) is None
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion(["a", "b", "c"], ["b", "d"])
+    assert fused[0][0] == "b"
+    assert {doc_id for doc_id, _ in fused} == {"a", "b", "c", "d"}
+    assert fused[0][1] == 1 / 62 + 1 / 61
@@ -0,0 +1,64 @@
+import pytest
+
+from chunker import Chunker, chunk_pages, chunk_text, split_units
+
+
+def sentences(count, words=5):
+    return "".join(f"Sentence {i} " + "word " * (words - 3) + "end. " for i in range(count))
+
+
+def test_split_units_is_lossless():
+    text = "First one. Second one! Third?\n\nNew paragraph. Trailing"
+    units = split_units(text)
+    assert "".join(units) == text
+    assert units[0] == "First one."
+    assert units[1] == " Second one!"
+    assert split_units("") == []
+
+
+def test_chunks_respect_the_token_cap(encoding):
+    chunks = chunk_text(sentences(40), encoding=encoding, max_tokens=30, overlap_tokens=10)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.tokens == len(encoding.encode(chunk.text))
+        assert chunk.tokens <= 30
+
+
+def test_chunks_end_on_sentence_boundaries(encoding):
+    chunks = chunk_text(sentences(40), encoding=encoding, max_tokens=30, overlap_tokens=10)
+    for chunk in chunks:
+        assert chunk.text.rstrip().endswith("end.")
+
+
+def test_consecutive_chunks_overlap(encoding):
+    chunks = chunk_text(sentences(40), encoding=encoding, max_tokens=30, overlap_tokens=10)
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = split_units(previous.text.rstrip())[-1]
+        overlap = current.text[: current.text.index(last_sentence) + len(last_sentence)]
+        assert previous.text.endswith(overlap)
+        assert len(encoding.encode(overlap)) <= 10
+
+
+def test_no_overlap_covers_the_text_exactly(encoding):
+    text = sentences(40)
+    chunks = chunk_text(text, encoding=encoding, max_tokens=30, overlap_tokens=0)
+    assert "".join(chunk.text for chunk in chunks) == text + "\n"
+
+
+def test_unit_longer_than_the_cap_is_split_into_windows(encoding):
+    text = "word " * 100
+    chunks = chunk_text(text, encoding=encoding, max_tokens=30, overlap_tokens=0)
+    assert all(chunk.tokens <= 30 for chunk in chunks)
+    assert "".join(chunk.text for chunk in chunks) == text + "\n"
+
+
+def test_pages_are_chunked_as_one_document(encoding):
+    pages = [sentences(3), sentences(3)]
+    chunks = list(chunk_pages(pages, encoding=encoding, max_tokens=100, overlap_tokens=10))
+    assert len(chunks) == 1
+    assert chunks[0].text == pages[0] + "\n" + pages[1] + "\n"
+
+
+def test_overlap_must_be_less_than_half_the_cap(encoding):
+    with pytest.raises(ValueError):
+        Chunker(encoding=encoding, max_tokens=20, overlap_tokens=10)
@@ -0,0 +1,98 @@
+import threading
+from types import SimpleNamespace
+
+import tracing
+from compaction import Compactor
+from conversation import ChatHistory
+
+
+class FakeClient:
+    """
+    Stands in for the OpenAI client: replies with the next of replies, or
+    raises it if it is an exception. Calls wait for release if it is given.
+    """
+
+    def __init__(self, *replies, release=None):
+        self.replies = list(replies)
+        self.release = release
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.release is not None:
+            self.release.wait(5)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+def history_of(count, encoding):
+    return ChatHistory(
+        [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * 20}
+            for i in range(count)
+        ],
+        encoding=encoding,
+    )
+
+
+def compactor(client):
+    return Compactor(client, keep_messages=2, compact_after_tokens=50)
+
+
+def test_older_turns_are_folded_into_the_summary(encoding):
+    client = FakeClient("first summary", "second summary")
+    history = history_of(6, encoding)
+    compaction = compactor(client)
+
+    assert compaction.refresh(history).result() == "first summary"
+    assert history.summary[:2] == ("first summary", 4)
+    prompt = client.calls[0]["messages"][1]["content"]
+    assert "turn 3" in prompt and "turn 4" not in prompt
+    assert compaction.refresh(history) is None  # nothing new to fold
+
+    for i in range(6, 10):
+        history.append({"role": "user", "content": f"turn {i} " + "word " * 20})
+    assert compaction.refresh(history).result() == "second summary"
+    assert history.summary[:2] == ("second summary", 8)
+    prompt = client.calls[1]["messages"][1]["content"]
+    assert "first summary" in prompt and "turn 3" not in prompt and "turn 7" in prompt
+
+
+def test_nothing_is_folded_below_the_threshold(encoding):
+    client = FakeClient()
+    history = history_of(3, encoding)  # one message outside the kept two
+    compaction = Compactor(client, keep_messages=2, compact_after_tokens=10 ** 6)
+    assert not compaction.needs_refresh(history)
+    assert compaction.refresh(history) is None
+    assert client.calls == []
+
+
+def test_only_one_refresh_runs_per_history(encoding):
+    release = threading.Event()
+    client = FakeClient("summary", release=release)
+    history = history_of(6, encoding)
+    compaction = compactor(client)
+
+    running = compaction.refresh(history)
+    assert compaction.refresh(history) is None
+    release.set()
+    assert running.result() == "summary"
+    assert len(client.calls) == 1
+
+
+def test_failed_refresh_is_counted_and_tried_again(encoding):
+    client = FakeClient(RuntimeError("upstream down"), "summary")
+    history = history_of(6, encoding)
+    compaction = compactor(client)
+    failures = tracing.REGISTRY.counters.get("history.compaction_failed", 0)
+
+    assert compaction.refresh(history).result() is None
+    assert history.summary is None
+    assert tracing.REGISTRY.counters["history.compaction_failed"] == failures + 1
+    assert "upstream down" in compaction.last_error
+
+    assert compaction.refresh(history).result() == "summary"
+    assert history.summary[0] == "summary"
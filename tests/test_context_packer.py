@@ -0,0 +1,56 @@
+from context_packer import (
+    ContextPacker,
+    chunk_position,
+    context_budget,
+    dedupe,
+    overlap,
+)
+
+
+def chunk(chunk_id, text, source="doc.pdf"):
+    return {"id": chunk_id, "text": text, "source": source}
+
+
+def test_chunk_position():
+    assert chunk_position("Data/a_b.pdf_12") == ("Data/a_b.pdf", 12)
+    assert chunk_position("upload") == ("upload", None)
+
+
+def test_dedupe_drops_near_copies_of_better_ranked_chunks():
+    text = "the grading policy for this course is forty percent exams and sixty percent projects"
+    chunks = [chunk("a_0", text), chunk("b_0", text + " overall"), chunk("c_0", "office hours are on monday")]
+    assert [c["id"] for c in dedupe(chunks)] == ["a_0", "c_0"]
+
+
+def test_overlap_needs_a_minimum_length():
+    assert overlap("x" * 10 + "shared text of some length", "shared text of some length" + "y") == 26
+    assert overlap("abc short", "short def") == 0
+
+
+def test_context_budget_keeps_a_minimum_share():
+    assert context_budget(1000, 200) == 800
+    assert context_budget(1000, 900) == 500
+
+
+def test_pack_respects_budget_and_skips_to_smaller_chunks(encoding):
+    packer = ContextPacker(encoding)
+    big = chunk("a.pdf_0", "alpha " * 50)
+    small = chunk("b.pdf_0", "beta " * 5)
+    passages, tokens = packer.pack([big, small], budget=20)
+    assert [p["ids"] for p in passages] == [["b.pdf_0"]]
+    assert tokens <= 20
+
+
+def test_pack_merges_neighbours_and_removes_their_overlap(encoding):
+    shared = " and this sentence is repeated as overlap between chunks."
+    first = chunk("doc.pdf_3", "First part of the document." + shared)
+    second = chunk("doc.pdf_4", shared + " Second part follows here.")
+    other = chunk("other.pdf_0", "Unrelated passage about weather.", source="other.pdf")
+    passages, _ = ContextPacker(encoding).pack([second, other, first], budget=1000)
+    assert passages[0]["ids"] == ["doc.pdf_3", "doc.pdf_4"]
+    assert passages[0]["text"] == "First part of the document." + shared + " Second part follows here."
+    assert passages[1]["source"] == "other.pdf"
+
+
+def test_pack_empty(encoding):
+    assert ContextPacker(encoding).pack([], budget=100) == ([], 0)
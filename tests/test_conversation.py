@@ -0,0 +1,115 @@
+import gc
+
+import pytest
+
+from conversation import MESSAGE_OVERHEAD, REPLY_PRIMING, ChatHistory, build_request, ensure_history
+from history_store import HistoryStore
+
+
+def message(i, words=20):
+    role = "user" if i % 2 == 0 else "assistant"
+    return {"role": role, "content": f"message {i} " + "word " * words}
+
+
+@pytest.fixture
+def store():
+    return HistoryStore(":memory:", max_process_bytes=10 ** 9)
+
+
+def test_tokens_are_counted_once_and_summed(encoding):
+    first, second = message(0, 3), message(1, 5)
+    history = ChatHistory([first, second], encoding=encoding)
+    first_tokens = len(encoding.encode(first["content"])) + MESSAGE_OVERHEAD
+    second_tokens = len(encoding.encode(second["content"])) + MESSAGE_OVERHEAD
+    assert history[0]["tokens"] == first_tokens
+    assert history.total_tokens == first_tokens + second_tokens
+    assert history.tokens_between(1, 2) == second_tokens
+
+
+def test_window_keeps_latest_messages_within_budget(encoding):
+    history = ChatHistory([message(i, 10) for i in range(10)], encoding=encoding)
+    per_message = history[0]["tokens"]
+    window, tokens = history.window(per_message * 3)
+    assert [m["content"] for m in window] == [m["content"] for m in history[-3:]]
+    assert tokens == per_message * 3
+
+    window, _ = history.window(1)
+    assert len(window) == 1  # the question itself is never dropped
+    window, _ = history.window(10 ** 6, first=8)
+    assert len(window) == 2
+
+
+def test_build_request_sends_summary_instead_of_folded_messages(encoding):
+    history = ChatHistory([message(i) for i in range(6)], encoding=encoding)
+    history.set_summary("earlier stuff", 4)
+    history.set_summary("older summary", 2)  # never moves backwards
+    messages, total, truncated = build_request(history, "system", 10 ** 6)
+    assert messages[1]["content"].endswith("earlier stuff")
+    assert [m["content"] for m in messages[2:]] == [m["content"] for m in history[4:]]
+    assert total == history.count_tokens("system") + history.active_tokens + REPLY_PRIMING
+    assert not truncated
+
+
+def test_ensure_history_converts_lists(encoding):
+    history = ensure_history([message(0)], encoding)
+    assert isinstance(history, ChatHistory)
+    assert ensure_history(history) is history
+
+
+def test_spilled_messages_read_back_like_a_list(encoding, store):
+    history = ChatHistory(encoding=encoding, store=store, max_resident_bytes=4000)
+    expected = [message(i) for i in range(200)]
+    for m in expected:
+        history.append(m)
+    assert history.resident_bytes <= 4000
+    assert history._offset > 0  # older messages were spilled
+
+    contents = [m["content"] for m in expected]
+    assert [m["content"] for m in history] == contents
+    assert history[5]["content"] == contents[5]
+    assert history[-1]["content"] == contents[-1]
+    assert [m["content"] for m in history[10:20]] == contents[10:20]
+    assert [m["content"] for m in history[::40]] == contents[::40]
+    assert history[5]["tokens"] == history.count_tokens(contents[5])
+    with pytest.raises(IndexError):
+        history[200]
+
+    window, tokens = history.window(history.total_tokens)
+    assert len(window) == 200 and tokens == history.total_tokens
+
+
+def test_process_cap_spills_least_recently_used_sessions(encoding):
+    store = HistoryStore(":memory:", max_process_bytes=20_000)
+    old = ChatHistory(encoding=encoding, store=store, max_resident_bytes=10 ** 9)
+    for i in range(40):
+        old.append(message(i))
+    new = ChatHistory(encoding=encoding, store=store, max_resident_bytes=10 ** 9)
+    for i in range(40):
+        new.append(message(i))
+    assert old.resident_bytes + new.resident_bytes <= 20_000
+    assert old._offset > 0
+    assert [m["content"] for m in old] == [message(i)["content"] for i in range(40)]
+
+
+def test_spilled_rows_are_dropped_with_the_session(encoding, store):
+    history = ChatHistory(encoding=encoding, store=store, max_resident_bytes=1000)
+    for i in range(50):
+        history.append(message(i))
+    session = history.session_id
+    assert store.get_range(session, 0, 10)
+    del history
+    gc.collect()
+    assert store.get_range(session, 0, 10) == []
+
+
+def test_opening_the_store_clears_only_rows_of_this_process(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    other = HistoryStore(path)
+    other.owner = other.owner + 1  # stands in for another process sharing the file
+    other.put_many("theirs", 0, [{"role": "user", "content": "hi", "tokens": 3}])
+    crashed = HistoryStore(path)  # an earlier process that had this pid
+    crashed.put_many("stale", 0, [{"role": "user", "content": "hi", "tokens": 3}])
+
+    store = HistoryStore(path)
+    assert store.get_range("stale", 0, 1) == []
+    assert store.get_range("theirs", 0, 1) == [{"role": "user", "content": "hi", "tokens": 3}]
@@ -0,0 +1,80 @@
+import math
+
+import pytest
+
+from embedding_cache import (
+    CachedEmbeddingFunction,
+    EmbeddingCache,
+    hash_embedding,
+    openai_embedder,
+    text_key,
+)
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return hash_embedding(texts, dim=8)
+
+
+def test_hash_embedding_is_deterministic_and_normalised():
+    first, second = hash_embedding(["hello world", "hello world"], dim=16)
+    assert first == second
+    assert math.isclose(sum(v * v for v in first), 1.0, rel_tol=1e-6)
+
+
+def test_text_key_depends_on_model_and_text():
+    assert text_key("m", "a") != text_key("m", "b")
+    assert text_key("m", "a") != text_key("n", "a")
+
+
+def test_only_misses_are_embedded_in_batches(tmp_path):
+    embed = CountingEmbedder()
+    function = CachedEmbeddingFunction(
+        embed, "m", cache=EmbeddingCache(str(tmp_path / "e.sqlite3")), batch_size=2
+    )
+    vectors = function(["a", "b", "c", "a"])
+    assert embed.batches == [["a", "b"], ["c"]]
+    assert vectors[0] == vectors[3]
+
+    again = function(["c", "d"])
+    assert embed.batches[-1] == ["d"]
+    assert again[0] == vectors[2]
+    assert function.hits == 1 and function.misses == 4
+
+
+def test_cache_persists_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "e.sqlite3")
+    cache = EmbeddingCache(path)
+    cache.put_many({"k": [0.5, 0.25]})
+    assert EmbeddingCache(path).get_many(["k", "missing"]) == {"k": [0.5, 0.25]}
+
+    entry = len(b"k0") + 4 * 100
+    small = EmbeddingCache(str(tmp_path / "small.sqlite3"), max_bytes=entry * 3)
+    for i in range(5):
+        small.put_many({f"k{i}": [0.0] * 100})
+    assert small.size_bytes() <= entry * 3
+    assert "k4" in small.get_many(["k4"])
+
+
+def test_openai_embedder_against_mock_server(openai_client):
+    embed = openai_embedder(openai_client, "text-embedding-ada-002")
+    vectors = embed(["first text", "second text"])
+    assert len(vectors) == 2
+    assert vectors[0] == hash_embedding(["first text"])[0]
+
+
+def test_works_as_a_chroma_embedding_function(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    embedder = CountingEmbedder()
+    function = CachedEmbeddingFunction(embedder, "m", EmbeddingCache(str(tmp_path / "e.db")))
+    for _ in range(2):  # the second open checks the function against the stored config
+        client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+        collection = client.get_or_create_collection("Lab4Collection", embedding_function=function)
+    collection.add(ids=["a", "b"], documents=["homework is due friday", "final project report"])
+    results = collection.query(query_texts=["homework is due friday"], n_results=1)
+    assert results["ids"] == [["a"]]
+    assert function.hits == 1
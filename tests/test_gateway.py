@@ -0,0 +1,191 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+
+from gateway import LLMGateway, SharedStream, TokenBucket, request_key  # noqa: E402
+
+
+class SlowStream:
+    """
+    Upstream stream of words, one every delay seconds, that records close().
+    """
+
+    def __init__(self, words, delay=0.0):
+        self.words = list(words)
+        self.delay = delay
+        self.closed = False
+
+    def __iter__(self):
+        for word in self.words:
+            if self.closed:
+                return
+            time.sleep(self.delay)
+            yield word
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """
+    Offline stand-in for the OpenAI client surface the gateway uses.
+    """
+
+    def __init__(self, delay=0.05, words=("a", "b", "c")):
+        self.delay = delay
+        self.words = words
+        self.calls = 0
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self._lock = threading.Lock()
+
+    def with_options(self, **options):
+        return self
+
+    def _chat(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if kwargs.get("stream"):
+            stream = SlowStream(self.words)
+            self.streams.append(stream)
+            return stream
+        usage = SimpleNamespace(total_tokens=10)
+        return SimpleNamespace(usage=usage, text=kwargs["messages"][-1]["content"])
+
+    def _embed(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return SimpleNamespace(data=[], usage=None)
+
+
+def chat(gateway, content, **kwargs):
+    return gateway.chat.completions.create(
+        model="m", messages=[{"role": "user", "content": content}], **kwargs
+    )
+
+
+def test_request_key_ignores_argument_order():
+    assert request_key("chat", {"a": 1, "b": 2}) == request_key("chat", {"b": 2, "a": 1})
+    assert request_key("chat", {"a": 1}) != request_key("embeddings", {"a": 1})
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 per second
+    assert bucket.acquire(600) < 0.05
+    waited = bucket.acquire(2)
+    assert 0.1 < waited < 1.0
+
+
+def test_identical_concurrent_calls_are_coalesced():
+    client = FakeClient(delay=0.1)
+    gateway = LLMGateway(client)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(chat(gateway, "hi"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.calls == 1
+    assert {result.text for result in results} == {"hi"}
+    chat(gateway, "hi")
+    assert client.calls == 2  # finished calls are not reused
+
+
+def test_coalesced_stream_is_replayed_for_every_caller():
+    client = FakeClient(delay=0.1)
+    gateway = LLMGateway(client)
+    texts = []
+
+    def read():
+        texts.append(list(chat(gateway, "hi", stream=True)))
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.calls == 1
+    assert texts == [["a", "b", "c"]] * 3
+    assert client.streams[0].closed
+    assert gateway._running == 0
+
+
+def test_unclosed_exhausted_stream_frees_its_slot():
+    gateway = LLMGateway(FakeClient(delay=0), max_concurrency=1)
+    stream = chat(gateway, "one", stream=True)
+    assert list(stream) == ["a", "b", "c"]  # read to the end, never closed
+    done = threading.Event()
+    threading.Thread(target=lambda: (chat(gateway, "two"), done.set())).start()
+    assert done.wait(2)
+
+
+def test_closing_every_view_closes_upstream_and_later_views_are_refused():
+    finished = []
+    upstream = SlowStream(["a", "b", "c"])
+    shared = SharedStream(upstream, lambda: finished.append(True))
+    view = shared.view()
+    assert next(view) == "a"
+    view.close()
+    assert upstream.closed and finished == [True]
+    assert shared.view() is None
+
+
+def test_slow_fetch_does_not_block_readers_of_buffered_chunks():
+    upstream = SlowStream(["a", "b"], delay=0.0)
+    shared = SharedStream(upstream, lambda: None)
+    first, second = shared.view(), shared.view()
+    assert next(first) == "a"
+    upstream.delay = 0.5
+    threading.Thread(target=lambda: next(first)).start()  # slow fetch of "b"
+    time.sleep(0.05)
+    started = time.monotonic()
+    assert next(second) == "a"
+    assert time.monotonic() - started < 0.2
+
+
+def test_gateway_against_mock_server(openai_client):
+    gateway = LLMGateway(openai_client)
+    response = chat(gateway, "hello world")
+    assert response.choices[0].message.content
+    stream = chat(gateway, "hello world", stream=True)
+    text = "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+    assert "hello" in text
+    embeddings = gateway.embeddings.create(model="e", input=["a", "b"])
+    assert len(embeddings.data) == 2
+
+
+def test_leader_keeps_its_stream_when_a_follower_drains_it_first(monkeypatch):
+    import gateway as gateway_module
+
+    follower_done = threading.Event()
+
+    class SlowPublish(gateway_module.Future):
+        def set_result(self, result):
+            super().set_result(result)
+            follower_done.wait(2)  # let the follower read everything first
+
+    monkeypatch.setattr(gateway_module, "Future", SlowPublish)
+    gateway = LLMGateway(FakeClient(delay=0.1))
+    results = {}
+
+    def leader():
+        results["leader"] = list(chat(gateway, "hi", stream=True))
+
+    def follower():
+        while not gateway._inflight:
+            time.sleep(0.005)
+        results["follower"] = list(chat(gateway, "hi", stream=True))
+        follower_done.set()
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"leader": ["a", "b", "c"], "follower": ["a", "b", "c"]}
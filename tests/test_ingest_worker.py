@@ -0,0 +1,38 @@
+import time
+
+from ingest_worker import IngestWorker
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_failed_sync_is_not_retried_until_the_folder_changes(tmp_path):
+    calls = []
+
+    def sync(progress):
+        calls.append(time.monotonic())
+        raise RuntimeError("bad API key")
+
+    worker = IngestWorker(sync, str(tmp_path), rescan_interval=0.05).start()
+    worker.request_sync("startup")
+    wait_until(lambda: worker.status()["state"] == "error")
+    time.sleep(0.3)  # several folder checks
+    assert len(calls) == 1
+
+    (tmp_path / "new.pdf").write_bytes(b"%PDF")
+    wait_until(lambda: len(calls) == 2)
+
+    worker.request_sync("manual rescan")
+    wait_until(lambda: len(calls) == 3)
+
+
+def test_successful_sync_keeps_result(tmp_path):
+    worker = IngestWorker(lambda progress: "done", str(tmp_path), rescan_interval=0.05).start()
+    worker.request_sync("startup")
+    wait_until(lambda: worker.last_result == "done" and not worker.busy)
+    assert worker.status()["state"] == "idle"
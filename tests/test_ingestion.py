@@ -0,0 +1,59 @@
+import pytest
+
+PyPDF2 = pytest.importorskip("PyPDF2")
+
+import ingestion  # noqa: E402
+from pdf_text import PageCache, file_hash  # noqa: E402
+
+
+def write_pdf(path, num_pages):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(num_pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as file:
+        writer.write(file)
+    return str(path)
+
+
+def test_pages_come_back_in_document_order(tmp_path):
+    first = write_pdf(tmp_path / "a.pdf", 3)
+    second = write_pdf(tmp_path / "b.pdf", 2)
+    pages = list(ingestion.iter_pages([first, second], max_workers=2, pages_per_task=2))
+    assert [(f, n) for f, n, _ in pages] == [
+        (first, 0), (first, 1), (first, 2), (second, 0), (second, 1)
+    ]
+
+
+def test_unreadable_file_is_skipped_and_reported(tmp_path):
+    good = write_pdf(tmp_path / "a.pdf", 2)
+    broken = tmp_path / "b.pdf"
+    broken.write_bytes(b"not a pdf")
+    last = write_pdf(tmp_path / "c.pdf", 1)
+    errors = {}
+    pages = list(ingestion.iter_pages(
+        [good, str(broken), last],
+        max_workers=2,
+        on_error=lambda pdf_file, e: errors.setdefault(pdf_file, e),
+    ))
+    assert [f for f, _, _ in pages] == [good, good, last]
+    assert list(errors) == [str(broken)]
+
+
+def test_given_digests_are_not_computed_again(tmp_path, monkeypatch):
+    pdf_file = write_pdf(tmp_path / "a.pdf", 2)
+    digest = file_hash(pdf_file)
+    page_cache = PageCache(":memory:")
+
+    def no_hashing(path):
+        raise AssertionError("file hashed again")
+
+    monkeypatch.setattr(ingestion, "file_hash", no_hashing)
+    pages = list(ingestion.iter_pages(
+        [pdf_file], max_workers=1, page_cache=page_cache, digests={pdf_file: digest}
+    ))
+    assert len(pages) == 2
+    assert page_cache.is_complete(digest)
+    # The second pass is served from the cache
+    assert len(list(ingestion.iter_pages(
+        [pdf_file], max_workers=1, page_cache=page_cache, digests={pdf_file: digest}
+    ))) == 2
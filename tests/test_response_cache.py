@@ -0,0 +1,64 @@
+import sqlite3
+import time
+
+from response_cache import ResponseCache, key_scope, make_key
+
+
+def test_make_key_normalizes_prompt_and_scopes_by_key():
+    assert make_key("doc", "What  is it?", "m") == make_key("doc", "what is it?", "m")
+    assert make_key("doc", "q", "m") != make_key("doc", "q", "other")
+    assert make_key("doc", "q", "m", key_scope("sk-a")) != make_key("doc", "q", "m", key_scope("sk-b"))
+    assert "sk-a" not in key_scope("sk-a")
+
+
+def test_memory_tier_ttl_and_lru():
+    cache = ResponseCache(ttl=0.05, max_entries=2)
+    cache.put("a", "A")
+    assert cache.get("a") == "A"
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+    cache = ResponseCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") is None
+    assert cache.get("c") == "C"
+
+
+def test_sqlite_tier_survives_restart_and_is_capped(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(path=path, max_entries=1, max_rows=3)
+    for key in "abcd":
+        cache.put(key, key.upper())
+        time.sleep(0.01)
+    reopened = ResponseCache(path=path, max_rows=3)
+    assert reopened.get("a") is None  # least recently used row evicted
+    assert [reopened.get(key) for key in "bcd"] == ["B", "C", "D"]
+
+
+def test_recently_read_rows_survive_eviction(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(path=path, max_entries=1, max_rows=2)
+    cache.put("a", "A")
+    time.sleep(0.01)
+    cache.put("b", "B")
+    time.sleep(0.01)
+    assert cache.get("a") == "A"  # read from SQLite, refreshing it
+    time.sleep(0.01)
+    cache.put("c", "C")
+    fresh = ResponseCache(path=path)
+    assert fresh.get("a") == "A" and fresh.get("b") is None
+
+
+def test_old_database_without_last_used_is_upgraded(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO responses VALUES ('k', 'V', ?)", (time.time() + 60,))
+    conn.commit()
+    conn.close()
+    cache = ResponseCache(path=path)
+    assert cache.get("k") == "V"
+    cache.put("k2", "V2")
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+
+from bm25 import BM25Index  # noqa: E402
+from lab04 import retrieve_many  # noqa: E402
+from vector_store import MmapVectorStore  # noqa: E402
+
+DOCS = {
+    "a.pdf_0": "IST 652 Scripting for Data Analysis meets on Tuesdays.",
+    "a.pdf_1": "Homework is due every Friday before class.",
+    "b.pdf_0": "The final project is a data analysis report.",
+    "b.pdf_1": "Homework counts for forty percent of the grade.",
+}
+
+
+def embed(texts):
+    embed.calls.append(list(texts))
+    vectors = [np.random.default_rng(len(text)).normal(size=8) for text in texts]
+    return [(vector / np.linalg.norm(vector)).tolist() for vector in vectors]
+
+
+@pytest.fixture
+def index(tmp_path):
+    embed.calls = []
+    collection = MmapVectorStore(str(tmp_path / "store"), embed)
+    lexical = BM25Index()
+    collection.add(
+        documents=list(DOCS.values()),
+        metadatas=[{"source": doc_id.split("_")[0], "tokens": 9} for doc_id in DOCS],
+        ids=list(DOCS),
+    )
+    for doc_id, text in DOCS.items():
+        lexical.add(doc_id, text, doc_id.split("_")[0])
+    embed.calls.clear()
+    return collection, lexical
+
+
+def test_lexical_fast_path_skips_embedding_and_reads_text_from_the_collection(index):
+    collection, lexical = index
+    [chunks] = retrieve_many(collection, ["IST 652 Tuesdays"], 2, lexical, embed=embed)
+    assert embed.calls == []
+    assert chunks[0] == {
+        "id": "a.pdf_0", "text": DOCS["a.pdf_0"], "source": "a.pdf", "tokens": 9
+    }
+
+
+def test_only_unconfident_prompts_are_embedded(index):
+    collection, lexical = index
+    prompts = ["IST 652 Tuesdays", "homework"]
+    results = retrieve_many(collection, prompts, 2, lexical, embed=embed)
+    assert embed.calls == [["homework"]]
+    assert all(chunk["text"] == DOCS[chunk["id"]] for chunks in results for chunk in chunks)
+    assert len(results[1]) == 2
+    assert {"a.pdf_1", "b.pdf_1"} & {chunk["id"] for chunk in results[1]}
+
+
+def test_hits_removed_from_the_collection_are_dropped(index):
+    collection, lexical = index
+    collection.delete(ids=["a.pdf_0"])  # the BM25 index has not caught up yet
+    [chunks] = retrieve_many(collection, ["IST 652 Tuesdays"], 2, lexical, embed=embed)
+    assert "a.pdf_0" not in {chunk["id"] for chunk in chunks}
@@ -0,0 +1,41 @@
+from semantic_cache import SemanticCache, history_key
+
+
+def test_similar_question_with_same_chunks_hits():
+    cache = SemanticCache(threshold=0.95)
+    cache.store([1.0, 0.0], ["a", "b"], ["doc.pdf"], "gpt", "answer")
+    assert cache.lookup([0.99, 0.05], ["b", "a"], "gpt") == "answer"
+    assert cache.hits == 1
+
+
+def test_different_chunks_model_or_question_miss():
+    cache = SemanticCache(threshold=0.95)
+    cache.store([1.0, 0.0], ["a"], ["doc.pdf"], "gpt", "answer")
+    assert cache.lookup([1.0, 0.0], ["b"], "gpt") is None
+    assert cache.lookup([1.0, 0.0], ["a"], "other") is None
+    assert cache.lookup([0.0, 1.0], ["a"], "gpt") is None
+    assert cache.misses == 3
+
+
+def test_history_is_part_of_the_key():
+    first = [{"role": "user", "content": "What is IST 652?"}, {"role": "assistant", "content": "A course."}]
+    second = [{"role": "user", "content": "Who teaches IST 736?"}, {"role": "assistant", "content": "Someone."}]
+    assert history_key(first) != history_key(second)
+    assert history_key(first) == history_key(list(first))
+
+    cache = SemanticCache()
+    cache.store([1.0, 0.0], ["a"], ["doc.pdf"], "gpt", "more on 652", history_key(first))
+    assert cache.lookup([1.0, 0.0], ["a"], "gpt", history_key(second)) is None
+    assert cache.lookup([1.0, 0.0], ["a"], "gpt", history_key(first)) == "more on 652"
+
+
+def test_invalidate_sources_and_eviction():
+    cache = SemanticCache(max_entries=2)
+    cache.store([1.0, 0.0], ["a"], ["a.pdf"], "gpt", "A")
+    cache.store([0.0, 1.0], ["b"], ["b.pdf"], "gpt", "B")
+    cache.invalidate_sources(["a.pdf"])
+    assert len(cache) == 1
+    cache.store([1.0, 1.0], ["c"], ["c.pdf"], "gpt", "C")
+    cache.store([1.0, -1.0], ["d"], ["d.pdf"], "gpt", "D")
+    assert len(cache) == 2
+    assert cache.lookup([0.0, 1.0], ["b"], "gpt") is None
@@ -0,0 +1,80 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from streaming import CURSOR, StreamRenderer, stream_to
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.drawn = []
+
+    def markdown(self, text):
+        self.drawn.append(text)
+
+
+class FakeStream:
+    """
+    Iterates chunks shaped like OpenAI stream chunks and records close().
+    on_chunk(i) runs before chunk i is handed out.
+    """
+
+    def __init__(self, contents, on_chunk=None):
+        self.contents = contents
+        self.on_chunk = on_chunk or (lambda i: None)
+        self.closed = False
+
+    def __iter__(self):
+        for i, content in enumerate(self.contents):
+            self.on_chunk(i)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    def close(self):
+        self.closed = True
+
+
+def test_redraws_are_throttled_and_the_final_text_is_flushed():
+    placeholder = FakePlaceholder()
+    stream = FakeStream(["ab"] * 50)
+    # A frame interval no test run reaches, so only min_chars triggers redraws
+    text = stream_to(placeholder, stream, max_fps=1e-6, min_chars=20)
+
+    assert text == "ab" * 50
+    assert placeholder.drawn[0] == "ab" + CURSOR  # the first token shows at once
+    assert placeholder.drawn[-1] == text  # no cursor once done
+    assert len(placeholder.drawn) == 1 + (100 - 2) // 20 + 1
+    assert all(draw.endswith(CURSOR) for draw in placeholder.drawn[:-1])
+    assert stream.closed
+
+
+def test_stream_is_closed_when_the_script_is_interrupted():
+    class Interrupted(Exception):
+        """Stands in for the exception Streamlit raises to stop a rerun."""
+
+    def interrupt(i):
+        if i == 3:
+            raise Interrupted
+
+    stream = FakeStream(["a", "b", "c", "d", "e"], on_chunk=interrupt)
+    renderer = StreamRenderer(FakePlaceholder())
+    with pytest.raises(Interrupted):
+        renderer.render(stream)
+    assert stream.closed
+    assert renderer.text == "abc"
+
+
+def test_stop_keeps_the_partial_text():
+    cancel = threading.Event()
+
+    def stop_after_two(i):
+        if i == 2:
+            cancel.set()
+
+    placeholder = FakePlaceholder()
+    stream = FakeStream(["Hello", ", ", "world", "!"], on_chunk=stop_after_two)
+    renderer = StreamRenderer(placeholder, cancel=cancel)
+
+    assert renderer.render(stream) == "Hello, "
+    assert renderer.cancelled and stream.closed
+    assert placeholder.drawn[-1] == "Hello,  *(stopped)*"
@@ -0,0 +1,57 @@
+import threading
+from types import SimpleNamespace
+
+import summarizer
+
+
+class EchoClient:
+    """
+    Replies with a fixed number of words, however long the prompt was.
+    """
+
+    def __init__(self, reply_words):
+        self.reply_words = reply_words
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages):
+        with self._lock:
+            self.calls += 1
+        text = " ".join(["word"] * self.reply_words) + "."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def document(words):
+    return " ".join(f"Sentence {i} says something." for i in range(words // 4))
+
+
+def test_short_document_is_one_call(encoding):
+    client = EchoClient(10)
+    summarizer.summarize(client, "m", document(400), "100 words", encoding=encoding)
+    assert client.calls == 1
+
+
+def test_map_reduce_folds_partials(encoding):
+    client = EchoClient(50)
+    stages = []
+    summarizer.summarize(
+        client, "m", document(20_000), "100 words", encoding=encoding,
+        on_progress=lambda stage, done, total, partial: stages.append(stage),
+    )
+    assert "map" in stages
+    assert client.calls == stages.count("map") + stages.count("reduce") + 1
+
+
+def test_reduce_terminates_when_summaries_do_not_shrink(encoding, monkeypatch):
+    # Every partial is as long as a whole reduce input, so merging never
+    # lowers the number of groups
+    monkeypatch.setattr(summarizer, "REDUCE_INPUT_TOKENS", 1000)
+    client = EchoClient(900)
+    summarizer.summarize(client, "m", document(20_000), "100 words", encoding=encoding)
+    map_calls = len(summarizer.chunk_text(
+        document(20_000), encoding=encoding,
+        max_tokens=summarizer.MAP_CHUNK_TOKENS, overlap_tokens=summarizer.MAP_OVERLAP_TOKENS,
+    ))
+    # map, at most one unproductive reduce round, then the final call
+    assert client.calls <= 2 * map_calls + 1
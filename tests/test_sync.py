@@ -0,0 +1,196 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("PyPDF2")
+
+from bm25 import BM25Index  # noqa: E402
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, hash_embedding  # noqa: E402
+from lab04 import COLLECTION_NAME, MANIFEST_NAME, sync_vector_db  # noqa: E402
+from pdf_text import PageCache  # noqa: E402
+from vector_store import MmapVectorStore  # noqa: E402
+
+
+def pdf_bytes(pages):
+    """
+    A minimal PDF with one page of Helvetica text per entry in pages.
+    """
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 12 Tf 72 720 Td ({escaped}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n".encode()
+    out += f"startxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def open_chroma(path, embedding_function):
+    chromadb = pytest.importorskip("chromadb")
+    client = chromadb.PersistentClient(path=path)
+    return client.get_or_create_collection(COLLECTION_NAME, embedding_function=embedding_function)
+
+
+@pytest.fixture(params=["chroma", "mmap"])
+def corpus(request, tmp_path, encoding):
+    """
+    An empty Data/ folder and a sync() that indexes it into a fresh
+    collection of the given backend under tmp_path.
+    """
+    folder = tmp_path / "Data"
+    folder.mkdir()
+    directory = str(tmp_path / "index")
+    function = CachedEmbeddingFunction(
+        hash_embedding, "test", EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    )
+    if request.param == "chroma":
+        collection = open_chroma(directory, function)
+    else:
+        collection = MmapVectorStore(directory, function)
+    lexical = BM25Index()
+    page_cache = PageCache(str(tmp_path / "pages.sqlite3"))
+
+    def sync():
+        return sync_vector_db(
+            collection, str(folder), encoding=encoding, lexical=lexical,
+            page_cache=page_cache, directory=directory,
+        )
+
+    return folder, directory, collection, lexical, sync
+
+
+def write_pdf(folder, name, *pages):
+    path = folder / name
+    path.write_bytes(pdf_bytes(pages))
+    return str(path)
+
+
+def indexed_texts(collection):
+    """
+    {source: sorted chunk texts} of everything in the collection.
+    """
+    stored = collection.get(include=["documents", "metadatas"])
+    texts = {}
+    for text, metadata in zip(stored["documents"], stored["metadatas"]):
+        texts.setdefault(metadata["source"], []).append(text)
+    return {source: sorted(chunks) for source, chunks in texts.items()}
+
+
+def lexical_sources(lexical):
+    return {doc["source"] for doc in lexical.docs.values()}
+
+
+def test_new_files_are_indexed_and_recorded_in_the_manifest(corpus):
+    folder, directory, collection, lexical, sync = corpus
+    syllabus = write_pdf(
+        folder, "syllabus.pdf", "Homework is due every Friday.", "Exams are in May."
+    )
+    notes = write_pdf(folder, "notes.pdf", "Office hours are on Tuesday.")
+
+    added, updated, removed, stats = sync()
+
+    assert sorted(added) == sorted([syllabus, notes]) and updated == removed == []
+    assert stats.pages == 3 and not stats.failed
+    texts = indexed_texts(collection)
+    assert "Friday" in " ".join(texts[syllabus]) and "May" in " ".join(texts[syllabus])
+    assert "Tuesday" in " ".join(texts[notes])
+    assert lexical_sources(lexical) == {syllabus, notes}
+    with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as file:
+        assert set(json.load(file)) == {syllabus, notes}
+
+    # Nothing changed, so nothing is re-read or re-embedded
+    assert sync() == ([], [], [], None)
+
+
+def test_changed_file_replaces_its_old_chunks(corpus):
+    folder, _, collection, lexical, sync = corpus
+    syllabus = write_pdf(folder, "syllabus.pdf", "Homework is due every Friday.")
+    notes = write_pdf(folder, "notes.pdf", "Office hours are on Tuesday.")
+    sync()
+    notes_before = indexed_texts(collection)[notes]
+
+    write_pdf(folder, "syllabus.pdf", "Homework is due every Monday.")
+    added, updated, removed, stats = sync()
+
+    assert (added, updated, removed) == ([], [syllabus], [])
+    assert stats.files == 1
+    texts = indexed_texts(collection)
+    assert "Monday" in " ".join(texts[syllabus]) and "Friday" not in " ".join(texts[syllabus])
+    assert texts[notes] == notes_before
+    assert [doc_id for doc_id, _ in lexical.search("Friday")] == []
+    assert lexical.search("Monday")[0][0].startswith(syllabus)
+
+
+def test_deleted_file_is_removed_from_every_index(corpus):
+    folder, directory, collection, lexical, sync = corpus
+    syllabus = write_pdf(folder, "syllabus.pdf", "Homework is due every Friday.")
+    notes = write_pdf(folder, "notes.pdf", "Office hours are on Tuesday.")
+    sync()
+
+    os.remove(syllabus)
+    added, updated, removed, stats = sync()
+
+    assert (added, updated, removed, stats) == ([], [], [syllabus], None)
+    assert set(indexed_texts(collection)) == {notes}
+    assert lexical_sources(lexical) == {notes}
+    with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as file:
+        assert set(json.load(file)) == {notes}
+
+
+def test_unreadable_pdf_is_reported_once_and_leaves_nothing_behind(corpus):
+    folder, directory, collection, lexical, sync = corpus
+    notes = write_pdf(folder, "notes.pdf", "Office hours are on Tuesday.")
+    broken = str(folder / "broken.pdf")
+    with open(broken, "wb") as file:
+        file.write(b"%PDF-1.4\nthis is not really a PDF\n")
+
+    added, updated, removed, stats = sync()
+
+    assert (added, updated, removed) == ([notes], [], [])
+    assert set(stats.failed) == {broken}
+    assert set(indexed_texts(collection)) == {notes}
+    assert lexical_sources(lexical) == {notes}
+    with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as file:
+        assert set(json.load(file)) == {notes, broken}
+
+    # Not tried again until it changes
+    assert sync() == ([], [], [], None)
+    write_pdf(folder, "broken.pdf", "Fixed at last.")
+    added, _, _, stats = sync()
+    assert added == [] and not stats.failed
+    assert "Fixed" in " ".join(indexed_texts(collection)[broken])
+
+
+def test_indexed_file_that_becomes_unreadable_counts_as_removed(corpus):
+    folder, _, collection, lexical, sync = corpus
+    syllabus = write_pdf(folder, "syllabus.pdf", "Homework is due every Friday.")
+    sync()
+
+    with open(syllabus, "wb") as file:
+        file.write(b"%PDF-1.4\ntruncated")
+    added, updated, removed, stats = sync()
+
+    assert (added, updated, removed) == ([], [], [syllabus])
+    assert set(stats.failed) == {syllabus}
+    assert indexed_texts(collection) == {} and len(lexical) == 0
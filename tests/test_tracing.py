@@ -0,0 +1,75 @@
+import json
+import urllib.request
+
+import tracing
+from tracing import Registry
+
+
+def test_span_and_count_feed_the_trace_and_the_registry(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    with tracing.trace("page", path=path) as active:
+        with tracing.span("test.stage"):
+            pass
+        tracing.count("test.event")
+        tracing.count("test.event", 2)
+    tracing.count("test.event")  # outside any trace: registry only
+
+    assert [name for name, _ in active.spans] == ["test.stage"]
+    assert active.counters == {"test.event": 3}
+    assert tracing.REGISTRY.timings["test.stage"][0] >= 1
+    assert tracing.REGISTRY.counters["test.event"] >= 4
+
+    with open(path, encoding="utf-8") as file:
+        [entry] = [json.loads(line) for line in file]
+    assert entry["trace"] == "page"
+    assert [span["stage"] for span in entry["spans"]] == ["test.stage"]
+    assert entry["counters"] == {"test.event": 3}
+
+
+def test_trace_without_spans_writes_nothing(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    with tracing.trace("page", path=str(path)):
+        tracing.count("test.quiet")
+    assert not path.exists()
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    registry.observe("embed", 0.5)
+    registry.observe("embed", 1.5)
+    registry.inc("cache.hit", 3)
+    registry.set("queue_depth", 2)
+
+    lines = registry.prometheus().splitlines()
+    assert 'lab_stage_seconds_count{stage="embed"} 2' in lines
+    assert 'lab_stage_seconds_sum{stage="embed"} 2.000000' in lines
+    assert 'lab_stage_seconds_max{stage="embed"} 1.500000' in lines
+    assert 'lab_events_total{event="cache.hit"} 3' in lines
+    assert 'lab_gauge{name="queue_depth"} 2' in lines
+    assert "# TYPE lab_events_total counter" in lines
+
+
+def test_metrics_file_is_rotated_past_the_cap(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for i in range(10):
+        tracing._append_jsonl(path, {"i": i}, max_bytes=30)
+
+    with open(path, encoding="utf-8") as file:
+        current = [json.loads(line)["i"] for line in file]
+    with open(path + ".1", encoding="utf-8") as file:
+        previous = [json.loads(line)["i"] for line in file]
+    assert previous + current == list(range(previous[0], 10))
+    assert current[-1] == 9 and len(current) <= 3
+
+
+def test_metrics_are_served_on_localhost():
+    tracing.count("test.served")
+    server = tracing.serve_metrics(0)
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+        assert 'lab_events_total{event="test.served"}' in body
+    finally:
+        server.shutdown()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from chunker import Chunk
+from embedding_cache import hash_embedding
+from upload_index import SOURCE, UploadIndex
+
+
+def test_build_chunks_and_embeds_the_document_once(encoding):
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return hash_embedding(texts, dim=32)
+
+    document = " ".join(f"Sentence {i} is about topic {i % 7}." for i in range(400))
+    index = UploadIndex.build("digest", document, embed, encoding=encoding)
+
+    assert len(index) > 1 and len(calls) == 1
+    assert [chunk["id"] for chunk in index.chunks] == [f"{SOURCE}_{i}" for i in range(len(index))]
+    assert all(chunk["source"] == SOURCE and chunk["tokens"] for chunk in index.chunks)
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+
+
+def test_search_returns_the_most_similar_chunks_first():
+    chunks = [Chunk("north", 1), Chunk("east", 1), Chunk("north-east", 2)]
+    index = UploadIndex("digest", chunks, [[0, 3], [2, 0], [1, 1]])
+
+    results = index.search([0.1, 1.0], n_results=2)
+    assert [chunk["text"] for chunk in results] == ["north", "north-east"]
+    assert results[0]["score"] > results[1]["score"]
+    assert [chunk["text"] for chunk in index.search([1, 0], n_results=10)] == [
+        "east", "north-east", "north"
+    ]
+
+
+def test_zero_vectors_and_empty_documents_are_harmless():
+    index = UploadIndex("digest", [Chunk("blank", 0)], [[0.0, 0.0]])
+    assert index.search([1.0, 0.0])[0]["score"] == 0.0
+
+    empty = UploadIndex("digest", [], [])
+    assert len(empty) == 0 and empty.search([1.0, 0.0]) == []
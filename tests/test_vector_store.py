@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from vector_store import HALF_SCALE, MmapVectorStore, _widen_half
+
+
+def unit_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def add_documents(store, count, dim=16):
+    store.add(
+        documents=[f"chunk {i}" for i in range(count)],
+        metadatas=[{"source": f"doc{i % 3}.pdf"} for i in range(count)],
+        ids=[f"id{i}" for i in range(count)],
+        embeddings=unit_vectors(count, dim),
+    )
+
+
+def test_empty_store_get_and_query(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    assert store.count() == 0
+    assert store.get(include=["documents", "metadatas"]) == {
+        "ids": [], "documents": [], "metadatas": []
+    }
+    results = store.query(query_embeddings=unit_vectors(2).tolist(), n_results=3)
+    assert results["ids"] == [[], []]
+    assert results["documents"] == [[], []]
+
+
+def test_add_empty_batch_is_a_no_op(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    store.add(documents=[], ids=[])
+    add_documents(store, 4)
+    store.add(documents=[], metadatas=[], ids=[], embeddings=[])
+    assert store.count() == 4
+    assert MmapVectorStore(str(tmp_path / "store")).count() == 4
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_query_finds_nearest(tmp_path, dtype):
+    store = MmapVectorStore(str(tmp_path / "store"), dtype=dtype)
+    add_documents(store, 50)
+    vectors = unit_vectors(50)
+    results = store.query(query_embeddings=vectors[[7, 21]].tolist(), n_results=1)
+    assert results["ids"] == [["id7"], ["id21"]]
+    assert results["documents"][0] == ["chunk 7"]
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=0.02)
+
+
+def test_where_source_filters(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    add_documents(store, 30)
+    results = store.query(
+        query_embeddings=unit_vectors(1, seed=5).tolist(),
+        n_results=30,
+        where={"source": "doc1.pdf"},
+    )
+    assert results["ids"][0]
+    assert all(m["source"] == "doc1.pdf" for m in results["metadatas"][0])
+
+
+def test_delete_compact_and_reopen(tmp_path):
+    path = str(tmp_path / "store")
+    store = MmapVectorStore(path)
+    add_documents(store, 30)
+    store.delete(where={"source": "doc0.pdf"})
+    store.compact()
+    assert store.count() == 20
+
+    reopened = MmapVectorStore(path)
+    assert reopened.count() == 20
+    assert not reopened.get(where={"source": "doc0.pdf"})["ids"]
+    results = reopened.query(query_embeddings=unit_vectors(30)[[4]].tolist(), n_results=1)
+    assert results["ids"] == [["id4"]]
+
+
+def test_widen_half_is_exact():
+    values = np.concatenate([
+        np.random.default_rng(1).normal(size=1000) / 40,
+        [0.0, -0.0, 6e-8, -6e-8, 3e-5, -1.0, 1.0, 65504.0],
+    ]).astype(np.float16)
+    out = np.empty(len(values), dtype=np.float32)
+    _widen_half(values, out)
+    assert np.array_equal(out * HALF_SCALE, values.astype(np.float32))
+
+
+CRASH_SCRIPT = """
+import os, sys
+sys.path[:0] = [{repo!r}, {tests!r}]
+from test_vector_store import add_documents
+from vector_store import MmapVectorStore
+
+store = MmapVectorStore({path!r}, dtype={dtype!r})
+add_documents(store, 30)
+store.delete(where={{"source": "doc0.pdf"}})  # below the automatic compaction ratio
+os.{hook} = lambda *args: os._exit(3)  # die at the switch, or just after it
+store.compact()
+"""
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+@pytest.mark.parametrize("hook", ["replace", "remove"])
+def test_compaction_killed_midway_leaves_a_consistent_store(tmp_path, dtype, hook):
+    path = str(tmp_path / "store")
+    script = CRASH_SCRIPT.format(
+        repo=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        tests=os.path.dirname(os.path.abspath(__file__)),
+        path=path, dtype=dtype, hook=hook,
+    )
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 3
+
+    store = MmapVectorStore(path)
+    assert store.count() == 20
+    assert sorted(os.listdir(path)) == sorted(
+        os.path.basename(p) for p in (store._log_path, store._vectors_path, store._scales_path)
+        if os.path.exists(p)
+    )
+    vectors = unit_vectors(30)
+    results = store.query(query_embeddings=vectors[[4, 29]].tolist(), n_results=1)
+    assert results["ids"] == [["id4"], ["id29"]]
+    assert results["documents"] == [["chunk 4"], ["chunk 29"]]
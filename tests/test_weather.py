@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from weather import WeatherClient, WeatherError, normalize_city, weather_bucket
+
+REPORT = {
+    "main": {"temp": 293.15, "temp_min": 290.15, "temp_max": 295.15, "feels_like": 292.15, "humidity": 60},
+    "weather": [{"description": "clear sky"}],
+}
+
+
+class WeatherHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        city = parse_qs(urlparse(self.path).query)["q"][0]
+        self.requests.append(city)
+        status, body = {
+            "nowhere": (404, b'{"message": "city not found"}'),
+            "garbled": (200, b"<html>oops</html>"),
+            "partial": (200, json.dumps({"main": {}, "weather": []}).encode()),
+            "broken": (500, b"{}"),
+        }.get(city, (200, json.dumps(REPORT).encode()))
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def weather_url():
+    WeatherHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WeatherHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_normalize_and_bucket():
+    assert normalize_city(" Syracuse, NY ") == "syracuse"
+    weather = {"temperature": 20.9, "feels_like": 19.1, "weather_description": "rain"}
+    assert weather_bucket(weather) == (20, 20, "rain")
+
+
+def test_current_parses_and_caches(weather_url):
+    client = WeatherClient("key", base_url=weather_url)
+    weather = client.current("Syracuse, NY")
+    assert weather["location"] == "Syracuse"
+    assert weather["temperature"] == 20.0
+    assert weather["weather_description"] == "clear sky"
+    client.current("syracuse")
+    assert WeatherHandler.requests == ["syracuse"]
+
+
+def test_expired_entries_are_refetched_and_cache_is_bounded(weather_url):
+    client = WeatherClient("key", base_url=weather_url, ttl=0, max_entries=2)
+    client.current("a")
+    client.current("a")
+    assert WeatherHandler.requests == ["a", "a"]
+
+    client = WeatherClient("key", base_url=weather_url, max_entries=2)
+    for city in ("a", "b", "c"):
+        client.current(city)
+    assert list(client._cache) == ["b", "c"]
+
+
+@pytest.mark.parametrize("city", ["nowhere", "garbled", "partial"])
+def test_error_payloads_raise_weather_error(weather_url, city):
+    client = WeatherClient("key", base_url=weather_url)
+    with pytest.raises(WeatherError):
+        client.current(city)
+
+
+def test_server_errors_are_retried_then_reported(weather_url):
+    client = WeatherClient("key", base_url=weather_url, retries=1, backoff_factor=0)
+    with pytest.raises(WeatherError):
+        client.current("broken")
+    assert WeatherHandler.requests == ["broken", "broken"]
+
+
+def test_current_many_keeps_order_and_errors(weather_url):
+    client = WeatherClient("key", base_url=weather_url)
+    results = client.current_many(["Paris", "nowhere", "Rome"])
+    assert list(results) == ["Paris", "nowhere", "Rome"]
+    assert isinstance(results["nowhere"], WeatherError)
+    assert results["Rome"]["location"] == "Rome"
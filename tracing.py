@@ -0,0 +1,220 @@
+"""
+Lightweight per-request tracing: spans, counters and metrics export.
+
+Wrap a page run in trace(), time its stages with span() (or record() for
+durations measured by hand, such as time-to-first-token) and bump counters
+with count(). Every observation also feeds a process-wide registry that can be
+served in Prometheus text format, and each finished trace is appended to a
+JSONL file so operators can see whether the embedder, retriever or model is
+the slow part.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PATH = os.path.join(".cache", "metrics.jsonl")
+MAX_METRICS_BYTES = 10 * 1024 * 1024  # metrics file is rotated to <path>.1 past this
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Registry:
+    """
+    Process-wide counters, gauges and timing summaries (count, sum, max).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}  # name -> [count, total_seconds, max_seconds]
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stat = self.timings.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def prometheus(self):
+        """
+        Renders the registry in the Prometheus text exposition format.
+        """
+        lines = [
+            "# TYPE lab_stage_seconds summary",
+            "# TYPE lab_stage_seconds_max gauge",
+        ]
+        with self._lock:
+            for name, (count, total, longest) in sorted(self.timings.items()):
+                label = f'{{stage="{name}"}}'
+                lines.append(f"lab_stage_seconds_count{label} {count}")
+                lines.append(f"lab_stage_seconds_sum{label} {total:.6f}")
+                lines.append(f"lab_stage_seconds_max{label} {longest:.6f}")
+            lines.append("# TYPE lab_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'lab_events_total{{event="{name}"}} {value}')
+            lines.append("# TYPE lab_gauge gauge")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f'lab_gauge{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Trace:
+    """
+    Timing breakdown of one request (one Streamlit rerun of a page).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.elapsed = 0.0
+        self.spans = []  # (stage, seconds) in completion order
+        self.counters = {}
+
+    def as_dict(self):
+        return {
+            "ts": self.started,
+            "trace": self.name,
+            "seconds": round(self.elapsed, 6),
+            "spans": [{"stage": name, "seconds": round(s, 6)} for name, s in self.spans],
+            "counters": self.counters,
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+def record(name, seconds):
+    """
+    Records a duration measured by the caller.
+    """
+    REGISTRY.observe(name, seconds)
+    active = _current.get()
+    if active is not None:
+        active.spans.append((name, seconds))
+
+
+def count(name, value=1):
+    REGISTRY.inc(name, value)
+    active = _current.get()
+    if active is not None:
+        active.counters[name] = active.counters.get(name, 0) + value
+
+
+def gauge(name, value):
+    """
+    Sets a process-wide level, such as a queue depth. Not part of traces.
+    """
+    REGISTRY.set(name, value)
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as stage name.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+@contextmanager
+def trace(name, path=METRICS_PATH):
+    """
+    Collects spans recorded in this context; appends them to path on exit.
+    """
+    active = Trace(name)
+    token = _current.set(active)
+    started = time.perf_counter()
+    try:
+        yield active
+    finally:
+        _current.reset(token)
+        active.elapsed = time.perf_counter() - started
+        REGISTRY.observe("request", active.elapsed)
+        if path and active.spans:
+            _append_jsonl(path, active.as_dict())
+
+
+_write_lock = threading.Lock()
+
+
+def _append_jsonl(path, entry, max_bytes=MAX_METRICS_BYTES):
+    """
+    Appends entry to path. Once path reaches max_bytes it replaces the
+    single backup <path>.1, so the two never hold much more than 2 * max_bytes.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps(entry) + "\n"
+    with _write_lock:
+        try:
+            if os.path.getsize(path) + len(line) > max_bytes:
+                os.replace(path, path + ".1")
+        except FileNotFoundError:
+            pass
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(line)
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serves REGISTRY at http://host:port/metrics on a daemon thread. Only
+    local scrapers can reach it unless host says otherwise.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def show_trace(active):
+    """
+    Renders a trace's per-stage timing breakdown in the Streamlit sidebar.
+    """
+    import streamlit as st
+
+    if not active.spans:
+        return
+    totals = {}
+    for name, seconds in active.spans:
+        calls, total = totals.get(name, (0, 0.0))
+        totals[name] = (calls + 1, total + seconds)
+    with st.sidebar.expander("⏱ Timing breakdown"):
+        st.table([
+            {"Stage": name, "Calls": calls, "ms": round(total * 1000, 1)}
+            for name, (calls, total) in totals.items()
+        ])
+        st.caption(f"Whole rerun: {active.elapsed * 1000:.0f} ms")
@@ -0,0 +1,60 @@
+"""
+Ephemeral in-memory vector index for one uploaded document.
+
+The upload is chunked and embedded once; the vectors live in a single
+L2-normalised float32 NumPy matrix, so each question costs one query
+embedding and one matrix-vector product, and only the best chunks are sent
+to the model instead of the whole document.
+"""
+import numpy as np
+
+from chunker import chunk_text
+
+TOP_K = 8  # candidates handed to the context packer
+SOURCE = "upload"
+
+
+class UploadIndex:
+    """
+    Chunks of one document and their unit vectors, keyed by content digest.
+    """
+
+    def __init__(self, digest, chunks, vectors):
+        self.digest = digest
+        self.chunks = [
+            {"id": f"{SOURCE}_{i}", "text": chunk.text, "source": SOURCE, "tokens": chunk.tokens}
+            for i, chunk in enumerate(chunks)
+        ]
+        if not self.chunks:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = matrix / norms
+
+    @classmethod
+    def build(cls, digest, document, embed, encoding=None):
+        """
+        Chunks document and embeds every chunk with embed (texts -> vectors).
+        """
+        chunks = chunk_text(document, encoding=encoding)
+        vectors = embed([chunk.text for chunk in chunks]) if chunks else []
+        return cls(digest, chunks, vectors)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query_vector, n_results=TOP_K):
+        """
+        Returns up to n_results chunk dicts, most similar first.
+        """
+        if not self.chunks:
+            return []
+        query = np.array(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self.matrix @ query
+        k = min(n_results, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.chunks[i], score=float(scores[i])) for i in top]
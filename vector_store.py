@@ -0,0 +1,469 @@
+"""
+Pluggable vector stores for the lab04 document index.
+
+A store is anything with the part of the Chroma collection API that lab04
+and ingestion use:
+
+    add(documents, metadatas, ids, embeddings=None)
+    query(n_results, query_texts=None, query_embeddings=None, where=None, include=None)
+    get(ids=None, where=None, include=None)
+    delete(ids=None, where=None)
+    count()
+
+Chroma collections satisfy it as they are. MmapVectorStore is a built-in
+alternative that needs neither chromadb nor the pysqlite3 swap: unit vectors
+are stored as float16 or int8 rows in a memory-mapped file and searched
+exactly with blocked matrix products, while documents and metadata stay on
+disk in an append-only log and only their offsets are held in memory.
+"""
+import json
+import os
+import threading
+from array import array
+
+import numpy as np
+
+BACKENDS = ("chroma", "mmap")
+DTYPES = ("float16", "int8")
+SEARCH_BLOCK = 1024  # rows scored per matrix product; small blocks stay in cache
+COMPACT_RATIO = 0.5  # rewrite the files once this share of rows is deleted
+DEFAULT_INCLUDE = ("documents", "metadatas", "distances")
+HALF_SCALE = np.float32(2.0 ** 112)  # see _widen_half
+_HALF_MASK = np.int32(-0x70000001)  # 0x8fffffff as a signed 32-bit value
+
+
+def normalize(vectors):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors, dtype):
+    """
+    Encodes unit vectors as dtype rows. Returns (rows, per-row scales or None).
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    rows = np.round(vectors / scales[:, None]).astype(np.int8)
+    return rows, scales.astype(np.float32)
+
+
+def _widen_half(block, out):
+    """
+    Writes float16 rows into the float32 array out, divided by HALF_SCALE.
+
+    Shifting the half-precision bits into float32 position with integer
+    operations is several times faster than numpy's float16 cast, and exact
+    for every finite value (the 2**-112 exponent offset is what HALF_SCALE
+    undoes; subnormals come out right too).
+    """
+    bits = out.view(np.int32)
+    np.copyto(bits, block.view(np.int16))  # sign-extends into bits 31..16
+    np.left_shift(bits, 13, out=bits)
+    np.bitwise_and(bits, _HALF_MASK, out=bits)  # keep the sign, drop its extension
+
+
+def _matches(metadata, where):
+    return all((metadata or {}).get(key) == value for key, value in where.items())
+
+
+class MmapVectorStore:
+    """
+    Exact-search vector store in a directory of flat files.
+
+    vectors.<dtype> holds the quantized rows, scales.f32 the per-row int8
+    scales, and records.jsonl an append-only log of adds and deletes that is
+    replayed on open. Compaction writes vectors.<epoch>.<dtype> and
+    scales.<epoch>.f32 and names the epoch in the log's header. dtype is only used for a new store; an existing one
+    keeps the dtype it was created with. Thread-safe: queries can run while
+    another thread adds.
+    """
+
+    def __init__(self, path, embedding_function=None, dtype="float16"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, not {dtype!r}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.dim = None
+        self._log_path = os.path.join(path, "records.jsonl")
+        self._lock = threading.RLock()
+        self._local = threading.local()  # per-thread search buffers
+        self._load()
+
+    def _epoch_paths(self, epoch):
+        """
+        (vectors, scales) file paths of a compaction epoch; epoch 0 is the
+        store as first written.
+        """
+        suffix = f".{epoch}" if epoch else ""
+        return (
+            os.path.join(self.path, f"vectors{suffix}.{self.dtype}"),
+            os.path.join(self.path, f"scales{suffix}.f32"),
+        )
+
+    @property
+    def _vectors_path(self):
+        return self._epoch_paths(self._epoch)[0]
+
+    @property
+    def _scales_path(self):
+        return self._epoch_paths(self._epoch)[1]
+
+    def _reset(self):
+        self._ids = []  # row -> id
+        self._offsets = array("q")  # row -> byte offset of its log line
+        self._alive = bytearray()  # row -> 1 while not deleted
+        self._rows = {}  # id -> row of its live copy
+        self._by_source = {}  # source -> array of rows
+        self._deleted = 0
+        self._matrix = None
+        self._scales = None
+        # Bumped whenever row numbers change (compaction), so a query that
+        # searched a stale snapshot knows to start over
+        self._generation = getattr(self, "_generation", 0) + 1
+
+    def _load(self):
+        self._reset()
+        self._epoch = 0
+        if not os.path.exists(self._log_path):
+            return
+        good = 0
+        with open(self._log_path, "rb") as file:
+            offset = 0
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn write from a crash; drop it
+                self._replay(entry, offset)
+                offset += len(line)
+                good = offset
+        if good != os.path.getsize(self._log_path):
+            with open(self._log_path, "r+b") as file:
+                file.truncate(good)
+        # Likewise drop vector rows written before a crash cut off their log
+        if self.dim is not None:
+            rows = len(self._ids)
+            for path, row_bytes in (
+                (self._vectors_path, self.dim * np.dtype(self.dtype).itemsize),
+                (self._scales_path, 4),
+            ):
+                if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                    with open(path, "r+b") as file:
+                        file.truncate(rows * row_bytes)
+        self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        """
+        Deletes files of other epochs (and a half-written log) that an
+        interrupted or finished compaction left behind.
+        """
+        current = {self._vectors_path, self._scales_path, self._log_path}
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if path not in current and name.startswith(("vectors.", "scales.", "records.")):
+                os.remove(path)
+
+    def _replay(self, entry, offset):
+        op = entry["op"]
+        if op == "init":
+            self.dim, self.dtype = entry["dim"], entry["dtype"]
+            self._epoch = entry.get("epoch", 0)
+        elif op == "add":
+            self._append_row(entry["id"], (entry.get("metadata") or {}).get("source"), offset)
+        elif op == "delete":
+            for doc_id in entry["ids"]:
+                self._kill(doc_id)
+
+    def _append_row(self, doc_id, source, offset):
+        if doc_id in self._rows:
+            self._kill(doc_id)
+        row = len(self._ids)
+        self._ids.append(doc_id)
+        self._offsets.append(offset)
+        self._alive.append(1)
+        self._rows[doc_id] = row
+        self._by_source.setdefault(source, array("q")).append(row)
+
+    def _kill(self, doc_id):
+        row = self._rows.pop(doc_id, None)
+        if row is not None:
+            self._alive[row] = 0
+            self._deleted += 1
+
+    def _view(self):
+        """
+        (matrix, scales) memory maps over every row written so far.
+        """
+        rows = len(self._ids)
+        if not rows:
+            return None, None
+        if self._matrix is None or len(self._matrix) != rows:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim)
+            )
+            if self.dtype == "int8":
+                self._scales = np.memmap(
+                    self._scales_path, dtype=np.float32, mode="r", shape=(rows,)
+                )
+        return self._matrix, self._scales
+
+    def _read_records(self, rows):
+        records = []
+        if not len(rows):
+            return records  # the log may not exist yet
+        with open(self._log_path, "rb") as file:
+            for row in rows:
+                file.seek(self._offsets[row])
+                records.append(json.loads(file.readline()))
+        return records
+
+    def _write_log(self, entries):
+        with open(self._log_path, "ab") as file:
+            offsets = []
+            for entry in entries:
+                offsets.append(file.tell())
+                file.write(json.dumps(entry).encode("utf-8") + b"\n")
+        return offsets
+
+    def count(self):
+        with self._lock:
+            return len(self._rows)
+
+    def add(self, documents, metadatas=None, ids=None, embeddings=None):
+        """
+        Adds (or replaces) documents. Embeds them with embedding_function
+        unless embeddings are given; embedding happens outside the lock.
+        """
+        documents = list(documents)
+        if not documents:
+            return
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(documents)
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        rows, scales = quantize(normalize(embeddings), self.dtype)
+
+        with self._lock:
+            entries = []
+            if self.dim is None:
+                self.dim = rows.shape[1]
+                entries.append({"op": "init", "dim": self.dim, "dtype": self.dtype})
+            elif rows.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {rows.shape[1]}")
+
+            # Vectors first: a crash then leaves extra rows the log ignores
+            with open(self._vectors_path, "ab") as file:
+                file.write(rows.tobytes())
+            if scales is not None:
+                with open(self._scales_path, "ab") as file:
+                    file.write(scales.tobytes())
+
+            entries.extend(
+                {"op": "add", "id": doc_id, "document": document, "metadata": metadata}
+                for doc_id, document, metadata in zip(ids, documents, metadatas)
+            )
+            offsets = self._write_log(entries)[-len(documents):]
+            for doc_id, metadata, offset in zip(ids, metadatas, offsets):
+                self._append_row(doc_id, (metadata or {}).get("source"), offset)
+
+    def _select(self, where):
+        """
+        Live rows matching where, or None for all rows. Equality filters on
+        "source" use the in-memory source index; others read the log.
+        """
+        if not where:
+            return None
+        if set(where) == {"source"}:
+            rows = np.frombuffer(
+                self._by_source.get(where["source"], array("q")), dtype=np.int64
+            ).copy()  # a view would pin the array and block further appends
+        else:
+            rows = np.flatnonzero(np.frombuffer(bytes(self._alive), dtype=np.uint8))
+            records = self._read_records(rows)
+            rows = rows[[_matches(r.get("metadata"), where) for r in records]]
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        return rows[alive[rows]] if len(rows) else rows
+
+    def query(
+        self,
+        query_embeddings=None,
+        query_texts=None,
+        n_results=10,
+        where=None,
+        include=DEFAULT_INCLUDE,
+    ):
+        """
+        Exact cosine search. Returns Chroma-shaped results: one list per
+        query under "ids", "documents", "metadatas" and "distances"
+        (1 - cosine similarity).
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = np.ascontiguousarray(normalize(query_embeddings).T)  # (dim, n_queries)
+        while True:
+            with self._lock:
+                generation = self._generation
+                matrix, scales = self._view()
+                candidates = self._select(where)
+                alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+            # Search without the lock, so adds and other queries proceed
+            best_rows, best_scores = self._search(queries, matrix, scales, candidates, alive, n_results)
+            with self._lock:
+                if generation == self._generation:
+                    return self._results(best_rows, best_scores, include)
+
+    def _search(self, queries, matrix, scales, candidates, alive, n_results):
+        n_queries = queries.shape[1]
+        best_rows = np.empty((0, n_queries), dtype=np.int64)
+        best_scores = np.empty((0, n_queries), dtype=np.float32)
+        if matrix is not None:
+            scratch = self._scratch(min(SEARCH_BLOCK, len(matrix)))
+            # Scaling the queries instead of the scores keeps the products of
+            # _widen_half's tiny values out of the slow subnormal range
+            half_queries = queries * HALF_SCALE
+            for rows, block, block_scales in self._blocks(matrix, scales, candidates):
+                # Widen the rows into a reused buffer: allocating (and page
+                # faulting) a fresh float32 copy of every block costs more
+                # than the product itself
+                widened = scratch[: len(rows)]
+                if block.dtype == np.float16:
+                    _widen_half(block, widened)
+                    scores = widened @ half_queries
+                else:
+                    np.copyto(widened, block, casting="unsafe")
+                    scores = widened @ queries
+                if block_scales is not None:
+                    scores *= np.asarray(block_scales)[:, None]
+                scores[~alive[rows]] = -np.inf
+                k = min(n_results, len(rows))
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                best_rows = np.concatenate([best_rows, rows[top]])
+                best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, 0)])
+                if len(best_rows) > n_results:
+                    keep = np.argpartition(-best_scores, n_results - 1, axis=0)[:n_results]
+                    best_rows = np.take_along_axis(best_rows, keep, 0)
+                    best_scores = np.take_along_axis(best_scores, keep, 0)
+        return best_rows, best_scores
+
+    def _scratch(self, rows):
+        """
+        This thread's float32 (rows, dim) buffer, reused across queries.
+        """
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None or scratch.shape[0] < rows or scratch.shape[1] != self.dim:
+            scratch = self._local.scratch = np.empty((rows, self.dim), dtype=np.float32)
+        return scratch
+
+    def _results(self, best_rows, best_scores, include):
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        order = np.argsort(-best_scores, axis=0)
+        for column in range(best_scores.shape[1]):
+            hits = [
+                (int(best_rows[i, column]), float(best_scores[i, column]))
+                for i in order[:, column]
+                if np.isfinite(best_scores[i, column])
+            ]
+            records = self._read_records([row for row, _ in hits]) if hits else []
+            results["ids"].append([self._ids[row] for row, _ in hits])
+            results["documents"].append([r["document"] for r in records])
+            results["metadatas"].append([r.get("metadata") for r in records])
+            results["distances"].append([1.0 - score for _, score in hits])
+        for field in ("documents", "metadatas", "distances"):
+            if field not in include:
+                results[field] = None
+        return results
+
+    @staticmethod
+    def _blocks(matrix, scales, candidates):
+        """
+        Yields (row numbers, rows, scales) in blocks of SEARCH_BLOCK; slices
+        of the memory map when unfiltered, gathered rows otherwise.
+        """
+        if candidates is None:
+            for start in range(0, len(matrix), SEARCH_BLOCK):
+                end = min(start + SEARCH_BLOCK, len(matrix))
+                yield (
+                    np.arange(start, end),
+                    matrix[start:end],
+                    scales[start:end] if scales is not None else None,
+                )
+            return
+        for start in range(0, len(candidates), SEARCH_BLOCK):
+            rows = candidates[start: start + SEARCH_BLOCK]
+            yield rows, matrix[rows], scales[rows] if scales is not None else None
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+            else:
+                selected = self._select(where)
+                rows = list(selected) if selected is not None else sorted(self._rows.values())
+            if where and ids is not None:
+                allowed = set(self._select(where).tolist())
+                rows = [row for row in rows if row in allowed]
+            records = self._read_records(rows)
+            found = [self._ids[row] for row in rows]
+        return {
+            "ids": found,
+            "documents": [r["document"] for r in records] if "documents" in include else None,
+            "metadatas": [r.get("metadata") for r in records] if "metadatas" in include else None,
+        }
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            doomed = set(ids or ())
+            if where:
+                doomed.update(self._ids[row] for row in self._select(where))
+            doomed = [doc_id for doc_id in doomed if doc_id in self._rows]
+            if not doomed:
+                return
+            self._write_log([{"op": "delete", "ids": doomed}])
+            for doc_id in doomed:
+                self._kill(doc_id)
+            if self._deleted > COMPACT_RATIO * len(self._ids):
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrites the files without deleted rows.
+
+        The compacted rows go to files of the next epoch and the new log,
+        whose header names that epoch, replaces the old one in a single
+        os.replace. A crash before that leaves the old epoch in use, one
+        after it the new one; _load deletes the other epoch's files.
+        """
+        with self._lock:
+            matrix, scales = self._view()
+            if matrix is None:
+                return
+            live = [row for row in range(len(self._ids)) if self._alive[row]]
+            records = self._read_records(live)
+            epoch = self._epoch + 1
+            vectors_path, scales_path = self._epoch_paths(epoch)
+            tmp_log_path = self._log_path + ".tmp"
+            with open(vectors_path, "wb") as file:
+                for start in range(0, len(live), SEARCH_BLOCK):
+                    file.write(np.asarray(matrix[live[start: start + SEARCH_BLOCK]]).tobytes())
+                os.fsync(file.fileno())
+            if scales is not None:
+                with open(scales_path, "wb") as file:
+                    file.write(np.asarray(scales[live]).tobytes())
+                    os.fsync(file.fileno())
+            with open(tmp_log_path, "wb") as file:
+                header = {"op": "init", "dim": self.dim, "dtype": self.dtype, "epoch": epoch}
+                file.write(json.dumps(header).encode("utf-8") + b"\n")
+                for record in records:
+                    file.write(json.dumps(record).encode("utf-8") + b"\n")
+                os.fsync(file.fileno())
+
+            # Drop the maps before the files underneath them go away
+            self._matrix = self._scales = None
+            del matrix, scales
+            os.replace(tmp_log_path, self._log_path)  # the switch to the new epoch
+            self._load()
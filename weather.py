@@ -0,0 +1,167 @@
+"""
+OpenWeatherMap client with connection pooling, retries and a TTL cache.
+
+One WeatherClient is shared per process: its requests.Session keeps
+connections alive, transient failures are retried with exponential backoff,
+and results are cached per normalized city so Streamlit reruns do not hit
+the API again. The cache is an LRU of at most max_entries cities that drops
+expired entries when they are looked up. base_url can point at a local
+stand-in server for tests.
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+
+WEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5/"
+CACHE_TTL = 600  # seconds; OpenWeatherMap refreshes roughly every 10 minutes
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+MAX_WORKERS = 8
+MAX_ENTRIES = 1024  # cached cities
+
+
+class WeatherError(Exception):
+    """
+    Raised when weather data for a location cannot be fetched.
+    """
+
+
+def normalize_city(location):
+    """
+    "Syracuse, NY" -> "syracuse"; the API only takes the city name.
+    """
+    return location.split(",")[0].strip().lower()
+
+
+def kelvin_to_celsius(kelvin):
+    return round(kelvin - 273.15, 2)
+
+
+class WeatherClient:
+    def __init__(
+        self,
+        api_key,
+        base_url=WEATHER_BASE_URL,
+        ttl=CACHE_TTL,
+        timeout=REQUEST_TIMEOUT,
+        retries=3,
+        backoff_factor=0.5,
+        pool_size=MAX_WORKERS,
+        max_entries=MAX_ENTRIES,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/") + "/"
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # city -> (expires_at, weather), least recent first
+        self._lock = threading.Lock()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def current(self, location):
+        """
+        Returns the current weather for location, served from cache if fresh.
+        """
+        city = normalize_city(location)
+        if not city:
+            raise WeatherError("Please enter a city name.")
+
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(city)
+            if entry and entry[0] > now:
+                self._cache.move_to_end(city)
+                tracing.count("weather_cache.hit")
+                return entry[1]
+            self._cache.pop(city, None)
+
+        tracing.count("weather_cache.miss")
+        with tracing.span("weather.fetch"):
+            weather = self._fetch(city)
+        with self._lock:
+            self._cache[city] = (time.time() + self.ttl, weather)
+            self._cache.move_to_end(city)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return weather
+
+    def current_many(self, locations, max_workers=MAX_WORKERS):
+        """
+        Fetches several locations concurrently.
+
+        Returns {location: weather dict or WeatherError}, in input order.
+        """
+        def fetch(location):
+            try:
+                return self.current(location)
+            except WeatherError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, fetch, location)
+                for location in locations
+            ]
+            return {location: f.result() for location, f in zip(locations, futures)}
+
+    def _fetch(self, city):
+        try:
+            response = self.session.get(
+                self.base_url + "weather",
+                params={"q": city, "appid": self.api_key},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise WeatherError(f"Weather service unavailable: {e}") from e
+
+        if response.status_code == 404:
+            raise WeatherError(f"City '{city}' not found.")
+        if not response.ok:
+            raise WeatherError(f"Weather service returned HTTP {response.status_code}.")
+
+        try:
+            data = response.json()
+            main = data["main"]
+            return {
+                "location": city.title(),
+                "temperature": kelvin_to_celsius(main["temp"]),
+                "temp_min": kelvin_to_celsius(main["temp_min"]),
+                "temp_max": kelvin_to_celsius(main["temp_max"]),
+                "weather_description": data["weather"][0]["description"],
+                "feels_like": kelvin_to_celsius(main["feels_like"]),
+                "humidity": round(main["humidity"], 2),
+            }
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            # Not JSON, or JSON without the fields of a weather report
+            raise WeatherError("Weather service returned an unexpected response.") from e
+
+
+def weather_bucket(weather_data, step=2):
+    """
+    Rounds conditions to step-degree buckets so similar weather shares one
+    clothing suggestion. Returns (temperature, feels_like, description).
+    """
+    return (
+        int(round(weather_data["temperature"] / step) * step),
+        int(round(weather_data["feels_like"] / step) * step),
+        weather_data["weather_description"],
+    )